@@ -3,28 +3,42 @@
 Important classes:
     `XMLState` : which defines the public API which an `Ambient` may use to access the underlying state.
     `_XMLState` : the default (internal) implementation of `XMLState` that is backed by the well-known `lxml` package.
+    `XMLSnapshot` : a read-only view of an `_XMLState` that is pinned to a version, used for consistent reads while the state is modified.
     `XMLAmbient` : the default implementation of an `Ambient` (see `star_ray` package) that makes use of XML as its state description language. It exposes the standard `__update__`, `__select__` API and is read and mutated via `XMLQuery` events (see below).
+    `AsyncXMLAmbient` : an `XMLAmbient` for use with `asyncio`, exposing the awaitable `__aupdate__`, `__aselect__` API.
+    `XMLJournal` : a record of the write queries executed by an `XMLAmbient`, used to audit or replay a run.
+    `XMLProfiler` : records the time taken by each query (xpath evaluation, serialization, etc.) and sends it to sinks such as `HistogramSink`, used to find slow queries.
+    `XMLCodec` : a compact binary encoding of queries and their observations for sending them between processes (requires `msgpack`).
 
 Query classes:
     Select : Read-only query that selects (retrieves) elements and their attributes from the XML state.
+    SelectStream : Read-only query that selects elements and their attributes lazily, for very large results.
+    SelectChanges : Read-only query that selects the changes made to the XML state since a given version.
     Update : Write query that will update element attributes.
     Replace : Write query that will replace entire elements.
     Delete : Write query that will delete elements or their attributes.
     Insert : Write query that will insert new elements.
+    InsertMany : Write query that will insert many new elements at once, optionally into many parents.
     XMLQuery : The base class for all queries, defines the `__execute__` method which is the method that effectively defines how the query mutates (or reads) the state. It provides direct access to the `XMLState` API and may be subclassed to provide more user-friendly queries, especially where the operation may require access to various XML attributes which might otherwise require additional queries (these instead can be read or written to directly).
 
-See the documentation in each class for details on their use. These queries can also be constructed using the following factory methods: [`select`, `update`, `replace`, `delete`, `insert`] which provide some conveniences.
+See the documentation in each class for details on their use. These queries can also be constructed using the following factory methods: [`select`, `select_stream`, `update`, `replace`, `delete`, `insert`, `insert_many`] which provide some conveniences.
 """
 
 from .query import (
     select,
     insert,
+    insert_many,
     delete,
     replace,
     update,
+    select_changes,
+    select_stream,
     Expr,
     Select,
+    SelectStream,
+    SelectChanges,
     Insert,
+    InsertMany,
     Delete,
     Replace,
     Update,
@@ -33,31 +47,59 @@ from .query import (
     XPathQuery,
     XMLQueryError,
     XPathElementsNotFound,
+    XPathCostExceeded,
 )
-from .state import XMLState, _XMLState
-from .ambient import XMLAmbient
+from .state import XMLState, _XMLState, XMLSnapshot
+from ._changes import XMLChange
+from .ambient import XMLAmbient, AsyncXMLAmbient
 from .sensor import XMLSensor
+from .codec import XMLCodec
+from .journal import XMLJournal
+from .profiler import (
+    XMLProfiler,
+    QueryProfile,
+    ProfileSink,
+    HistogramSink,
+    CallbackSink,
+)
 
 __all__ = (
     "XMLAmbient",
+    "AsyncXMLAmbient",
     "XMLState",
     "_XMLState",
     "XMLSensor",
+    "XMLCodec",
+    "XMLJournal",
+    "XMLProfiler",
+    "QueryProfile",
+    "ProfileSink",
+    "HistogramSink",
+    "CallbackSink",
     "select",
     "insert",
+    "insert_many",
     "delete",
     "replace",
     "update",
+    "select_changes",
+    "select_stream",
     "Select",
+    "SelectStream",
+    "SelectChanges",
     "Insert",
+    "InsertMany",
     "Delete",
     "Replace",
     "Update",
     "Expr",
     "Expr",
+    "XMLChange",
+    "XMLSnapshot",
     "XMLQuery",
     "XMLUpdateQuery",  # TODO others coming
     "XPathQuery",
     "XMLQueryError",
     "XPathElementsNotFound",
+    "XPathCostExceeded",
 )
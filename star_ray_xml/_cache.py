@@ -0,0 +1,200 @@
+"""Bounded (LRU) caches used internally by `_XMLState`, these are not part of the public API."""
+
+import re
+import ast
+import math
+from threading import Lock
+from collections import OrderedDict
+from typing import Any
+from collections.abc import Callable, Hashable
+from lxml import etree as ET
+
+__all__ = ("_LRUCache", "_XPathCache", "_LiteralCache", "_literal_eval")
+
+# e.g. 007 is not a valid python literal
+_LEADING_ZERO = re.compile(r"^\s*[+-]?0\d")
+# types of value that can be shared between reads, containers are mutable and are parsed every time
+_IMMUTABLE_TYPES = (str, int, float, complex, bool, bytes, type(None))
+_MUTABLE = object()
+
+
+class _LRUCache:
+    """A bounded mapping that evicts the least recently used entry when it is full. It keeps count of hits, misses and evictions which can be used to decide on an appropriate size for the cache. It is safe to use from multiple threads."""
+
+    def __init__(self, maxsize: int = 1024):
+        """Constructor.
+
+        Args:
+            maxsize (int, optional): maximum number of entries to keep, a value of 0 disables caching (all lookups will miss). Defaults to 1024.
+
+        Raises:
+            ValueError: if `maxsize` is negative.
+        """
+        super().__init__()
+        if maxsize < 0:
+            raise ValueError(f"`maxsize` must be non-negative, received: {maxsize}")
+        self._maxsize = maxsize
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, factory: Callable[..., Any], *args: Any) -> Any:
+        """Get the value associated with `key`, creating it with `factory(*args)` if it is not present.
+
+        Args:
+            key (Hashable): key of the entry.
+            factory (Callable[..., Any]): used to create the value on a miss, exceptions raised by `factory` are propagated and nothing is cached.
+            args (Any): arguments to `factory`.
+
+        Returns:
+            Any: the (possibly newly created) value.
+        """
+        data = self._data
+        with self._lock:
+            try:
+                value = data[key]
+            except KeyError:
+                self.misses += 1
+                value = factory(*args)
+                if self._maxsize > 0:
+                    data[key] = value
+                    if len(data) > self._maxsize:
+                        data.popitem(last=False)
+                        self.evictions += 1
+                return value
+            data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    @property
+    def maxsize(self) -> int:
+        """Maximum number of entries in this cache."""
+        return self._maxsize
+
+    def clear(self) -> None:
+        """Remove all entries from the cache, this does not reset the counters."""
+        with self._lock:
+            self._data.clear()
+
+    def info(self) -> dict[str, int]:
+        """Information about the cache usage.
+
+        Returns:
+            dict[str, int]: containing `hits`, `misses`, `evictions`, `size` and `maxsize`.
+        """
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            size=len(self._data),
+            maxsize=self._maxsize,
+        )
+
+    def __len__(self):  # noqa: D105
+        return len(self._data)
+
+    def __contains__(self, key: Hashable):  # noqa: D105
+        return key in self._data
+
+
+class _XPathCache(_LRUCache):
+    """Cache of compiled `lxml` xpath expressions keyed by (expression, namespace map)."""
+
+    def compile(self, xpath: str, namespaces: dict[str, str]) -> ET.XPath:
+        """Get the compiled form of `xpath`, compiling it if it has not been seen recently.
+
+        Args:
+            xpath (str): xpath expression.
+            namespaces (dict[str, str]): namespaces (prefix -> URI) used in the expression.
+
+        Returns:
+            ET.XPath: the compiled expression, it may be called with an `lxml` element to evaluate it.
+        """
+        return self.get((xpath, tuple(namespaces.items())), _compile, xpath, namespaces)
+
+
+def _compile(xpath: str, namespaces: dict[str, str]) -> ET.XPath:
+    return ET.XPath(xpath, namespaces=namespaces)
+
+
+class _LiteralCache(_LRUCache):
+    """Cache of decoded attribute values keyed by the raw attribute string, see `decode`."""
+
+    def decode(self, raw: str) -> Any:
+        """Decode a raw attribute value to a python literal, giving the same result as `ast.literal_eval` (or `raw` itself if it is not a valid literal).
+
+        Plain ints, floats and bools are decoded directly without the cache. Other values are parsed once and cached, with the exception of containers (e.g. list or dict) which are mutable and so are parsed on every read.
+
+        Args:
+            raw (str): the raw attribute value.
+
+        Returns:
+            Any: the decoded value.
+        """
+        value = _decode_number(raw)
+        if value is not None:
+            return value
+        if type(raw) is not str:
+            # e.g. `lxml` string results hold a reference to their element
+            raw = str(raw)
+        value = self.get(raw, _parse_immutable_literal, raw)
+        if value is _MUTABLE:
+            return _parse_literal(raw)
+        return value
+
+
+# shared by all `_XMLState`, see `_literal_eval`
+_LITERAL_CACHE = _LiteralCache(maxsize=4096)
+
+
+def _literal_eval(raw: str) -> Any:
+    """Decode a raw attribute value to a python literal using the shared `_LiteralCache`.
+
+    Args:
+        raw (str): the raw attribute value.
+
+    Returns:
+        Any: the decoded value, or `raw` if it is not a valid literal.
+    """
+    return _LITERAL_CACHE.decode(raw)
+
+
+def _decode_number(raw: str | None) -> int | float | bool | None:
+    """Decode an attribute value that is a plain int, float or bool.
+
+    Args:
+        raw (str | None): the raw attribute value.
+
+    Returns:
+        int | float | bool | None: the value, or None if it is not a plain number (or bool).
+    """
+    if raw is None or not raw.isascii() or _LEADING_ZERO.match(raw):
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        pass
+    try:
+        value = float(raw)
+    except ValueError:
+        if raw == "True":
+            return True
+        elif raw == "False":
+            return False
+        return None
+    # e.g. "nan" or "inf" are not python literals
+    return value if math.isfinite(value) else None
+
+
+def _parse_literal(raw: str) -> Any:
+    try:
+        return ast.literal_eval(raw)
+    except (SyntaxError, ValueError):
+        return raw
+
+
+def _parse_immutable_literal(raw: str) -> Any:
+    value = _parse_literal(raw)
+    return value if isinstance(value, _IMMUTABLE_TYPES) else _MUTABLE
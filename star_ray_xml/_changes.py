@@ -0,0 +1,154 @@
+"""Defines `XMLChange` and the change log that is (optionally) kept by `_XMLState`."""
+
+from threading import Lock
+from itertools import islice
+from collections import deque
+from typing import Any, NamedTuple, TYPE_CHECKING
+
+from .query import XMLQueryError
+
+if TYPE_CHECKING:
+    from ._persist import _ChangeLogFile
+
+__all__ = ("XMLChange", "_ChangeLog")
+
+# kinds of change
+UPDATE = "update"
+INSERT = "insert"
+DELETE = "delete"
+REPLACE = "replace"
+
+
+class XMLChange(NamedTuple):
+    """A single change that was made to an XML state. Changes are recorded in order and applying them in order to a copy of the state (see `_XMLState.apply_changes`) will bring it up to date.
+
+    Attributes:
+        version (int): the version of the state after this change was made, versions increase by 1 with each change.
+        kind (str): the kind of change, one of: "update", "insert", "delete", "replace".
+        path (str): xpath to the changed element as it was BEFORE the change was made, for "insert" this is the parent element. Elements with a unique `id` use the path `//*[@id='...']`.
+        data (dict[str, Any] | None): data associated with the change:
+            - "update": attribute name -> new value (as a string), `None` if the attribute was removed. Special attributes `@text`, `@tail` and `@head` are used for text.
+            - "insert": {"element" : str, "index" : int} the inserted element (or text) and where it was inserted.
+            - "delete": None
+            - "replace": {"element" : str} the replacement element.
+    """
+
+    version: int
+    kind: str
+    path: str
+    data: dict[str, Any] | None = None
+
+
+class _ChangeLog:
+    """A bounded log of `XMLChange`, once full the oldest changes are discarded. Changes may also be written to a file (see `_ChangeLogFile`), in which case none are discarded from the file."""
+
+    def __init__(self, maxsize: int):
+        """Constructor.
+
+        Args:
+            maxsize (int): maximum number of changes to keep.
+        """
+        super().__init__()
+        self._changes: deque[XMLChange] = deque(maxlen=maxsize)
+        self._version = 0
+        self._lock = Lock()
+        self.file: _ChangeLogFile | None = None
+        self._held: list[tuple[str, str, dict[str, Any] | None]] | None = None
+
+    @property
+    def version(self) -> int:
+        """The version of the most recent change (0 if there have been no changes)."""
+        return self._version
+
+    @property
+    def maxsize(self) -> int:
+        """The maximum number of changes to keep."""
+        return self._changes.maxlen
+
+    def reset(self, version: int):
+        """Remove all changes and set the current version, e.g. after the state was loaded from a file.
+
+        Args:
+            version (int): the version.
+        """
+        with self._lock:
+            self._changes.clear()
+            self._version = version
+
+    def record(self, kind: str, path: str, data: dict[str, Any] | None = None):
+        """Record a change. If changes are being held (see `hold`) the change is recorded once they are released.
+
+        Args:
+            kind (str): the kind of change.
+            path (str): path to the changed element.
+            data (dict[str, Any] | None, optional): data associated with the change. Defaults to None.
+        """
+        with self._lock:
+            if self._held is not None:
+                self._held.append((kind, path, data))
+            else:
+                self._record(kind, path, data)
+
+    def _record(self, kind: str, path: str, data: dict[str, Any] | None):
+        self._version += 1
+        change = XMLChange(self._version, kind, path, data)
+        self._changes.append(change)
+        if self.file is not None:
+            self.file.write(change)
+
+    def hold(self) -> None:
+        """Hold changes rather than recording them until they are released (see `release`), e.g. while a transaction is in progress. Held changes do not change the version."""
+        with self._lock:
+            if self._held is None:
+                self._held = []
+
+    @property
+    def held(self) -> int:
+        """Number of changes that are currently held."""
+        return 0 if self._held is None else len(self._held)
+
+    def discard(self, count: int) -> None:
+        """Discard held changes, e.g. when a transaction is rolled back.
+
+        Args:
+            count (int): number of held changes to keep, the most recent changes are discarded.
+        """
+        with self._lock:
+            del self._held[count:]
+
+    def release(self) -> None:
+        """Record all held changes (in order) and stop holding changes."""
+        with self._lock:
+            held, self._held = self._held, None
+            for change in held or ():
+                self._record(*change)
+
+    def since(self, version: int) -> list[XMLChange]:
+        """Get all changes that were made after `version`.
+
+        Args:
+            version (int): the version.
+
+        Raises:
+            XMLQueryError: if some of the changes are no longer available or the version is invalid.
+
+        Returns:
+            list[XMLChange]: the changes (oldest first).
+        """
+        with self._lock:
+            if version < 0 or version > self._version:
+                raise XMLQueryError(
+                    "Invalid version: {version}, the current version is {current}.",
+                    version=version,
+                    current=self._version,
+                )
+            if version == self._version:
+                return []
+            oldest = self._changes[0].version if self._changes else self._version + 1
+            if version < oldest - 1:
+                raise XMLQueryError(
+                    "Changes since version {version} are no longer available, the oldest available change is version {oldest}.",
+                    version=version,
+                    oldest=oldest,
+                )
+            return list(islice(self._changes, version - oldest + 1, None))
@@ -1,15 +1,26 @@
 import re
 import ast
-from typing import Any
+from typing import Any, overload
+from collections.abc import Iterator, Sequence
 from lxml import etree as ET
 from .query import XMLQueryError, Expr
+from ._cache import _literal_eval
 
 XML_START_PATTERN = re.compile(r"^\s*<")
 
+# formats that elements may be serialised to, see `_Element.serialize`
+C14N = "c14n"
+XML = "xml"
+BYTES = "bytes"
+DICT = "dict"
+FORMATS = (C14N, XML, BYTES, DICT)
+
 
 class _Element:
     """Wraps an `lxml` element (which may be full XML elements, their attributes, literals (e.g. text) or other properties) adding some additional functionality for use in implementations of `XMLState`. `XMLState` will handle the creation of instances of `_Element`, it is not part of the public API but is stable and documented regardless."""
 
+    __slots__ = ("_base",)
+
     def __init__(self, base: ET.ElementBase):
         super().__init__()
         self._base = base
@@ -38,13 +49,13 @@ class _Element:
             return None
         return _Element(parent)
 
-    def get_children(self) -> list["_Element"]:
+    def get_children(self) -> "_ElementList":
         """Retrieves all direct children of this element.
 
         Returns:
-            list[_Element]: A list of element wrappers for the children of this element.
+            _ElementList: A sequence of element wrappers for the children of this element.
         """
-        return [_Element(child) for child in self._base.getchildren()]
+        return _ElementList(self._base.getchildren())
 
     def get_attributes(self) -> dict[str, str]:
         """Retrieves all attributes of this element as a dictionary. This does not include special attributes (those prefixed with `@`) such as `@text`, `@tag`, etc.
@@ -55,20 +66,25 @@ class _Element:
         # TODO what about special attributes like @text, @tail or @prefix ?
         return dict(**self._base.attrib)
 
-    def xpath(self, xpath: str, namespaces: dict[str, str]) -> list["_Element"]:
+    def xpath(
+        self, xpath: str | ET.XPath, namespaces: dict[str, str] | None = None
+    ) -> "_ElementList":
         """Evaluates an XPath expression from this element.
 
         Args:
-            xpath (str): The XPath query string (see https://www.w3schools.com/xml/xpath_intro.asp for details on xpath queries)
-            namespaces (dict[str, str]): A dictionary of namespace prefixes to XML URIs.
+            xpath (str | ET.XPath): The XPath query string (see https://www.w3schools.com/xml/xpath_intro.asp for details on xpath queries), or an already compiled expression (in which case `namespaces` are ignored as they are part of the compiled expression).
+            namespaces (dict[str, str], optional): A dictionary of namespace prefixes to XML URIs.
 
         Returns:
-            list[_Element]: A list of elements matching the XPath query (empty if there was no match).
+            _ElementList: A sequence of elements matching the XPath query (empty if there was no match).
         """
-        elements = self._base.xpath(xpath, namespaces=namespaces)
+        if isinstance(xpath, ET.XPath):
+            elements = xpath(self._base)
+        else:
+            elements = self._base.xpath(xpath, namespaces=namespaces)
         if not isinstance(elements, list):
             elements = [elements]
-        return [_Element(element) for element in elements]
+        return _ElementList(elements)
 
     def index(self, element: "_Element") -> int:
         """Returns the index of the specified child element relative to this element.
@@ -280,6 +296,8 @@ class _Element:
         return self._base.__hash__()
 
     def __eq__(self, other):
+        if isinstance(other, _Element):
+            other = other._base
         return self._base.__eq__(other)
 
     def __str__(self):
@@ -378,6 +396,55 @@ class _Element:
             method="c14n",
         ).decode("UTF-8")
 
+    def serialize(
+        self, format: str = C14N, depth: int | None = None
+    ) -> str | bytes | dict[str, Any]:
+        """Converts the element to a string, bytes or structured representation.
+
+        Args:
+            format (str, optional): one of "c14n" (canonical `str`, see `as_string`), "xml" (`str` as written by `lxml`), "bytes" (as "xml" but UTF-8 encoded) or "dict" (see `as_dict`). Defaults to "c14n".
+            depth (int | None, optional): maximum depth of children to include, this is only used by the "dict" format. Defaults to None (no limit).
+
+        Raises:
+            ValueError: if the format is unknown.
+
+        Returns:
+            str | bytes | dict[str, Any]: the representation of the element.
+        """
+        if format == C14N:
+            return self.as_string()
+        elif format == XML:
+            return ET.tostring(self._base, encoding=str, with_tail=False)
+        elif format == BYTES:
+            return ET.tostring(self._base, encoding="UTF-8", with_tail=False)
+        elif format == DICT:
+            return self.as_dict(depth=depth)
+        raise ValueError(f"Unknown format: `{format}`, must be one of: {FORMATS}")
+
+    def as_dict(self, depth: int | None = None) -> dict[str, Any]:
+        """Converts the element to a structured representation, this avoids the need to parse the element after it has been selected.
+
+        The element is represented as a dict containing:
+        - "tag" : the tag of the element (excluding its namespace).
+        - "prefix" : the namespace prefix of the element, or None if it has no prefix.
+        - "attributes" : the attributes of the element, values are evaluated to python literals where possible (see `literal_eval`). Namespaced attributes are given with their prefix, e.g. `xlink:href`.
+        - "text" : the text inside the element (before its first child), or None.
+        - "tail" : the text after the element, or None.
+        - "children" : the representation of each child element, or None if the children were not included because of `depth`.
+
+        Args:
+            depth (int | None, optional): maximum depth of children to include, e.g. 0 will include no children and 1 will include only direct children. Defaults to None (no limit).
+
+        Raises:
+            ValueError: if `depth` is negative.
+
+        Returns:
+            dict[str, Any]: the representation of the element.
+        """
+        if depth is not None and depth < 0:
+            raise ValueError(f"`depth` must be non-negative, received: {depth}")
+        return _element_to_dict(self._base, depth)
+
     def as_literal(self):
         """Converts this element to a Python literal (only valid for unicode elements or attributes).
 
@@ -409,7 +476,7 @@ class _Element:
     def literal_eval(
         value: str,
     ) -> str | int | float | bool | list | tuple | dict | None:
-        """Safely evaluates a string to a Python literal (str, int, float, bool, list, tuple, dict) if possible.
+        """Safely evaluates a string to a Python literal (str, int, float, bool, list, tuple, dict) if possible. Decoded values are cached by their string (see `_LiteralCache`), plain ints, floats and bools are decoded without parsing.
 
         Args:
             value (str): The string to evaluate.
@@ -419,7 +486,106 @@ class _Element:
         """
         if value is None:
             return None
+        if isinstance(value, str):
+            return _literal_eval(value)
         try:
             return ast.literal_eval(value)
         except (SyntaxError, ValueError):
             return str(value)
+
+
+def _element_to_dict(element: ET._Element, depth: int | None) -> dict[str, Any]:
+    # see `_Element.as_dict`
+    children = None
+    if depth is None or depth > 0:
+        depth = None if depth is None else depth - 1
+        children = [
+            _element_to_dict(child, depth)
+            for child in element
+            if isinstance(child.tag, str)  # e.g. not a processing instruction
+        ]
+    return dict(
+        tag=ET.QName(element).localname,
+        prefix=element.prefix,
+        attributes={
+            _attribute_name(element, key): _Element.literal_eval(value)
+            for key, value in element.attrib.items()
+        },
+        text=element.text,
+        tail=element.tail,
+        children=children,
+    )
+
+
+def _attribute_name(element: ET._Element, key: str) -> str:
+    # `{uri}name` -> `prefix:name`
+    if key[0] != "{":
+        return key
+    uri, name = key[1:].split("}", 1)
+    for prefix, _uri in element.nsmap.items():
+        if _uri == uri and prefix is not None:
+            return f"{prefix}:{name}"
+    return key
+
+
+class _ElementList(Sequence):
+    """A read-only sequence of `_Element` that holds the underlying `lxml` results and only wraps them when they are accessed. This avoids creating (and keeping alive) a wrapper for every result of a large query. Like `_Element`, it is not part of the public API.
+
+    It compares equal to any other sequence with equal items, e.g. `state.xpath("//@x") == ["1", "2"]`.
+    """
+
+    __slots__ = ("_bases",)
+
+    def __init__(self, bases: list[Any]):
+        """Constructor.
+
+        Args:
+            bases (list[Any]): the underlying `lxml` results (elements, strings, etc.).
+        """
+        super().__init__()
+        self._bases = bases
+
+    @overload
+    def __getitem__(self, index: int) -> _Element: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "_ElementList": ...
+
+    def __getitem__(self, index):  # noqa: D105
+        if isinstance(index, slice):
+            return _ElementList(self._bases[index])
+        return _Element(self._bases[index])
+
+    def __len__(self):  # noqa: D105
+        return len(self._bases)
+
+    def __iter__(self) -> Iterator[_Element]:  # noqa: D105
+        return map(_Element, self._bases)
+
+    def __reversed__(self) -> Iterator[_Element]:  # noqa: D105
+        return map(_Element, reversed(self._bases))
+
+    def __contains__(self, value: Any):  # noqa: D105
+        if isinstance(value, _Element):
+            value = value._base
+        return value in self._bases
+
+    def __eq__(self, other: Any):  # noqa: D105
+        if isinstance(other, _ElementList):
+            return self._bases == other._bases
+        if not isinstance(other, Sequence) or isinstance(other, str | bytes):
+            return NotImplemented
+        return len(self) == len(other) and all(x == y for x, y in zip(self, other))
+
+    __hash__ = None
+
+    def __repr__(self):  # noqa: D105
+        return f"{self.__class__.__name__}({self._bases!r})"
+
+    def get_bases(self) -> list[Any]:
+        """Get the underlying `lxml` results without wrapping them.
+
+        Returns:
+            list[Any]: the results.
+        """
+        return self._bases
@@ -0,0 +1,289 @@
+"""Compiled form of `Expr` that is used to evaluate expressions efficiently, this is not part of the public API.
+
+An expression (e.g. `"{x} + 1"`) is parsed once into a tree of closures in which each `{attribute}` is a variable. If `numpy` is installed, expressions that only use arithmetic can also be evaluated for many elements at once, the values of each attribute are gathered into arrays and evaluated in a single vectorized pass.
+"""
+
+import ast
+import operator
+from functools import reduce
+from string import Formatter
+from typing import Any
+from collections.abc import Callable
+from lxml import etree as ET
+from star_ray.utils.literal_eval import literal_eval_with_ops
+
+# numpy is optional, expressions are evaluated per element without it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from ._cache import _LRUCache, _decode_number
+
+__all__ = ("_CompiledExpr", "_compile_expr")
+
+# vectorized evaluation only pays off for larger numbers of elements
+VECTORIZE_MIN_ELEMENTS = 32
+# integers are evaluated as int64 when vectorized, larger values are evaluated per element
+_VECTORIZE_MAX_INT = 2**31
+
+_BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Mod: operator.mod,
+    ast.FloorDiv: operator.floordiv,
+}
+_UNARY_OPERATORS = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+
+_Fun = Callable[[list[Any]], Any]
+
+
+class _NotCompilable(Exception):
+    """The expression (or node) cannot be compiled."""
+
+
+class _CompiledExpr:
+    """An expression that has been parsed once and can be evaluated many times.
+
+    Attribute values are substituted as python values rather than as text. This gives the same result as `literal_eval_with_ops` for plain numbers, any other value is substituted as text in the usual way (see `Expr.eval`) to preserve the original behaviour.
+    """
+
+    def __init__(self, expr: str):
+        """Constructor.
+
+        Args:
+            expr (str): the expression.
+        """
+        super().__init__()
+        self.expr = expr
+        self.names: tuple[str, ...] = ()
+        self._fun: _Fun | None = None
+        self._vfun: _Fun | None = None
+        try:
+            source, names, count = _parse_template(expr)
+            node = ast.parse(source.lstrip(" \t"), mode="eval").body
+            variables = {_variable(i): i for i in range(len(names))}
+            if count != sum(
+                isinstance(n, ast.Name) and n.id in variables for n in ast.walk(node)
+            ):
+                # an attribute was used as something other than a value, e.g. in a string "'{x}'"
+                raise _NotCompilable(expr)
+            self.names = names
+            self._fun = _compile(node, variables, False)
+        except (_NotCompilable, SyntaxError, ValueError):
+            return  # always use `literal_eval_with_ops`
+        if np is None:
+            return
+        try:
+            self._vfun = _compile(node, variables, True)
+        except _NotCompilable:
+            pass
+
+    @property
+    def is_compiled(self) -> bool:
+        """Whether the expression was compiled, if not it will be evaluated with `literal_eval_with_ops`."""
+        return self._fun is not None
+
+    @property
+    def is_vectorized(self) -> bool:
+        """Whether the expression can be evaluated for many elements at once (see `eval_many`)."""
+        return self._vfun is not None
+
+    def eval(self, element: ET._Element) -> Any:
+        """Evaluate the expression given the element as context.
+
+        Args:
+            element (ET._Element): element to use as context.
+
+        Returns:
+            Any: the result of the evaluation.
+        """
+        if self._fun is not None:
+            values = [_decode_number(element.get(name)) for name in self.names]
+            if None not in values:
+                return self._fun(values)
+        return literal_eval_with_ops(self.expr.format_map(element.attrib))
+
+    def eval_many(self, elements: list[ET._Element]) -> list[Any] | None:
+        """Evaluate the expression for each element in a single vectorized pass.
+
+        Args:
+            elements (list[ET._Element]): elements to use as context.
+
+        Returns:
+            list[Any] | None: the result for each element, or None if the expression could not be vectorized for these elements (e.g. an attribute is missing or is not a number, or an error occurred during evaluation). The expression should then be evaluated for each element with `eval`, which will give the same result (or error).
+        """
+        if self._vfun is None:
+            return None
+        columns = []
+        for name in self.names:
+            values = [_decode_number(element.get(name)) for element in elements]
+            column = _column(values)
+            if column is None:
+                return None
+            columns.append(column)
+        try:
+            with np.errstate(all="raise"):
+                result = self._vfun(columns)
+                if isinstance(result, np.ndarray) and result.dtype.kind == "i":
+                    # int64 arithmetic wraps around silently, check against the same evaluation in floating point
+                    check = self._vfun(
+                        [column.astype(np.float64) for column in columns]
+                    )
+                    if not np.allclose(result, check, rtol=1e-9, atol=0.5):
+                        return None
+        except (
+            FloatingPointError,
+            OverflowError,
+            TypeError,
+            ValueError,
+            ZeroDivisionError,
+        ):
+            return None
+        if isinstance(result, np.ndarray):
+            if result.dtype.kind not in "if":
+                return None  # e.g. an object array from a very large constant
+            return result.tolist()
+        return [result] * len(elements)  # the expression does not use any attributes
+
+
+_EXPR_CACHE = _LRUCache(maxsize=1024)
+
+
+def _compile_expr(expr: str) -> _CompiledExpr:
+    """Get the compiled form of `expr`, compiling it if it has not been seen recently.
+
+    Args:
+        expr (str): the expression.
+
+    Returns:
+        _CompiledExpr: the compiled expression.
+    """
+    return _EXPR_CACHE.get(expr, _CompiledExpr, expr)
+
+
+def _variable(i: int) -> str:
+    return f"__v{i}"
+
+
+def _parse_template(expr: str) -> tuple[str, tuple[str, ...], int]:
+    # replaces each {attribute} with a variable name, also gives the number of replacements
+    parts = []
+    names = []
+    count = 0
+    for text, name, spec, conversion in Formatter().parse(expr):
+        parts.append(text)
+        if name is None:
+            continue
+        if spec or conversion or not name.isidentifier():
+            raise _NotCompilable(expr)
+        if name not in names:
+            names.append(name)
+        parts.append(_variable(names.index(name)))
+        count += 1
+    return "".join(parts), tuple(names), count
+
+
+def _column(values: list[int | float | bool | None]) -> Any:
+    # values must all be ints (of a bounded size) or all be floats
+    if not values or None in values:
+        return None
+    types = set(map(type, values))
+    if len(types) != 1:
+        return None
+    if int in types:
+        if max(map(abs, values)) >= _VECTORIZE_MAX_INT:
+            return None
+        return np.array(values, dtype=np.int64)
+    if float in types:
+        return np.array(values, dtype=np.float64)
+    return None  # bools are not vectorized
+
+
+def _compile(node: ast.AST, variables: dict[str, int], vectorized: bool) -> _Fun:
+    # compiles the node to a function of the variable values, the supported nodes mirror those of `literal_eval_with_ops`
+    if isinstance(node, ast.Constant):
+        value = node.value
+        return lambda _: value
+    elif isinstance(node, ast.Name):
+        if node.id not in variables:
+            raise _NotCompilable(node)
+        i = variables[node.id]
+        return lambda values: values[i]
+    elif isinstance(node, ast.BinOp):
+        op = _BINARY_OPERATORS.get(type(node.op), None)
+        if op is None:
+            raise _NotCompilable(node)
+        left = _compile(node.left, variables, vectorized)
+        right = _compile(node.right, variables, vectorized)
+        return lambda values: op(left(values), right(values))
+    elif isinstance(node, ast.UnaryOp):
+        op = _UNARY_OPERATORS.get(type(node.op), None)
+        if op is None:
+            raise _NotCompilable(node)
+        operand = _compile(node.operand, variables, vectorized)
+        return lambda values: op(operand(values))
+    elif isinstance(node, ast.Call):
+        if (
+            not isinstance(node.func, ast.Name)
+            or node.func.id not in ("min", "max", "set")
+            or node.keywords
+        ):
+            raise _NotCompilable(node)
+        args = [_compile(arg, variables, vectorized) for arg in node.args]
+        if vectorized:
+            if node.func.id == "set" or len(args) < 2:
+                raise _NotCompilable(node)
+            fun = np.minimum if node.func.id == "min" else np.maximum
+
+            def _reduce(values):
+                results = [arg(values) for arg in args]
+                if len(set(map(np.result_type, results))) != 1:
+                    # python's min/max preserve the type of the chosen argument
+                    raise TypeError("Arguments must have the same type.")
+                return reduce(fun, results)
+
+            return _reduce
+        fun = dict(min=min, max=max, set=set)[node.func.id]
+        return lambda values: fun(arg(values) for arg in args)
+    elif vectorized:
+        raise _NotCompilable(node)  # only arithmetic is vectorized
+    elif isinstance(node, ast.Tuple):
+        elts = [_compile(elt, variables, vectorized) for elt in node.elts]
+        return lambda values: tuple(elt(values) for elt in elts)
+    elif isinstance(node, ast.List):
+        elts = []
+        for elt in node.elts:
+            if isinstance(elt, ast.Starred):
+                elts.append((True, _compile(elt.value, variables, vectorized)))
+            else:
+                elts.append((False, _compile(elt, variables, vectorized)))
+
+        def _list(values):
+            result = []
+            for starred, elt in elts:
+                if starred:
+                    result.extend(elt(values))
+                else:
+                    result.append(elt(values))
+            return result
+
+        return _list
+    elif isinstance(node, ast.Set):
+        elts = [_compile(elt, variables, vectorized) for elt in node.elts]
+        return lambda values: set(elt(values) for elt in elts)
+    elif isinstance(node, ast.Dict):
+        if None in node.keys:
+            raise _NotCompilable(node)  # e.g. {**x}
+        keys = [_compile(key, variables, vectorized) for key in node.keys]
+        items = [_compile(value, variables, vectorized) for value in node.values]
+        return lambda values: {
+            key(values): item(values) for key, item in zip(keys, items)
+        }
+    elif isinstance(node, ast.Subscript):
+        value = _compile(node.value, variables, vectorized)
+        index = _compile(node.slice, variables, vectorized)
+        return lambda values: value(values)[index(values)]
+    raise _NotCompilable(node)
@@ -0,0 +1,583 @@
+"""Indexes over the elements of an `_XMLState` that allow some common xpath queries to be answered without evaluating them with `lxml`, these are not part of the public API."""
+
+import re
+import bisect
+from threading import Lock
+from collections.abc import Callable, Iterable, Sequence
+from lxml import etree as ET
+
+__all__ = ("_IdIndex", "_SecondaryIndex")
+
+# the kinds of secondary index, see `_SecondaryIndex`
+TAG_INDEX = "tag"
+_INDEX_SPEC_PATTERN = re.compile(r"^@(?P<attribute>[A-Za-z_][\w.-]*)$")
+
+# matches xpaths of the form: //svg:rect, //*[@class], //*[@class='x'] or //svg:rect[@type="x"]
+_INDEX_XPATH_PATTERN = re.compile(
+    r"""^//(?:\*|(?:(?P<prefix>[A-Za-z_][\w.-]*):)?(?P<tag>[A-Za-z_][\w.-]*))"""
+    r"""(?:\[\s*@(?P<attribute>[A-Za-z_][\w.-]*)\s*(?:=\s*(?:'(?P<value1>[^']*)'|"(?P<value2>[^"]*)")\s*)?\])?$"""
+)
+
+# maximum number of elements that are inserted (in document order) into the elements of a key when it is next looked up, if more elements were added out of order the document is scanned instead, see `_OrderedElements`
+MAX_SORTED_INSERTS = 64
+
+# matches xpaths of the form: //*[@id='x'], //svg:rect[@id='x'] or //rect[@id="x"]
+_ID_XPATH_PATTERN = re.compile(
+    r"""^//(?:\*|(?:(?P<prefix>[A-Za-z_][\w.-]*):)?(?P<tag>[A-Za-z_][\w.-]*))"""
+    r"""\[@id=(?:'(?P<id1>[^']*)'|"(?P<id2>[^"]*)")\]$"""
+)
+
+# matches xpaths that start with an id lookup followed by other steps, e.g. //*[@id='x']//svg:rect
+_ID_ANCHOR_PATTERN = re.compile(
+    _ID_XPATH_PATTERN.pattern[:-1] + r"(?P<rest>/.+)$", flags=re.DOTALL
+)
+
+
+def _parse_id_xpath(
+    xpath: str, namespaces: dict[str, str]
+) -> tuple[str, str | None] | None:
+    """Parse an xpath that is a pure id lookup.
+
+    Args:
+        xpath (str): xpath to parse.
+        namespaces (dict[str, str]): namespaces used to resolve a tag prefix.
+
+    Returns:
+        tuple[str, str | None] | None: the `id` and the fully qualified tag (`None` if any tag matches) or `None` if the xpath is not a pure id lookup (or its prefix cannot be resolved).
+    """
+    match = _ID_XPATH_PATTERN.match(xpath)
+    if match is None:
+        return None
+    _id = match.group("id1")
+    if _id is None:
+        _id = match.group("id2")
+    tag = match.group("tag")
+    if tag is None:
+        return _id, None
+    prefix = match.group("prefix")
+    if prefix is None:
+        return _id, tag
+    uri = namespaces.get(prefix, None)
+    if uri is None:
+        return None  # let lxml deal with the unknown prefix
+    return _id, f"{{{uri}}}{tag}"
+
+
+def _parse_id_anchor(
+    xpath: str, namespaces: dict[str, str]
+) -> tuple[str, str | None, str] | None:
+    """Parse an xpath that starts with an id lookup followed by other steps, e.g. `//*[@id='x']//svg:rect`.
+
+    Args:
+        xpath (str): xpath to parse.
+        namespaces (dict[str, str]): namespaces used to resolve a tag prefix.
+
+    Returns:
+        tuple[str, str | None, str] | None: the `id`, the fully qualified tag (`None` if any tag matches) and the rest of the xpath relative to the element with the `id` (e.g. `.//svg:rect`), or `None` if the xpath does not start with an id lookup. The rest of the xpath is not validated.
+    """
+    match = _ID_ANCHOR_PATTERN.match(xpath)
+    if match is None:
+        return None
+    lookup = _parse_id_xpath(xpath[: match.start("rest")], namespaces)
+    if lookup is None:
+        return None
+    return *lookup, "." + match.group("rest")
+
+
+def _parse_index_xpath(
+    xpath: str, namespaces: dict[str, str]
+) -> tuple[str | None, str | None, str | None] | None:
+    """Parse an xpath that may be answered by a secondary index (see `_SecondaryIndex`), e.g. `//svg:rect` or `//*[@class='x']`.
+
+    Args:
+        xpath (str): xpath to parse.
+        namespaces (dict[str, str]): namespaces used to resolve a tag prefix.
+
+    Returns:
+        tuple[str | None, str | None, str | None] | None: the fully qualified tag (`None` if any tag matches), the attribute that elements must have (`None` if there is no such attribute) and the value that it must have (`None` if it can have any value), or `None` if the xpath is not of this form (or its prefix cannot be resolved).
+    """
+    match = _INDEX_XPATH_PATTERN.match(xpath)
+    if match is None:
+        return None
+    tag = match.group("tag")
+    prefix = match.group("prefix")
+    if prefix is not None:
+        uri = namespaces.get(prefix, None)
+        if uri is None:
+            return None  # let lxml deal with the unknown prefix
+        tag = f"{{{uri}}}{tag}"
+    value = match.group("value1")
+    if value is None:
+        value = match.group("value2")
+    return tag, match.group("attribute"), value
+
+
+def _precedes(first: ET._Element, second: ET._Element) -> bool:
+    """Whether an element is before another in document order (an element is before its descendants). The elements are compared via their ancestors and the siblings between them, this takes time proportional to their depth and the number of siblings between them (or between their ancestors that are siblings) rather than the number of siblings before them (as with `parent.index`).
+
+    Args:
+        first (ET._Element): the first element.
+        second (ET._Element): the second element.
+
+    Returns:
+        bool: whether `first` is before `second`, False if they are the same element or are not in the same tree.
+    """
+    if first is second:
+        return False
+    first_ancestors = [first, *first.iterancestors()]
+    second_ancestors = [second, *second.iterancestors()]
+    if first_ancestors[-1] is not second_ancestors[-1]:
+        return False
+    # the elements below the deepest common ancestor are siblings (or one of the elements is the common ancestor)
+    i = -1
+    while (
+        -i <= len(first_ancestors)
+        and -i <= len(second_ancestors)
+        and first_ancestors[i] is second_ancestors[i]
+    ):
+        i -= 1
+    if -i > len(first_ancestors):
+        return True
+    if -i > len(second_ancestors):
+        return False
+    sibling = second_ancestors[i]
+    following = preceding = first_ancestors[i]
+    while following is not None or preceding is not None:
+        if following is not None:
+            following = following.getnext()
+            if following is sibling:
+                return True
+        if preceding is not None:
+            preceding = preceding.getprevious()
+            if preceding is sibling:
+                return False
+    return False
+
+
+def _document_positions() -> Callable[[ET._Element], tuple[int, ...]]:
+    """Get a function that gives the position of an element in its tree, positions are ordered in document order. The children of a parent are numbered when the position of one of them is first needed, the positions of many elements are then found in time proportional to their depth, rather than the number of siblings before them (as with `parent.index`). The function must not be used after the tree is modified.
+
+    Returns:
+        Callable[[ET._Element], tuple[int, ...]]: the function.
+    """
+    numbers: dict[ET._Element, dict[ET._Element, int]] = dict()
+
+    def _document_position(element: ET._Element) -> tuple[int, ...]:
+        position = []
+        child = element
+        for parent in element.iterancestors():
+            children = numbers.get(parent, None)
+            if children is None:
+                children = {c: i for i, c in enumerate(parent)}
+                numbers[parent] = children
+            position.append(children[child])
+            child = parent
+        position.reverse()
+        return tuple(position)
+
+    return _document_position
+
+
+def _is_attached(element: ET._Element, root: ET._Element) -> bool:
+    """Whether an element is in the tree of `root`. An element that is removed from the tree still belongs to the same document (`getroottree` gives the same root) so its ancestors must be checked."""
+    parent = element.getparent()
+    while parent is not None:
+        element = parent
+        parent = element.getparent()
+    return element is root
+
+
+class _IdIndex:
+    """Index of `id` attribute -> element(s). It is kept up to date incrementally by `_XMLState` as elements are inserted, deleted, replaced or have their `id` attribute updated.
+
+    Elements are expected to have unique ids, if an id is shared the index will still track all elements that have it, but lookups will defer to `lxml` (in order to preserve document order).
+    """
+
+    def __init__(self, attribute: str = "id"):
+        """Constructor.
+
+        Args:
+            attribute (str, optional): the attribute to index. Defaults to "id".
+        """
+        super().__init__()
+        self._attribute = attribute
+        self._index: dict[str, list[ET._Element]] = dict()
+
+    @property
+    def attribute(self) -> str:
+        """The attribute that is indexed."""
+        return self._attribute
+
+    def build(self, root: ET._Element) -> None:
+        """(Re)build the index from scratch.
+
+        Args:
+            root (ET._Element): the root of the tree to index.
+        """
+        self._index.clear()
+        self.add_subtree(root)
+
+    def add(self, _id: str | None, element: ET._Element) -> None:
+        """Add a single element to the index.
+
+        Args:
+            _id (str | None): the `id` of the element, nothing is done if this is `None`.
+            element (ET._Element): the element.
+        """
+        if _id is None:
+            return
+        elements = self._index.get(_id, None)
+        if elements is None:
+            self._index[_id] = [element]
+        elif element not in elements:
+            elements.append(element)
+
+    def remove(self, _id: str | None, element: ET._Element) -> None:
+        """Remove a single element from the index.
+
+        Args:
+            _id (str | None): the `id` that the element was indexed with, nothing is done if this is `None`.
+            element (ET._Element): the element.
+        """
+        if _id is None:
+            return
+        elements = self._index.get(_id, None)
+        if elements is None:
+            return
+        elements[:] = [e for e in elements if e is not element]
+        if not elements:
+            self._index.pop(_id, None)
+
+    def add_subtree(self, element: ET._Element) -> None:
+        """Add an element and all of its descendants to the index.
+
+        Args:
+            element (ET._Element): root of the subtree.
+        """
+        attribute = self._attribute
+        for child in element.iter(ET.Element):
+            self.add(child.get(attribute), child)
+
+    def remove_subtree(self, element: ET._Element) -> None:
+        """Remove an element and all of its descendants from the index.
+
+        Args:
+            element (ET._Element): root of the subtree.
+        """
+        attribute = self._attribute
+        for child in element.iter(ET.Element):
+            self.remove(child.get(attribute), child)
+
+    def is_unique(self, _id: str) -> bool:
+        """Whether exactly one element has the given `id`.
+
+        Args:
+            _id (str): the `id`.
+
+        Returns:
+            bool: True if the id is unique, otherwise False.
+        """
+        return len(self._index.get(_id, ())) == 1
+
+    def lookup(
+        self, _id: str, tag: str | None, root: ET._Element
+    ) -> list[ET._Element] | None:
+        """Find the element with the given `id` (and `tag`).
+
+        Args:
+            _id (str): the `id` to find.
+            tag (str | None): the fully qualified tag that the element must have, `None` if it can have any tag.
+            root (ET._Element): the root of the tree, used to check that the indexed element has not been detached from the tree.
+
+        Returns:
+            list[ET._Element] | None: the (possibly empty) list of elements found, or `None` if the index cannot answer the lookup (e.g. the id is not unique or the index is out of date).
+        """
+        elements = self._index.get(_id, None)
+        if elements is None:
+            return []
+        if len(elements) > 1:
+            return None
+        element = elements[0]
+        if element.get(self._attribute) != _id or not _is_attached(element, root):
+            # the tree was modified without going through `_XMLState`
+            self.remove(_id, element)
+            return None
+        if tag is not None and element.tag != tag:
+            return []
+        return elements
+
+    def __len__(self):  # noqa: D105
+        return len(self._index)
+
+    def __contains__(self, _id: str):  # noqa: D105
+        return _id in self._index
+
+
+class _OrderedElements:
+    """Elements that share a key of a `_SecondaryIndex`, kept in document order. Elements that are added out of order (e.g. if they were inserted before the last element) are kept aside and moved into place when the elements are next needed."""
+
+    __slots__ = ("elements", "pending", "tag")
+
+    def __init__(self, tag: str | None = None):
+        """Constructor.
+
+        Args:
+            tag (str | None, optional): the tag of all of the elements, if they are indexed by tag. Defaults to None.
+        """
+        self.tag = tag
+        # dicts are used as ordered sets, elements are removed in constant time
+        self.elements: dict[ET._Element, None] = dict()
+        self.pending: dict[ET._Element, None] = dict()
+
+    def extend(self, elements: list[ET._Element]) -> None:
+        """Add elements, they must be given in document order.
+
+        Args:
+            elements (list[ET._Element]): the elements.
+        """
+        if not self.pending and (
+            not self.elements or _precedes(next(reversed(self.elements)), elements[0])
+        ):
+            self.elements.update(dict.fromkeys(elements))
+        else:
+            self.pending.update(dict.fromkeys(elements))
+
+    def discard(self, element: ET._Element) -> None:
+        """Remove an element, if it is present.
+
+        Args:
+            element (ET._Element): the element.
+        """
+        if element in self.elements:
+            del self.elements[element]
+        else:
+            self.pending.pop(element, None)
+
+    def sort(self, root: ET._Element) -> None:
+        """Move elements that were added out of order into place.
+
+        Args:
+            root (ET._Element): the root of the tree, it is scanned if many elements were added out of order.
+        """
+        if len(self.pending) <= MAX_SORTED_INSERTS:
+            # each parent of the elements is numbered at most once, sorting therefore takes time proportional to the number of children of the parents (at most the size of the document) and to the number of elements added out of order, their depth and the log of the number of elements
+            elements = list(self.elements)
+            key = _document_positions()
+            for element in self.pending:
+                bisect.insort(elements, element, key=key)
+        elif self.tag is not None:
+            elements = list(root.iter(self.tag))
+        else:
+            members = self.elements | self.pending
+            elements = [e for e in root.iter(ET.Element) if e in members]
+        self.elements = dict.fromkeys(elements)
+        self.pending = dict()
+
+    def __len__(self):  # noqa: D105
+        return len(self.elements) + len(self.pending)
+
+
+class _SecondaryIndex:
+    """Indexes of the elements of a document by tag and/or by the values of some attributes, used to answer queries of the form `//svg:rect`, `//*[@class]` or `//*[@class='x']` (optionally with a tag) without evaluating them with `lxml`. It is kept up to date incrementally by `_XMLState` as elements are inserted, deleted, replaced or have an indexed attribute updated.
+
+    The indexes are declared with a list of specifications:
+    - "tag": index elements by their (fully qualified) tag.
+    - "@name": index elements by the value of the attribute `name`, elements that have the attribute are also indexed regardless of its value.
+
+    The elements of each key are kept in document order so that lookups give the same result as `lxml`.
+
+    Lookups may be made concurrently (e.g. by the concurrent reads of `_XMLState.execute_many`), but modifications may not: `_XMLState` never executes write queries concurrently.
+    """
+
+    def __init__(self, specs: Sequence[str]):
+        """Constructor.
+
+        Args:
+            specs (Sequence[str]): specifications of the indexes, see class documentation.
+
+        Raises:
+            ValueError: if a specification is invalid.
+        """
+        super().__init__()
+        self._by_tag: dict[str, _OrderedElements] | None = None
+        # attribute -> value -> elements, and attribute -> elements that have it
+        self._by_value: dict[str, dict[str, _OrderedElements]] = dict()
+        self._by_attribute: dict[str, _OrderedElements] = dict()
+        for spec in specs:
+            if spec == TAG_INDEX:
+                self._by_tag = dict()
+                continue
+            match = _INDEX_SPEC_PATTERN.match(spec)
+            if match is None:
+                raise ValueError(
+                    f"Invalid index: `{spec}`, must be `{TAG_INDEX}` or `@` followed by an attribute name, e.g. `@class`."
+                )
+            self._by_value[match.group("attribute")] = dict()
+            self._by_attribute[match.group("attribute")] = _OrderedElements()
+        self._attributes = tuple(self._by_value)
+        self._lock = Lock()
+
+    @property
+    def attributes(self) -> tuple[str, ...]:
+        """The attributes that are indexed."""
+        return self._attributes
+
+    def build(self, root: ET._Element) -> None:
+        """(Re)build the indexes from scratch.
+
+        Args:
+            root (ET._Element): the root of the tree to index.
+        """
+        if self._by_tag is not None:
+            self._by_tag.clear()
+        for attribute in self._attributes:
+            self._by_value[attribute].clear()
+            self._by_attribute[attribute] = _OrderedElements()
+        self.add_subtree(root)
+
+    def add_subtree(self, element: ET._Element) -> None:
+        """Add an element and all of its descendants to the indexes.
+
+        Args:
+            element (ET._Element): root of the subtree.
+        """
+        groups: dict[_OrderedElements, list[ET._Element]] = dict()
+        for child in element.iter(ET.Element):
+            if self._by_tag is not None:
+                entry = self._by_tag.get(child.tag, None)
+                if entry is None:
+                    entry = _OrderedElements(child.tag)
+                    self._by_tag[child.tag] = entry
+                groups.setdefault(entry, []).append(child)
+            for attribute in self._attributes:
+                value = child.get(attribute)
+                if value is not None:
+                    entry = _SecondaryIndex._entry(self._by_value[attribute], value)
+                    groups.setdefault(entry, []).append(child)
+                    entry = self._by_attribute[attribute]
+                    groups.setdefault(entry, []).append(child)
+        for entry, elements in groups.items():
+            entry.extend(elements)
+
+    def remove_subtree(self, element: ET._Element) -> None:
+        """Remove an element and all of its descendants from the indexes.
+
+        Args:
+            element (ET._Element): root of the subtree.
+        """
+        for child in element.iter(ET.Element):
+            if self._by_tag is not None:
+                _SecondaryIndex._discard(self._by_tag, child.tag, child)
+            for attribute in self._attributes:
+                value = child.get(attribute)
+                if value is not None:
+                    _SecondaryIndex._discard(self._by_value[attribute], value, child)
+                    self._by_attribute[attribute].discard(child)
+
+    def get_values(self, element: ET._Element) -> tuple[str | None, ...]:
+        """Get the values of the indexed attributes of an element, these should be given to `update` after the element is modified.
+
+        Args:
+            element (ET._Element): the element.
+
+        Returns:
+            tuple[str | None, ...]: the values (`None` if the element does not have the attribute).
+        """
+        return tuple(element.get(attribute) for attribute in self._attributes)
+
+    def update(self, element: ET._Element, values: tuple[str | None, ...]) -> None:
+        """Update the indexes after the attributes of an element were modified.
+
+        Args:
+            element (ET._Element): the element.
+            values (tuple[str | None, ...]): the values of the indexed attributes before the element was modified, see `get_values`.
+        """
+        for attribute, old in zip(self._attributes, values):
+            new = element.get(attribute)
+            if new == old:
+                continue
+            if old is not None:
+                _SecondaryIndex._discard(self._by_value[attribute], old, element)
+            if new is not None:
+                entry = _SecondaryIndex._entry(self._by_value[attribute], new)
+                entry.extend([element])
+            if old is None:
+                self._by_attribute[attribute].extend([element])
+            elif new is None:
+                self._by_attribute[attribute].discard(element)
+
+    def is_affected(self, attrs: Iterable[str]) -> bool:
+        """Whether updating some attributes of an element may modify the indexes.
+
+        Args:
+            attrs (Iterable[str]): names of the attributes.
+
+        Returns:
+            bool: True if any of the attributes is indexed, otherwise False.
+        """
+        return any(attr in self._by_value for attr in attrs)
+
+    def lookup(
+        self,
+        tag: str | None,
+        attribute: str | None,
+        value: str | None,
+        root: ET._Element,
+    ) -> list[ET._Element] | None:
+        """Find the elements with the given `tag` and `attribute` (or attribute `value`), in document order.
+
+        Args:
+            tag (str | None): the fully qualified tag that elements must have, `None` if they can have any tag.
+            attribute (str | None): the attribute that elements must have, `None` if there is no such attribute.
+            value (str | None): the value that `attribute` must have, `None` if it can have any value.
+            root (ET._Element): the root of the tree.
+
+        Returns:
+            list[ET._Element] | None: the (possibly empty) list of elements found, or `None` if the indexes cannot answer the lookup.
+        """
+        by_tag = None
+        if tag is not None and self._by_tag is not None:
+            by_tag = self._by_tag.get(tag, None) or _OrderedElements()
+        if attribute is None:
+            return None if by_tag is None else self._members(by_tag, root)
+        by_value = None
+        if attribute in self._by_value:
+            if value is None:
+                by_value = self._by_attribute[attribute]
+            else:
+                by_value = self._by_value[attribute].get(value, None)
+                by_value = by_value or _OrderedElements()
+        if by_tag is not None and (by_value is None or len(by_tag) < len(by_value)):
+            elements = self._members(by_tag, root)
+            if value is None:
+                return [e for e in elements if e.get(attribute) is not None]
+            return [e for e in elements if e.get(attribute) == value]
+        if by_value is None:
+            return None
+        elements = self._members(by_value, root)
+        if tag is None:
+            return elements
+        return [e for e in elements if e.tag == tag]
+
+    def _members(self, entry: _OrderedElements, root: ET._Element) -> list:
+        if entry.pending:
+            with self._lock:
+                if entry.pending:
+                    entry.sort(root)
+        return list(entry.elements)
+
+    @staticmethod
+    def _entry(index: dict[str, _OrderedElements], key: str) -> _OrderedElements:
+        entry = index.get(key, None)
+        if entry is None:
+            entry = _OrderedElements()
+            index[key] = entry
+        return entry
+
+    @staticmethod
+    def _discard(index: dict[str, _OrderedElements], key: str, element: ET._Element):
+        entry = index.get(key, None)
+        if entry is not None:
+            entry.discard(element)
+            if not entry:
+                del index[key]
@@ -0,0 +1,87 @@
+"""Synchronisation primitives used internally, these are not part of the public API."""
+
+import asyncio
+from collections import deque
+
+__all__ = ("_AsyncReadWriteLock",)
+
+
+class _AsyncReadWriteLock:
+    """A readers-writer lock for coroutines (running in a single event loop).
+
+    Any number of readers may hold the lock at once, a writer holds it exclusively. The lock is granted in FIFO order, this means that writes are ordered and that a reader which arrives after a (waiting) writer will wait for the writer to release the lock.
+    """
+
+    def __init__(self):
+        """Constructor."""
+        super().__init__()
+        self._readers = 0
+        self._writer = False
+        self._waiters: deque[tuple[bool, asyncio.Future]] = deque()
+
+    async def acquire(self, write: bool) -> None:
+        """Acquire the lock, waiting until it is available.
+
+        Args:
+            write (bool): whether to acquire the lock for writing (exclusively).
+        """
+        if not self._waiters and self._can_acquire(write):
+            self._acquire(write)
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append((write, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(write)  # the lock was granted before cancellation
+            else:
+                try:
+                    self._waiters.remove((write, waiter))
+                except ValueError:
+                    pass
+                self._wake()
+            raise
+
+    def release(self, write: bool) -> None:
+        """Release the lock.
+
+        Args:
+            write (bool): whether the lock was acquired for writing.
+        """
+        if write:
+            self._writer = False
+        else:
+            self._readers -= 1
+        self._wake()
+
+    @property
+    def readers(self) -> int:
+        """Number of readers currently holding the lock."""
+        return self._readers
+
+    @property
+    def writing(self) -> bool:
+        """Whether a writer currently holds the lock."""
+        return self._writer
+
+    def _can_acquire(self, write: bool) -> bool:
+        return not self._writer and (not write or self._readers == 0)
+
+    def _acquire(self, write: bool) -> None:
+        if write:
+            self._writer = True
+        else:
+            self._readers += 1
+
+    def _wake(self) -> None:
+        while self._waiters:
+            write, waiter = self._waiters[0]
+            if waiter.done():  # cancelled while waiting
+                self._waiters.popleft()
+                continue
+            if not self._can_acquire(write):
+                return
+            self._waiters.popleft()
+            self._acquire(write)
+            waiter.set_result(None)
@@ -0,0 +1,153 @@
+"""Defines the files that are used to persist an `_XMLState` (see `_XMLState.save` and `_XMLState.load`).
+
+A saved state consists of two files:
+- the snapshot (`path`), a single line JSON header containing the version of the state followed by the xml data.
+- the change log (`path` + ".log"), an append-only file containing one JSON array `[version, kind, path, data]` per line for each change (see `XMLChange`) that was made after the snapshot was taken.
+"""
+
+import os
+import json
+import mmap
+from typing import IO
+from collections.abc import Iterator
+from lxml import etree as ET
+
+from ._changes import XMLChange
+
+__all__ = ("_ChangeLogFile", "_write_snapshot", "_read_snapshot", "_read_changes")
+
+LOG_SUFFIX = ".log"
+
+
+def _write_snapshot(path: str, root: ET._Element, version: int) -> None:
+    """Write a snapshot of an xml tree to a file. The file is replaced atomically, an existing snapshot is never left partially written.
+
+    Args:
+        path (str): path of the snapshot file.
+        root (ET._Element): the root of the tree.
+        version (int): the version of the state.
+    """
+    header = json.dumps(dict(version=version)).encode("utf-8")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(header)
+        file.write(b"\n")
+        file.write(ET.tostring(root, encoding="UTF-8", xml_declaration=False))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_snapshot(path: str, parser: ET.XMLParser) -> tuple[ET._Element, int]:
+    """Read a snapshot that was written with `_write_snapshot`. The file is memory-mapped and parsed in place, it is not read into memory first.
+
+    Args:
+        path (str): path of the snapshot file.
+        parser (ET.XMLParser): parser to use for the xml data.
+
+    Raises:
+        ValueError: if the file is not a valid snapshot.
+
+    Returns:
+        tuple[ET._Element, int]: the root of the tree and the version of the state.
+    """
+    with open(path, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            end = data.find(b"\n")
+            try:
+                version = json.loads(data[:end])["version"]
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"Invalid snapshot file: `{path}`") from e
+            view = memoryview(data)
+            try:
+                root = ET.fromstring(view[end + 1 :], parser=parser)
+            finally:
+                view.release()
+    return root, version
+
+
+def _read_changes(path: str, since: int) -> Iterator[XMLChange]:
+    """Read the changes in a change log file that were made after version `since`. An incomplete last line (e.g. if the process was terminated while writing) is ignored.
+
+    Args:
+        path (str): path of the change log file.
+        since (int): the version.
+
+    Raises:
+        ValueError: if the changes after `since` are not all in the file.
+
+    Yields:
+        XMLChange: the changes (oldest first).
+    """
+    if not os.path.exists(path):
+        return
+    expected = since + 1
+    with open(path, "rb") as file:
+        for line in file:
+            if not line.endswith(b"\n"):
+                break  # incomplete write
+            change = XMLChange(*json.loads(line))
+            if change.version <= since:
+                continue  # already in the snapshot
+            if change.version != expected:
+                raise ValueError(
+                    f"Invalid change log file: `{path}`, expected version {expected} but found {change.version}."
+                )
+            expected += 1
+            yield change
+
+
+class _ChangeLogFile:
+    """Append-only file of `XMLChange`, see `_read_changes`."""
+
+    def __init__(self, path: str, truncate: bool = False, sync: bool = False):
+        """Constructor.
+
+        Args:
+            path (str): path of the file.
+            truncate (bool, optional): whether to remove existing changes from the file. Defaults to False.
+            sync (bool, optional): whether to wait for each change to be written to disk (`os.fsync`), otherwise changes are only flushed to the operating system, which is much faster but changes may be lost if the machine (rather than the process) fails. Defaults to False.
+        """
+        super().__init__()
+        self._path = path
+        self._sync = sync
+        self._file: IO[bytes] = open(path, "wb" if truncate else "a+b")
+        if not truncate:
+            _truncate_incomplete(self._file)
+
+    @property
+    def path(self) -> str:
+        """Path of the file."""
+        return self._path
+
+    def write(self, change: XMLChange) -> None:
+        """Append a change to the file.
+
+        Args:
+            change (XMLChange): the change.
+        """
+        self._file.write(json.dumps(change).encode("utf-8") + b"\n")
+        self._file.flush()
+        if self._sync:
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        """Close the file."""
+        self._file.close()
+
+
+def _truncate_incomplete(file: IO[bytes], chunk_size: int = 4096) -> None:
+    # removes an incomplete last line from the file so that new lines are not appended to it
+    end = file.seek(0, os.SEEK_END)
+    position = end
+    while position > 0:
+        start = max(0, position - chunk_size)
+        file.seek(start)
+        i = file.read(position - start).rfind(b"\n")
+        if i >= 0:
+            position = start + i + 1
+            break
+        position = start
+    if position != end:
+        file.truncate(position)
+    file.seek(0, os.SEEK_END)
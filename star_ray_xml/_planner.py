@@ -0,0 +1,551 @@
+"""Static analysis of xpath expressions used by `_XMLState` to estimate their cost from statistics of the document (see `_XPathPlanner`), these are not part of the public API."""
+
+import re
+from typing import NamedTuple
+from collections import Counter
+from lxml import etree as ET
+
+from .query import XPathCostExceeded
+from ._cache import _LRUCache
+from ._index import _parse_id_anchor
+
+__all__ = ("_DocumentStats", "_XPathPlanner", "_depth")
+
+# relative cost of evaluating a string function (e.g. `contains`) compared to visiting an element
+STRING_FUNCTION_COST = 10
+# relative cost of each comparison made by lxml (libxml2) to remove duplicates when the results of a step from multiple context elements are merged (the number of comparisons is quadratic in the number of results)
+MERGE_COST = 0.01
+
+_DESCENDANT_AXES = frozenset(("descendant", "descendant-or-self"))
+_ANCESTOR_AXES = frozenset(("ancestor", "ancestor-or-self"))
+_SIBLING_AXES = frozenset(("following-sibling", "preceding-sibling"))
+_DOCUMENT_AXES = frozenset(("following", "preceding"))
+# axes whose results from different context elements cannot overlap, lxml merges them without removing duplicates
+_NO_MERGE_AXES = frozenset(("child", "attribute", "namespace"))
+_AXES = (
+    _DESCENDANT_AXES
+    | _ANCESTOR_AXES
+    | _SIBLING_AXES
+    | _DOCUMENT_AXES
+    | frozenset(("child", "parent", "self", "attribute", "namespace"))
+)
+
+_NAME = r"[A-Za-z_][\w.-]*"
+# a single location step without its predicates, e.g. `svg:rect`, `@x`, `child::*`, `text()` or `..`
+_STEP_PATTERN = re.compile(
+    rf"""\s*(?:(?P<axis>{_NAME}(?:-{_NAME})*)\s*::\s*|(?P<attribute>@)\s*)?"""
+    rf"""(?P<test>\.\.|\.|\*|{_NAME}:\*|(?:(?P<prefix>{_NAME}):)?(?P<name>{_NAME})(?P<call>\s*\(\s*\))?)\s*"""
+)
+_STRING_FUNCTION_PATTERN = re.compile(
+    r"\b(?:contains|starts-with|ends-with|substring(?:-before|-after)?|translate|normalize-space|string-length|concat|matches|replace|tokenize|lower-case|upper-case)\s*\("
+)
+_DESCENDANT_PATTERN = re.compile(r"//|\bdescendant(?:-or-self)?\s*::")
+# a descendant search in a predicate that starts from the root rather than from the element, e.g. [@x = //y/@x]
+_ABSOLUTE_SEARCH_PATTERN = re.compile(r"(?:^|[(\[,|=<>]|\b(?:and|or))\s*//")
+_ID_PREDICATE_PATTERN = re.compile(r"""^\s*@id\s*=\s*(?:'[^']*'|"[^"]*")\s*$""")
+_POSITION_PREDICATE_PATTERN = re.compile(r"^\s*(?:\d+|last\(\s*\))\s*$")
+_ANCESTOR_PATTERN = re.compile(r"\bancestor(?:-or-self)?\s*::")
+# predicates whose value is always a boolean (rather than a number, which would select by position), e.g. `@x`, `@x > 1` or `contains(@id, 'a')`
+_LITERAL = r"""(?:'[^']*'|"[^"]*"|-?\d+(?:\.\d+)?)"""
+_BOOLEAN_PREDICATE_PATTERN = re.compile(
+    rf"""^\s*(?:@{_NAME}(?::{_NAME})?(?:\s*(?:=|!=|<=|>=|<|>)\s*{_LITERAL})?|(?:contains|starts-with)\(\s*@{_NAME}(?::{_NAME})?\s*,\s*{_LITERAL}\s*\))\s*$"""
+)
+# node tests that only match elements
+_ELEMENT_TEST_PATTERN = re.compile(rf"^(?:\*|{_NAME}:\*|(?:{_NAME}:)?{_NAME})$")
+_NODE_TYPES = frozenset(("node", "text", "comment", "processing-instruction"))
+
+
+def _depth(element: ET._Element) -> int:
+    """Get the depth of an element in its tree (the root has depth 0)."""
+    return sum(1 for _ in element.iterancestors())
+
+
+class _DocumentStats:
+    """Statistics of a document that are used to estimate the cost of an xpath: the number of elements with each tag (and their total depth) and the number of elements at each depth. They are kept up to date incrementally by `_XMLState` as elements are inserted, deleted or replaced."""
+
+    def __init__(self):
+        """Constructor."""
+        super().__init__()
+        self._tags: Counter[str] = Counter()
+        self._tag_depths: Counter[str] = Counter()
+        self._depths: list[int] = []
+        self._total = 0
+        self._generation = 0
+        self._generation_total = 0
+
+    @property
+    def total(self) -> int:
+        """Number of elements in the document."""
+        return self._total
+
+    @property
+    def generation(self) -> int:
+        """Incremented each time the number of elements has halved or doubled, estimates that were made in an earlier generation may be inaccurate."""
+        return self._generation
+
+    @property
+    def max_depth(self) -> int:
+        """Depth of the deepest element in the document."""
+        return len(self._depths) - 1
+
+    def count(self, tag: str | None) -> int:
+        """Get the number of elements with a (fully qualified) tag.
+
+        Args:
+            tag (str | None): the tag, or None for any tag.
+
+        Returns:
+            int: the number of elements.
+        """
+        if tag is None:
+            return self.total
+        return self._tags.get(tag, 0)
+
+    def mean_depth(self, tag: str | None) -> float:
+        """Get the average depth of the elements with a (fully qualified) tag.
+
+        Args:
+            tag (str | None): the tag, or None for any tag.
+
+        Returns:
+            float: the average depth, 0 if there are no such elements.
+        """
+        if tag is None:
+            total = sum(depth * n for depth, n in enumerate(self._depths))
+            return total / max(1, self.total)
+        return self._tag_depths.get(tag, 0) / max(1, self._tags.get(tag, 0))
+
+    def children(self, depth: int) -> float:
+        """Estimate the number of children of an element.
+
+        Args:
+            depth (int): depth of the element.
+
+        Returns:
+            float: average number of children of elements at `depth`.
+        """
+        if depth + 1 >= len(self._depths) or depth < 0:
+            return 0.0
+        return self._depths[depth + 1] / max(1, self._depths[depth])
+
+    def above(self, depth: int) -> int:
+        """Get the number of elements that are above a depth (i.e. that may be ancestors of an element at that depth).
+
+        Args:
+            depth (int): the depth.
+
+        Returns:
+            int: the number of elements.
+        """
+        return sum(self._depths[: max(depth, 0)])
+
+    def descendants(self, depth: int) -> float:
+        """Estimate the number of descendants of an element.
+
+        Args:
+            depth (int): depth of the element.
+
+        Returns:
+            float: average number of descendants of elements at `depth`.
+        """
+        if depth + 1 >= len(self._depths) or depth < 0:
+            return 0.0
+        return sum(self._depths[depth + 1 :]) / max(1, self._depths[depth])
+
+    def build(self, root: ET._Element) -> None:
+        """(Re)build the statistics from scratch.
+
+        Args:
+            root (ET._Element): the root of the tree.
+        """
+        self._tags.clear()
+        self._tag_depths.clear()
+        self._depths.clear()
+        self._total = 0
+        self.add_subtree(root, 0)
+
+    def add_subtree(self, element: ET._Element, depth: int) -> None:
+        """Add an element and all of its descendants to the statistics.
+
+        Args:
+            element (ET._Element): root of the subtree.
+            depth (int): depth of `element` in the tree.
+        """
+        self._update(element, depth, 1)
+
+    def remove_subtree(self, element: ET._Element, depth: int) -> None:
+        """Remove an element and all of its descendants from the statistics.
+
+        Args:
+            element (ET._Element): root of the subtree.
+            depth (int): depth that `element` had in the tree.
+        """
+        self._update(element, depth, -1)
+        while self._depths and self._depths[-1] <= 0:
+            self._depths.pop()
+
+    def _update(self, element: ET._Element, depth: int, sign: int):
+        tags, tag_depths, depths = self._tags, self._tag_depths, self._depths
+        for event, child in ET.iterwalk(element, events=("start", "end")):
+            if event == "end":
+                depth -= 1
+                continue
+            if isinstance(child.tag, str):
+                # the counts are clamped at 0, if they were to drift (e.g. if a subtree were removed twice) a negative estimate would otherwise disable the budget of the state
+                tags[child.tag] = max(0, tags[child.tag] + sign)
+                tag_depths[child.tag] = max(0, tag_depths[child.tag] + sign * depth)
+                while len(depths) <= depth:
+                    depths.append(0)
+                depths[depth] = max(0, depths[depth] + sign)
+                self._total = max(0, self._total + sign)
+            depth += 1
+        if not self._generation_total / 2 <= self._total <= self._generation_total * 2:
+            self._generation += 1
+            self._generation_total = self._total
+
+
+class _Step(NamedTuple):
+    """A location step of an xpath, see `_parse_path`."""
+
+    axis: str  # e.g. "child", "descendant" (if the step follows `//`) or "attribute"
+    tag: (
+        str | None
+    )  # the fully qualified tag that is matched, or None if any node is matched
+    predicates: tuple[str, ...]
+    source: str  # the step as written, without its predicates, e.g. `svg:rect` or `@x`
+    separator: str  # the `/` or `//` that precedes the step, empty for the first step of a relative path
+
+    def __str__(self) -> str:
+        return (
+            self.separator
+            + self.source
+            + "".join(f"[{predicate}]" for predicate in self.predicates)
+        )
+
+
+class _Plan(NamedTuple):
+    """How an xpath is evaluated by `_XMLState`, see `_XPathPlanner.plan`."""
+
+    cost: float  # estimated cost of evaluating `xpath` from the root
+    xpath: str  # the xpath to evaluate from the root, possibly rewritten to an equivalent xpath that is cheaper to evaluate
+    anchor: (
+        tuple[str, str | None] | None
+    )  # id (and tag) of the element that the xpath can be evaluated relative to
+    relative: str | None  # the xpath relative to the anchor
+    relative_steps: (
+        list[_Step] | None
+    )  # steps of the relative xpath, used to estimate its cost from the anchor
+
+
+class _XPathPlanner:
+    """Estimates the cost of xpath expressions (roughly, the number of elements that are visited to evaluate them) from statistics of the document (see `_DocumentStats`) and enforces a budget on the cost of each expression.
+
+    It also finds xpaths that can be evaluated more cheaply:
+    - xpaths that start with an id lookup followed by other steps (e.g. `//*[@id='g']//svg:rect`) are evaluated relative to the element found with the id index (e.g. `.//svg:rect`) rather than by searching the whole document.
+    - nested descendant searches (e.g. `//svg:g//svg:rect`) are rewritten as a single search (e.g. `//svg:rect[ancestor::svg:g]`), lxml merges the results of a descendant search from each context element at a cost that is quadratic in the number of results.
+    """
+
+    def __init__(
+        self,
+        stats: _DocumentStats,
+        namespaces: dict[str, str],
+        budget: float | None = None,
+        cache_size: int = 1024,
+    ):
+        """Constructor.
+
+        Args:
+            stats (_DocumentStats): statistics of the document.
+            namespaces (dict[str, str]): namespaces (prefix -> URI) used in xpaths.
+            budget (float | None, optional): maximum estimated cost of an xpath. Defaults to None, in which case there is no maximum.
+            cache_size (int, optional): maximum number of plans to keep. Defaults to 1024.
+        """
+        super().__init__()
+        self._stats = stats
+        self._namespaces = namespaces
+        self._budget = budget
+        self._plans = _LRUCache(maxsize=cache_size)
+        self._generation = stats.generation
+
+    @property
+    def budget(self) -> float | None:
+        """Maximum estimated cost of an xpath, or None if there is no maximum."""
+        return self._budget
+
+    def plan(self, xpath: str) -> _Plan:
+        """Get the plan of an xpath, plans are cached until the size of the document changes significantly (see `_DocumentStats.generation`).
+
+        Args:
+            xpath (str): the xpath.
+
+        Returns:
+            _Plan: the plan.
+        """
+        if self._generation != self._stats.generation:
+            self._generation = self._stats.generation
+            self._plans.clear()
+        return self._plans.get(xpath, self._plan, xpath)
+
+    def _plan(self, xpath: str) -> _Plan:
+        cost = self._estimate_expression(xpath)
+        anchor = _parse_id_anchor(xpath, self._namespaces)
+        if anchor is not None:
+            _id, tag, relative = anchor
+            parsed = self._parse_path(relative)
+            if parsed is not None:
+                return _Plan(cost, xpath, (_id, tag), relative, parsed[1])
+        rewritten = self._rewrite(xpath)
+        if rewritten is not None:
+            rewritten_cost = self._estimate_expression(rewritten)
+            if rewritten_cost < cost:
+                return _Plan(rewritten_cost, rewritten, None, None, None)
+        return _Plan(cost, xpath, None, None, None)
+
+    def _rewrite(self, xpath: str) -> str | None:
+        # `//x//y...` -> `//y[ancestor::x]...`, None if `xpath` is not of this form. This is only equivalent if neither step has a predicate that selects by position.
+        parsed = self._parse_path(xpath)
+        if parsed is None or not parsed[0] or len(parsed[1]) < 2:
+            return None
+        outer, inner, *rest = parsed[1]
+        for step in (outer, inner):
+            if step.separator != "//" or not _ELEMENT_TEST_PATTERN.match(step.source):
+                return None
+            for predicate in step.predicates:
+                if not _BOOLEAN_PREDICATE_PATTERN.match(predicate):
+                    return None
+        ancestor = str(outer._replace(separator="ancestor::"))
+        inner = inner._replace(predicates=(ancestor, *inner.predicates))
+        return "".join(str(step) for step in (inner, *rest))
+
+    def check(self, xpath: str, cost: float) -> None:
+        """Check that the estimated cost of an xpath is within budget.
+
+        Args:
+            xpath (str): the xpath.
+            cost (float): its estimated cost.
+
+        Raises:
+            XPathCostExceeded: if the cost exceeds the budget.
+        """
+        if self._budget is not None and cost > self._budget:
+            raise XPathCostExceeded(
+                "Invalid xpath: `{xpath}`, its estimated cost ({cost:.0f}) exceeds the budget ({budget:.0f}).",
+                xpath=xpath,
+                cost=cost,
+                budget=self._budget,
+            )
+
+    def estimate_relative(self, steps: list[_Step], depth: int) -> float:
+        """Estimate the cost of evaluating steps relative to an element.
+
+        Args:
+            steps (list[_Step]): the steps.
+            depth (int): depth of the element.
+
+        Returns:
+            float: the estimated cost.
+        """
+        return self._estimate_steps(steps, 1.0, depth)
+
+    def _estimate_expression(self, xpath: str) -> float:
+        # the cost of a union is the sum of the costs of its branches
+        cost = 0.0
+        for branch in _split_top_level(xpath, "|"):
+            parsed = self._parse_path(branch)
+            if parsed is None:
+                cost += self._estimate_other(branch)
+            else:
+                absolute, steps = parsed
+                # the context is the document for an absolute path, otherwise the root element
+                cost += self._estimate_steps(steps, 1.0, -1 if absolute else 0)
+        return cost
+
+    def _estimate_other(self, xpath: str) -> float:
+        # expressions that are not location paths (e.g. `count(//x)`) are estimated by the number of descendant searches that they contain
+        searches = len(_DESCENDANT_PATTERN.findall(xpath))
+        if searches == 0:
+            return 1.0
+        cost = float(self._stats.total * searches)
+        if _STRING_FUNCTION_PATTERN.search(xpath):
+            cost *= STRING_FUNCTION_COST
+        return cost
+
+    def _estimate_steps(self, steps: list[_Step], context: float, depth: int) -> float:
+        stats = self._stats
+        total = stats.total
+        cost = 0.0
+        for step in steps:
+            axis = step.axis
+            matches = stats.count(step.tag) if step.tag is not None else total
+            if axis == "child":
+                if depth < 0:
+                    visited = 1.0  # the root element
+                else:
+                    visited = min(context * stats.children(depth), total)
+                output = min(visited, matches)
+                depth += 1
+            elif axis in _DESCENDANT_AXES:
+                # overlapping subtrees are visited once for each context element that contains them
+                if depth < 0:
+                    visited = context * total
+                else:
+                    visited = context * max(stats.descendants(depth), 1.0)
+                output = min(visited, matches)
+                depth = max(depth + 1, round(stats.mean_depth(step.tag)))
+            elif axis in ("attribute", "namespace", "self"):
+                visited = output = context
+            elif axis == "parent":
+                visited = output = context
+                depth -= 1
+            elif axis in _ANCESTOR_AXES:
+                visited = context * max(depth, 1)
+                output = min(visited, matches, stats.above(depth))
+                depth = 0
+            elif axis in _SIBLING_AXES:
+                visited = context * max(stats.children(depth - 1), 1.0)
+                output = min(visited, matches)
+            else:  # following, preceding
+                visited = context * total
+                output = min(visited, matches)
+            cost += visited
+            if context > 1 and axis not in _NO_MERGE_AXES:
+                cost += MERGE_COST * visited * output
+            for predicate in step.predicates:
+                cost += output * self._estimate_predicate(predicate, depth)
+                if _ID_PREDICATE_PATTERN.match(predicate):
+                    output = min(output, 1.0)
+                elif _POSITION_PREDICATE_PATTERN.match(predicate):
+                    output = min(output, context)
+            context = output
+        return cost
+
+    def _estimate_predicate(self, predicate: str, depth: int) -> float:
+        # the cost of evaluating a predicate for a single element (at `depth`)
+        cost = 1.0 + max(depth, 1) * len(_ANCESTOR_PATTERN.findall(predicate))
+        searches = len(_DESCENDANT_PATTERN.findall(predicate))
+        if searches:
+            absolute = len(_ABSOLUTE_SEARCH_PATTERN.findall(predicate))
+            cost += self._stats.total * absolute
+            cost += self._stats.descendants(depth) * (searches - absolute)
+        cost += STRING_FUNCTION_COST * len(_STRING_FUNCTION_PATTERN.findall(predicate))
+        return cost
+
+    def _parse_path(self, xpath: str) -> tuple[bool, list[_Step]] | None:
+        # parse a location path (e.g. `//svg:g/svg:rect[@x > 1]/@y`), None if `xpath` is not a location path
+        xpath = xpath.strip()
+        n = len(xpath)
+        absolute = xpath.startswith("/")
+        descendant = xpath.startswith("//")
+        i = 2 if descendant else int(absolute)
+        separator = xpath[:i]
+        steps = []
+        if absolute and i == n and not descendant:
+            return absolute, steps  # the document
+        while True:
+            match = _STEP_PATTERN.match(xpath, i)
+            if match is None:
+                return None
+            step = self._parse_step(match, descendant)
+            if step is None:
+                return None
+            source = match.group(0).strip()
+            i = match.end()
+            predicates = []
+            while i < n and xpath[i] == "[":
+                end = _find_closing(xpath, i)
+                if end < 0:
+                    return None
+                predicates.append(xpath[i + 1 : end])
+                i = end + 1
+                while i < n and xpath[i].isspace():
+                    i += 1
+            steps.append(
+                step._replace(
+                    predicates=tuple(predicates), source=source, separator=separator
+                )
+            )
+            if i == n:
+                return absolute, steps
+            if xpath.startswith("//", i):
+                descendant, separator, i = True, "//", i + 2
+            elif xpath[i] == "/":
+                descendant, separator, i = False, "/", i + 1
+            else:
+                return None  # an operator, e.g. `|` or `=`
+
+    def _parse_step(self, match: re.Match, descendant: bool) -> _Step | None:
+        test = match.group("test")
+        axis = match.group("axis")
+        if axis is None:
+            axis = "attribute" if match.group("attribute") else "child"
+        elif axis not in _AXES:
+            return None
+        if test == ".":
+            axis, tag = "self", None
+        elif test == "..":
+            axis, tag = "parent", None
+        elif test == "*" or test.endswith(":*"):
+            tag = None
+        elif match.group("call"):
+            if match.group("name") not in _NODE_TYPES or match.group("prefix"):
+                return None  # a function call
+            tag = None
+        elif axis == "attribute":
+            tag = None
+        else:
+            prefix = match.group("prefix")
+            if prefix is None:
+                tag = match.group("name")
+            else:
+                uri = self._namespaces.get(prefix, None)
+                if uri is None:
+                    return None  # let lxml deal with the unknown prefix
+                tag = f"{{{uri}}}{match.group('name')}"
+        if descendant:
+            if axis != "child":
+                return None  # e.g. `//@x`, estimated as any other descendant search
+            axis = "descendant"
+        return _Step(axis, tag, (), "", "")
+
+
+def _find_closing(xpath: str, start: int) -> int:
+    # index of the `]` that closes the `[` at `start`, -1 if there is none
+    depth = 0
+    quote = None
+    for i in range(start, len(xpath)):
+        c = xpath[i]
+        if quote is not None:
+            if c == quote:
+                quote = None
+        elif c in "'\"":
+            quote = c
+        elif c == "[":
+            depth += 1
+        elif c == "]":
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+
+def _split_top_level(xpath: str, separator: str) -> list[str]:
+    # split `xpath` at each `separator` that is not in a predicate, function call or string
+    parts = []
+    depth = 0
+    quote = None
+    start = 0
+    for i, c in enumerate(xpath):
+        if quote is not None:
+            if c == quote:
+                quote = None
+        elif c in "'\"":
+            quote = c
+        elif c in "[(":
+            depth += 1
+        elif c in "])":
+            depth -= 1
+        elif c == separator and depth == 0:
+            parts.append(xpath[start:i])
+            start = i + 1
+    parts.append(xpath[start:])
+    return parts
@@ -0,0 +1,246 @@
+"""Copy-on-write support for the snapshots of an `_XMLState`, this is not part of the public API."""
+
+from copy import deepcopy
+from threading import Condition
+from contextlib import contextmanager
+from collections.abc import Iterable, Iterator
+from weakref import ref
+from lxml import etree as ET
+
+from ._undo import _UndoLog, _ELEMENT, _CHILDREN
+
+__all__ = ("_SnapshotLog", "_SnapshotRoot")
+
+
+class _SnapshotLog:
+    """Records the state of elements before they are first modified while snapshots of an `_XMLState` are in use, so that the tree of a snapshot can be reconstructed at the version that it is pinned to.
+
+    Records are kept in the same way as the undo log of a transaction (see `_UndoLog`): the attributes, text and tail of an element that is updated, and the text and children (with their tails) of an element whose children are inserted, deleted or replaced. Each is recorded at most once per version that is in use, the memory used therefore grows with the number of modified elements rather than the size of the document or the number of snapshots. Records that are no longer needed by any snapshot are discarded when the state is next modified.
+
+    Modifications must be made between `begin_write` and `end_write`, snapshots may be read concurrently (e.g. by other threads) but reads of the tree that is shared with the state wait for a modification in progress to complete (and vice versa).
+    """
+
+    def __init__(self, root: ET._Element):
+        """Constructor.
+
+        Args:
+            root (ET._Element): root element of the state.
+        """
+        super().__init__()
+        self._root = root
+        self._records: list[tuple[int, ET._Element, tuple]] = []
+        self._offset = 0  # number of records that have been discarded
+        self._recorded: set[tuple[int, ET._Element]] = (
+            set()
+        )  # since `_current` was taken
+        self._roots: list[
+            ref[_SnapshotRoot]
+        ] = []  # roots that have not been reconstructed
+        self._current: ref[_SnapshotRoot] | None = None  # root of the current version
+        self._recording = False
+        self._readers = 0
+        self._writing = 0
+        self._condition = Condition()
+
+    @property
+    def recording(self) -> bool:
+        """Whether modified elements must be recorded (see `save_element` and `save_children`), this is the case while a snapshot that has not been reconstructed is in use."""
+        return self._recording
+
+    def root(self) -> "_SnapshotRoot":
+        """Get the root that is shared by the snapshots taken at the current version of the state, this waits for a modification in progress to complete.
+
+        Returns:
+            _SnapshotRoot: the root.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._writing == 0)
+            root = None if self._current is None else self._current()
+            if root is None:
+                root = _SnapshotRoot(self, self._offset + len(self._records))
+                self._current = ref(root)
+                self._roots.append(self._current)
+                self._recorded = set()
+                self._recording = True
+            return root
+
+    def begin_write(self) -> bool:
+        """Begin a modification of the tree, this waits for any reads of the tree (by snapshots that share it) to complete. Calls may be nested.
+
+        Returns:
+            bool: False if no snapshots are in use, in which case the log is no longer needed (and `end_write` must not be called).
+        """
+        with self._condition:
+            if self._writing > 0:
+                self._writing += 1
+                return True
+            self._current = None
+            self._roots = [r for r in self._roots if _needs_records(r())]
+            if not self._roots:
+                self._records.clear()
+                self._recording = False
+                return False
+            # discard the records that were made before the oldest snapshot was taken
+            start = self._roots[0]().start
+            del self._records[: start - self._offset]
+            self._offset = start
+            self._condition.wait_for(lambda: self._readers == 0)
+            self._writing = 1
+            return True
+
+    def end_write(self) -> None:
+        """End a modification of the tree (see `begin_write`)."""
+        with self._condition:
+            self._writing -= 1
+            if self._writing == 0:
+                self._condition.notify_all()
+
+    def save_element(self, element: ET._Element) -> None:
+        """Record the attributes, text and tail of an element before it is modified.
+
+        Args:
+            element (ET._Element): the element.
+        """
+        key = (_ELEMENT, element)
+        if key in self._recorded:
+            return
+        self._recorded.add(key)
+        data = (dict(element.attrib), element.text, element.tail)
+        self._records.append((_ELEMENT, element, data))
+
+    def save_children(self, element: ET._Element) -> None:
+        """Record the text and children of an element before its children are modified.
+
+        Args:
+            element (ET._Element): the element.
+        """
+        key = (_CHILDREN, element)
+        if key in self._recorded:
+            return
+        self._recorded.add(key)
+        data = (element.text, [(child, child.tail) for child in element])
+        self._records.append((_CHILDREN, element, data))
+
+    def save_all(self, records: Iterable[tuple[int, ET._Element]]) -> None:
+        """Record elements before they are modified (see `save_element` and `save_children`).
+
+        Args:
+            records (Iterable[tuple[int, ET._Element]]): the kind of record (as in `_UndoLog`) and the element.
+        """
+        for kind, element in records:
+            if kind == _ELEMENT:
+                self.save_element(element)
+            else:
+                self.save_children(element)
+
+    def _reconstruct(self, start: int) -> ET._Element | None:
+        # copy of the tree at the version that the records from `start` were made after, or None if the tree has not been modified since
+        records = self._records[start - self._offset :]
+        if not records:
+            return None
+        recorded = set()
+        for kind, element, data in records:
+            recorded.add(element)
+            if kind == _CHILDREN:
+                recorded.update(child for child, _ in data[1])
+        copies: dict[ET._Element, ET._Element] = dict()
+        root = deepcopy(self._root)
+        _map_copies(self._root, root, recorded, copies)
+        for kind, element, data in reversed(records):
+            if kind == _ELEMENT:
+                element = _get_copy(element, recorded, copies)
+                _UndoLog._restore_element(element, data, None, None)
+            else:
+                element = _get_copy(element, recorded, copies)
+                text, children = data
+                children = [
+                    (_get_copy(child, recorded, copies), tail)
+                    for child, tail in children
+                ]
+                _UndoLog._restore_children(element, (text, children), None, None, None)
+        return root
+
+
+def _needs_records(root: "_SnapshotRoot | None") -> bool:
+    return root is not None and root._copy is None
+
+
+def _map_copies(
+    element: ET._Element,
+    copy: ET._Element,
+    recorded: set[ET._Element],
+    copies: dict[ET._Element, ET._Element],
+):
+    # map the recorded elements in a subtree to the same elements in its copy
+    for original, copied in zip(element.iter(), copy.iter()):
+        if original in recorded and original not in copies:
+            copies[original] = copied
+
+
+def _get_copy(
+    element: ET._Element,
+    recorded: set[ET._Element],
+    copies: dict[ET._Element, ET._Element],
+) -> ET._Element:
+    # the copy of an element, elements that are no longer in the tree (e.g. they were deleted) are copied separately
+    copy = copies.get(element)
+    if copy is None:
+        copy = deepcopy(element)
+        _map_copies(element, copy, recorded, copies)
+    return copy
+
+
+class _SnapshotRoot:
+    """The root element of one or more snapshots that were taken at the same version of an `_XMLState`.
+
+    The root is initially shared with the state (no copy is made). Modifications that the state makes after the snapshots were taken are recorded in a `_SnapshotLog`, the tree of the snapshots is only reconstructed (from a copy of the current tree and the records) if they are read after the state has been modified. This is done once for all of the snapshots taken at the same version, after which the records are no longer needed by them.
+    """
+
+    def __init__(self, log: _SnapshotLog, start: int):
+        """Constructor, roots should be created via `_SnapshotLog.root`.
+
+        Args:
+            log (_SnapshotLog): the log of the state.
+            start (int): position in the log of the first record that was made after the snapshots were taken.
+        """
+        super().__init__()
+        self._log = log
+        self._start = start
+        self._copy: ET._Element | None = None
+
+    @property
+    def start(self) -> int:
+        """Position in the log of the first record that was made after the snapshots were taken."""
+        return self._start
+
+    @property
+    def copied(self) -> bool:
+        """Whether the tree has been reconstructed for the snapshots (it is no longer shared with the state)."""
+        return self._copy is not None
+
+    @contextmanager
+    def read(self) -> Iterator[ET._Element]:
+        """Context manager that gives the root element, the state will not be modified until the context exits.
+
+        Yields:
+            ET._Element: the root element.
+        """
+        if self._copy is not None:
+            yield self._copy  # the copy is never modified
+            return
+        log = self._log
+        with log._condition:
+            log._condition.wait_for(lambda: log._writing == 0)
+            if self._copy is None:
+                self._copy = log._reconstruct(self._start)
+            if self._copy is None:
+                log._readers += 1
+        if self._copy is not None:
+            yield self._copy
+            return
+        try:
+            yield log._root
+        finally:
+            with log._condition:
+                log._readers -= 1
+                log._condition.notify_all()
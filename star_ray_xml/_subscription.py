@@ -0,0 +1,229 @@
+"""Index of the subscriptions made to an `XMLAmbient`, this is not part of the public API."""
+
+from threading import Lock
+from itertools import chain
+from typing import Any
+from lxml import etree as ET
+from star_ray.pubsub import Subscriber
+
+from .query import XMLQuery
+from .state import ID
+from ._index import _parse_id_xpath
+
+__all__ = ("_SubscriptionIndex",)
+
+
+def _select(_xpath: str, xpath: Any) -> set[ET._Element] | None:
+    """The elements selected by an xpath filter (the parent element is used for other results, e.g. attributes), or None if the filter cannot be evaluated."""
+    try:
+        elements = xpath(_xpath)
+    except Exception:
+        return None
+    selected = set()
+    for element in elements:
+        if not element.is_element:
+            element = element.get_parent()
+            if element is None:
+                continue
+        selected.add(element._base)
+    return selected
+
+
+class _SubscriptionIndex:
+    """Index of subscriptions that is used to find the subscribers that should be notified of a write query without checking every subscription.
+
+    A subscription topic may be:
+    - a subclass of `XMLQuery`: the subscriber is notified of every (successful) write query of this type.
+    - an xpath (str): the subscriber is notified of write queries that modify an element selected by the xpath, or a descendant of such an element. Inserting or deleting an element modifies its parent, deleting an element also modifies each element in its subtree. Xpaths of the form `//*[@id='...']` (or `//svg:rect[@id='...']`) are indexed by `id` and also match the removal of the element (or its ancestors), other xpaths are evaluated both before (see `select_filters`) and after the write has taken place, so that an element that is no longer selected after the write (e.g. because the attribute in the filter was updated, or the element was deleted) is also matched. If a filter cannot be evaluated its subscribers are notified.
+
+    Subscribers are identified by their hash, the `Subscriber` wrappers used in `Subscribe` actions do not implement equality.
+    """
+
+    def __init__(self):
+        """Constructor."""
+        super().__init__()
+        self._lock = Lock()
+        # type -> subscriber hash -> subscriber
+        self._types: dict[type, dict[int, Subscriber]] = dict()
+        # id -> tag (None for any tag) -> subscriber hash -> subscriber
+        self._ids: dict[str, dict[str | None, dict[int, Subscriber]]] = dict()
+        # xpath -> subscriber hash -> subscriber
+        self._xpaths: dict[str, dict[int, Subscriber]] = dict()
+
+    @property
+    def has_filters(self) -> bool:
+        """Whether there are any xpath (or id) subscriptions, these require the modified elements to be tracked."""
+        return bool(self._ids) or bool(self._xpaths)
+
+    def __bool__(self):  # noqa: D105
+        return bool(self._types) or self.has_filters
+
+    def subscribe(
+        self, topic: Any, subscriber: Subscriber, namespaces: dict[str, str]
+    ) -> None:
+        """Add a subscription.
+
+        Args:
+            topic (Any): the topic, see class documentation for details.
+            subscriber (Subscriber): the subscriber.
+            namespaces (dict[str, str]): namespaces used to resolve a tag prefix in an `id` xpath.
+
+        Raises:
+            ValueError: if the topic is not valid.
+        """
+        with self._lock:
+            self._topic(topic, namespaces, create=True)[hash(subscriber)] = subscriber
+
+    def unsubscribe(
+        self, topic: Any, subscriber: Subscriber, namespaces: dict[str, str]
+    ) -> None:
+        """Remove a subscription, nothing is done if it does not exist.
+
+        Args:
+            topic (Any): the topic, see class documentation for details.
+            subscriber (Subscriber): the subscriber.
+            namespaces (dict[str, str]): namespaces used to resolve a tag prefix in an `id` xpath.
+
+        Raises:
+            ValueError: if the topic is not valid.
+        """
+        with self._lock:
+            subscribers = self._topic(topic, namespaces, create=False)
+            if subscribers is not None:
+                subscribers.pop(hash(subscriber), None)
+                self._prune()
+
+    def remove(self, subscriber: Subscriber) -> None:
+        """Remove all subscriptions of a subscriber.
+
+        Args:
+            subscriber (Subscriber): the subscriber.
+        """
+        key = hash(subscriber)
+        with self._lock:
+            for index in chain(self._types.values(), self._xpaths.values()):
+                index.pop(key, None)
+            for tags in self._ids.values():
+                for index in tags.values():
+                    index.pop(key, None)
+            self._prune()
+
+    def match_type(self, query: XMLQuery) -> dict[int, Subscriber]:
+        """Find the subscribers to the type of `query`.
+
+        Args:
+            query (XMLQuery): the write query.
+
+        Returns:
+            dict[int, Subscriber]: the subscribers (by hash).
+        """
+        result = dict()
+        with self._lock:
+            for topic, subscribers in self._types.items():
+                if isinstance(query, topic):
+                    result.update(subscribers)
+        return result
+
+    def select_filters(self, xpath: Any) -> dict[str, set[ET._Element] | None]:
+        """Evaluate the xpath filters (other than `id` filters) before a write, the result should be given to `match_filters` once the write has taken place.
+
+        Args:
+            xpath (Any): function used to evaluate xpath filters (see `_XMLState.xpath`).
+
+        Returns:
+            dict[str, set[ET._Element] | None]: the elements selected by each filter, or None if the filter could not be evaluated.
+        """
+        with self._lock:
+            xpaths = list(self._xpaths)
+        return {_xpath: _select(_xpath, xpath) for _xpath in xpaths}
+
+    def match_filters(
+        self,
+        modified: list[tuple[ET._Element, str | None, bool]],
+        xpath: Any,
+        before: dict[str, set[ET._Element] | None] | None = None,
+    ) -> dict[int, Subscriber]:
+        """Find the subscribers whose xpath (or id) filters intersect the `modified` elements.
+
+        Args:
+            modified (list[tuple[ET._Element, str | None, bool]]): the modified elements, see `_XMLState._track_modified`.
+            xpath (Any): function used to evaluate xpath filters (see `_XMLState.xpath`).
+            before (dict[str, set[ET._Element] | None] | None, optional): the elements selected by the xpath filters before the write, see `select_filters`. Defaults to None, in which case filters are only evaluated after the write.
+
+        Returns:
+            dict[int, Subscriber]: the subscribers (by hash).
+        """
+        result = dict()
+        if not modified:
+            return result
+        # modified elements and their ancestors
+        affected: set[ET._Element] = set()
+        ids: list[tuple[str | None, str]] = []  # (id, tag)
+        for element, _id, removed in modified:
+            ids.append((_id, element.tag))
+            for e in chain((element,), element.iterancestors()):
+                if e in affected:
+                    break  # the ancestors have already been added
+                affected.add(e)
+                ids.append((e.get(ID), e.tag))
+            if removed:
+                # elements in a removed subtree are removed with it, they can no longer be found by their id (or by a filter)
+                for e in element.iter(ET.Element):
+                    affected.add(e)
+                    ids.append((e.get(ID), e.tag))
+        with self._lock:
+            for _id, tag in ids:
+                tags = self._ids.get(_id, None)
+                if tags is None:
+                    continue
+                for _tag, subscribers in tags.items():
+                    if _tag is None or _tag == tag:
+                        result.update(subscribers)
+            xpaths = list(self._xpaths.items())
+        before = before or dict()
+        for _xpath, subscribers in xpaths:
+            selected = _select(_xpath, xpath)
+            previous = before.get(_xpath, set())
+            if (
+                selected is None
+                or previous is None
+                or not affected.isdisjoint(selected)
+                or not affected.isdisjoint(previous)
+            ):
+                result.update(subscribers)
+        return result
+
+    def _topic(
+        self, topic: Any, namespaces: dict[str, str], create: bool
+    ) -> dict[int, Subscriber] | None:
+        if isinstance(topic, type) and issubclass(topic, XMLQuery):
+            index, key = self._types, topic
+        elif isinstance(topic, str):
+            parsed = _parse_id_xpath(topic, namespaces)
+            if parsed is None:
+                index, key = self._xpaths, topic
+            else:
+                _id, tag = parsed
+                if create:
+                    index = self._ids.setdefault(_id, dict())
+                else:
+                    index = self._ids.get(_id, dict())
+                key = tag
+        else:
+            raise ValueError(
+                f"Invalid subscription topic: {topic}, must be a subclass of `{XMLQuery.__name__}` or an xpath (str)."
+            )
+        if create:
+            return index.setdefault(key, dict())
+        return index.get(key, None)
+
+    def _prune(self):
+        # remove topics that no longer have subscribers
+        for index in (self._types, self._xpaths):
+            for key in [key for key, subscribers in index.items() if not subscribers]:
+                del index[key]
+        for _id, tags in list(self._ids.items()):
+            for tag in [tag for tag, subscribers in tags.items() if not subscribers]:
+                del tags[tag]
+            if not tags:
+                del self._ids[_id]
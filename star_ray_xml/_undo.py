@@ -0,0 +1,163 @@
+"""Defines the undo log that is kept by `_XMLState` during a transaction (see `_XMLState.transaction`)."""
+
+from lxml import etree as ET
+
+from ._index import _IdIndex, _SecondaryIndex
+from ._planner import _DocumentStats, _depth
+
+__all__ = ("_UndoLog",)
+
+# kinds of undo record
+_ELEMENT = 0  # attributes, text and tail of an element
+_CHILDREN = 1  # text and children (with their tails) of an element
+
+
+class _UndoLog:
+    """Records the state of elements before they are first modified in a transaction so that the modifications can be undone.
+
+    Two kinds of record are kept: the attributes, text and tail of an element that is updated, and the text and children (with their tails) of an element whose children are inserted, deleted or replaced. Each is recorded at most once per transaction, the cost of a transaction therefore depends on the number of modified elements (and the number of children of modified parents) rather than the size of the document.
+
+    Transactions may be nested, rolling back a nested transaction only undoes the modifications that were made since it began.
+    """
+
+    def __init__(self):
+        """Constructor."""
+        super().__init__()
+        self._records: list[tuple[int, ET._Element, tuple]] = []
+        # start of each (nested) transaction in `_records` and the elements recorded since then
+        self._levels: list[tuple[int, set[tuple[int, ET._Element]]]] = []
+
+    @property
+    def depth(self) -> int:
+        """Number of nested transactions that are in progress."""
+        return len(self._levels)
+
+    def begin(self) -> None:
+        """Begin a (nested) transaction."""
+        self._levels.append((len(self._records), set()))
+
+    def commit(self) -> None:
+        """Commit the innermost transaction, its records are kept until the outer transaction (if any) is committed."""
+        _, recorded = self._levels.pop()
+        if self._levels:
+            self._levels[-1][1].update(recorded)
+        else:
+            self._records.clear()
+
+    def rollback(
+        self,
+        id_index: _IdIndex | None,
+        stats: _DocumentStats | None = None,
+        indexes: _SecondaryIndex | None = None,
+    ) -> None:
+        """Undo the modifications that were made in the innermost transaction.
+
+        Args:
+            id_index (_IdIndex | None): the id index to keep up to date.
+            stats (_DocumentStats | None, optional): the document statistics to keep up to date. Defaults to None.
+            indexes (_SecondaryIndex | None, optional): the secondary indexes to keep up to date. Defaults to None.
+        """
+        start, _ = self._levels.pop()
+        for kind, element, data in reversed(self._records[start:]):
+            if kind == _ELEMENT:
+                _UndoLog._restore_element(element, data, id_index, indexes)
+            else:
+                _UndoLog._restore_children(element, data, id_index, stats, indexes)
+        del self._records[start:]
+
+    def pending(self) -> list[tuple[int, ET._Element]]:
+        """The records of the innermost transaction, these are the elements that will be modified if it is rolled back.
+
+        Returns:
+            list[tuple[int, ET._Element]]: the kind of each record and its element.
+        """
+        start, _ = self._levels[-1]
+        return [(kind, element) for kind, element, _ in self._records[start:]]
+
+    def save_element(self, element: ET._Element) -> None:
+        """Record the attributes, text and tail of an element before it is modified.
+
+        Args:
+            element (ET._Element): the element.
+        """
+        key = (_ELEMENT, element)
+        recorded = self._levels[-1][1]
+        if key in recorded:
+            return
+        recorded.add(key)
+        data = (dict(element.attrib), element.text, element.tail)
+        self._records.append((_ELEMENT, element, data))
+
+    def save_children(self, element: ET._Element) -> None:
+        """Record the text and children of an element before its children are modified.
+
+        Args:
+            element (ET._Element): the element.
+        """
+        key = (_CHILDREN, element)
+        recorded = self._levels[-1][1]
+        if key in recorded:
+            return
+        recorded.add(key)
+        data = (element.text, [(child, child.tail) for child in element])
+        self._records.append((_CHILDREN, element, data))
+
+    @staticmethod
+    def _restore_element(
+        element: ET._Element,
+        data: tuple[dict[str, str], str | None, str | None],
+        id_index: _IdIndex | None,
+        indexes: _SecondaryIndex | None,
+    ):
+        attrib, text, tail = data
+        old_id = element.get(id_index.attribute) if id_index is not None else None
+        values = None if indexes is None else indexes.get_values(element)
+        element.attrib.clear()
+        element.attrib.update(attrib)
+        element.text = text
+        element.tail = tail
+        if id_index is not None:
+            new_id = element.get(id_index.attribute)
+            if new_id != old_id:
+                id_index.remove(old_id, element)
+                id_index.add(new_id, element)
+        if values is not None:
+            indexes.update(element, values)
+
+    @staticmethod
+    def _restore_children(
+        element: ET._Element,
+        data: tuple[str | None, list[tuple[ET._Element, str | None]]],
+        id_index: _IdIndex | None,
+        stats: _DocumentStats | None,
+        indexes: _SecondaryIndex | None,
+    ):
+        text, children = data
+        current = list(element)
+        for child in current:
+            element.remove(child)
+        element.text = text
+        for child, tail in children:
+            element.append(child)
+            child.tail = tail
+        if id_index is None and stats is None and indexes is None:
+            return
+        depth = None if stats is None else _depth(element) + 1
+        restored = set(child for child, _ in children)
+        for child in current:
+            if child not in restored:
+                if id_index is not None:
+                    id_index.remove_subtree(child)
+                if stats is not None:
+                    stats.remove_subtree(child, depth)
+                if indexes is not None:
+                    indexes.remove_subtree(child)
+        current = set(current)
+        for child, _ in children:
+            if child not in current:
+                if id_index is not None:
+                    id_index.add_subtree(child)
+                if stats is not None:
+                    stats.add_subtree(child, depth)
+                if indexes is not None:
+                    indexes.add_subtree(child)
@@ -1,19 +1,31 @@
 """Contains the default `Ambient` (see `star_ray`) implementation that uses XML as its state description language and xpath as its query language."""
 
+import asyncio
 from typing import Any
+from contextlib import nullcontext
+from collections.abc import Callable, Sequence
+from concurrent.futures import Executor, ThreadPoolExecutor
 from star_ray import Ambient, Agent
 from star_ray.event import ActiveObservation, ErrorActiveObservation
 from star_ray.pubsub import Subscribe, Unsubscribe
+from star_ray.utils import _LOGGER
 
 from .state import XMLState, _XMLState
+from .journal import XMLJournal
+from .profiler import XMLProfiler
 from .query import Select, XMLQuery
+from ._lock import _AsyncReadWriteLock
+from ._subscription import _SubscriptionIndex
 
 DEFAULT_XML = "<xml></xml>"
 DEFAULT_NAMESPACES = {}
 
 
 class XMLAmbient(Ambient):
-    """An implementation of an `Ambient` (see `star_ray`) that uses XML as its state description language and xpath as its query language."""
+    """An implementation of an `Ambient` (see `star_ray`) that uses XML as its state description language and xpath as its query language.
+
+    Agents may subscribe (via `Subscribe`) to be notified of write actions. The `topic` of the subscription may either be a subclass of `XMLQuery`, in which case the subscriber is notified of every successful write action of this type, or an xpath, in which case the subscriber is only notified of write actions that modify an element selected by the xpath (or one of its descendants). Xpaths of the form `//*[@id='...']` are indexed by `id` and are particularly cheap to match. Xpath subscriptions require the default `xml_state`.
+    """
 
     def __init__(
         self,
@@ -21,6 +33,13 @@ class XMLAmbient(Ambient):
         xml: str | None = None,
         namespaces: dict[str, str] | None = None,
         xml_state: XMLState | None = None,
+        read_workers: int = 0,
+        change_log_size: int = 0,
+        select_format: str = "c14n",
+        journal: XMLJournal | None = None,
+        profiler: XMLProfiler | None = None,
+        xpath_budget: float | None = None,
+        indexes: Sequence[str] | None = None,
         **kwargs: dict[str, Any],
     ):
         """Constructor.
@@ -30,6 +49,13 @@ class XMLAmbient(Ambient):
             xml (str | None, optional): initial xml data. Defaults to <xml></xml>.
             namespaces (dict[str, str], optional): namespace map associated with the initial `xml` data. Defaults to an empty dict.
             xml_state (XMLState | None, optional): XMLState to use as the underlying state. Defaults to using `star_ray_xml._XMLState` with the arguments `xml` and `namespaces` as provided.
+            read_workers (int, optional): number of threads used to execute read-only actions concurrently in `execute_many`. Defaults to 0, in which case all actions are executed in the calling thread.
+            change_log_size (int, optional): maximum number of changes that the default `xml_state` will record, this is required for `SelectChanges` queries (e.g. by an incremental `XMLSensor`). Defaults to 0, in which case changes are not recorded.
+            select_format (str, optional): format of elements selected from the default `xml_state` by `Select` queries that do not specify a format, one of "c14n", "xml", "bytes" or "dict" (see `Select`). Defaults to "c14n".
+            journal (XMLJournal | None, optional): journal to which every successful write action is appended, this can be used to audit or replay a run (see `XMLJournal`). Write actions are executed atomically (see `_XMLState.transaction`) so that an action that fails, and so is not journaled, leaves the default `xml_state` unchanged. If a write action cannot be appended (e.g. the journal file cannot be written) the error is logged and the observation of the action is unaffected, the journal then fails and no further actions are journaled (see `XMLJournal.error`). The journal is closed when this ambient terminates. Defaults to None.
+            profiler (XMLProfiler | None, optional): profiler that records the time taken by each action (see `XMLProfiler`), it is also given to the `xml_state` if it is an `_XMLState`. Defaults to None, in which case actions are not profiled.
+            xpath_budget (float | None, optional): maximum estimated cost of each xpath evaluated by the default `xml_state`, actions with more expensive xpaths (e.g. `//*[contains(@id, 'a')]` in a large document) fail with `XPathCostExceeded` rather than stalling other agents (see `_XMLState`). Defaults to None, in which case there is no maximum.
+            indexes (Sequence[str] | None, optional): secondary indexes that the default `xml_state` maintains in addition to the id index, e.g. ["tag", "@class"] (see `_XMLState`). Defaults to None, in which case there are no secondary indexes.
             kwargs (dict[str, Any]): Additional optional arguments.
         """
         super().__init__(agents)
@@ -38,11 +64,33 @@ class XMLAmbient(Ambient):
             self._state = _XMLState(
                 xml if xml else DEFAULT_XML,
                 namespaces=namespaces if namespaces else DEFAULT_NAMESPACES,
+                change_log_size=change_log_size,
+                select_format=select_format,
+                xpath_budget=xpath_budget,
+                indexes=indexes,
             )
         else:
             assert xml is None  # set these directly on the `xml_state`
             assert namespaces is None  # set these directly on the `xml_state`
             self._state = xml_state
+        self._profiler = profiler
+        if profiler is not None and isinstance(self._state, _XMLState):
+            self._state.profiler = profiler
+        self._subscriptions = _SubscriptionIndex()
+        self._journal = journal
+        self._executor = None
+        if read_workers > 0:
+            self._executor = ThreadPoolExecutor(
+                max_workers=read_workers, thread_name_prefix="XMLAmbient"
+            )
+
+    async def __terminate__(self) -> None:  # noqa: D105
+        await super().__terminate__()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        if self._journal is not None:
+            self._journal.close()
+        self._state.close()
 
     def get_state(self) -> XMLState:
         """Get the underlying `XMLState`, this should be read only and NEVER modified without a call to `__update__` to prevent unexpected issues.
@@ -68,7 +116,7 @@ class XMLAmbient(Ambient):
         """
         try:
             if isinstance(action, XMLQuery) and action.is_read:
-                values = action.__execute__(self._state)
+                values = self._execute(action)
                 if (
                     values is not None
                 ):  # TODO typically the result wont be None... perhaps something has gone wrong if it does?
@@ -94,29 +142,316 @@ class XMLAmbient(Ambient):
             ActiveObservation | ErrorActiveObservation | None: the resulting observation
         """
         try:
-            values = action.__execute__(self._state)
-            if values is not None:
-                return ActiveObservation(action_id=action, values=values)
+            before = self._select_filters([action])
+            with self._track_modified() as modified, self._atomic(action):
+                values = self._execute(action)
         except Exception as e:
             return ErrorActiveObservation.from_exception(action, e)
+        # the write has taken place, the observation must not report an error
+        if self._journal is not None and action.is_write:
+            self._append([action])
+        self._publish([action], [values], modified, before)
+        if values is not None:
+            return ActiveObservation(action_id=action, values=values)
+
+    def _execute(self, action: XMLQuery) -> Any:
+        if self._profiler is None:
+            return action.__execute__(self._state)
+        with self._profiler.profile(action):
+            return action.__execute__(self._state)
+
+    def execute_many(
+        self, actions: list[XMLQuery]
+    ) -> list[ActiveObservation | ErrorActiveObservation | None]:
+        """Execute a batch of actions (e.g. all of the actions taken in a cycle) in order in a single pass, see `XMLState.execute_many` for details. This avoids much of the per-action overhead of `__select__` and `__update__`. If this ambient was created with `read_workers` then consecutive read-only actions are executed concurrently, write actions are always executed in order once all preceding reads have completed.
+
+        Args:
+            actions (list[XMLQuery]): the actions to execute, these may be read or write actions.
+
+        Returns:
+            list[ActiveObservation | ErrorActiveObservation | None]: the resulting observation of each action (in the same order as `actions`). As with `__update__`, the observation will be None for an action that produced no result.
+
+        Subscribers are notified once the whole batch has been executed. Xpath subscriptions are matched against all of the elements modified by the batch, a matching subscriber is notified of every successful write action in the batch.
+        """
+        return self._execute_many(actions, self._executor)
 
-    def __subscribe__(  # TODO perhaps this should be supported... why isn't it?
+    def _execute_many(
+        self, actions: list[XMLQuery], executor: Executor | None
+    ) -> list[ActiveObservation | ErrorActiveObservation | None]:
+        queries = [action for action in actions if isinstance(action, XMLQuery)]
+        before = self._select_filters(queries)
+        with self._track_modified() as modified:
+            if self._journal is not None and isinstance(self._state, _XMLState):
+                # see `_atomic`
+                results = self._state.execute_many(
+                    queries, executor=executor, atomic=True
+                )
+            else:
+                results = self._state.execute_many(queries, executor=executor)
+        if self._journal is not None:
+            self._append(
+                [
+                    query
+                    for query, result in zip(queries, results)
+                    if query.is_write and not isinstance(result, Exception)
+                ]
+            )
+        self._publish(queries, results, modified, before)
+        if len(queries) != len(actions):
+            results = iter(results)
+            results = [
+                next(results)
+                if isinstance(action, XMLQuery)
+                else ValueError(
+                    f"{action} does not derive from required type:`{XMLQuery}`"
+                )
+                for action in actions
+            ]
+        return [
+            XMLAmbient._new_observation(action, values)
+            for action, values in zip(actions, results)
+        ]
+
+    @staticmethod
+    def _new_observation(
+        action: XMLQuery, values: Any
+    ) -> ActiveObservation | ErrorActiveObservation | None:
+        if values is None:
+            return None
+        elif isinstance(values, Exception):
+            return ErrorActiveObservation.from_exception(action, values)
+        else:
+            return ActiveObservation(action_id=action, values=values)
+
+    def __subscribe__(
         self, action: Subscribe | Unsubscribe
     ) -> ActiveObservation | ErrorActiveObservation:
-        """Subscribe to receive events from this ambient. THIS IS NOT SUPPORTED by `XMLAmbient`. If you wish to subscribe to receive XML related events subclass `XMLAmbient` and implement publishing of actions.
+        """Subscribe to (or unsubscribe from) receive write actions that are executed in this ambient, see class documentation for details of the supported topics.
 
         Args:
             action (Subscribe | Unsubscribe): action to execute
 
         Raises:
-            ValueError: if this method is called, it is not a supported operation.
+            ValueError: if the subscription is not valid.
 
         Returns:
-            ActiveObservation | ErrorActiveObservation: _description_
+            ActiveObservation | ErrorActiveObservation: an empty observation if the subscription was successful.
         """
         try:
+            if action.subscriber is None:
+                raise ValueError(f"{action} does not specify a subscriber.")
+            namespaces = dict()
+            if isinstance(action.topic, str):
+                if not isinstance(self._state, _XMLState):
+                    raise ValueError(
+                        f"Xpath subscriptions are not supported by state of type: `{type(self._state).__name__}`."
+                    )
+                namespaces = self._state.get_namespaces()
+                if isinstance(action, Subscribe):
+                    self._state.xpath(action.topic)  # check that the xpath is valid
+            if isinstance(action, Subscribe):
+                self._subscriptions.subscribe(
+                    action.topic, action.subscriber, namespaces
+                )
+            else:
+                self._subscriptions.unsubscribe(
+                    action.topic, action.subscriber, namespaces
+                )
+            return ActiveObservation(action_id=action)
+        except Exception as e:
+            return ErrorActiveObservation.from_exception(action, e)
+
+    def _atomic(self, action: XMLQuery):
+        # only successful writes are journaled, a write that fails must therefore leave the state unchanged (e.g. an update that fails part way through its elements) otherwise replaying the journal would diverge from the state
+        if (
+            self._journal is not None
+            and action.is_write
+            and isinstance(self._state, _XMLState)
+        ):
+            return self._state.transaction()
+        return nullcontext()
+
+    def _track_modified(self):
+        # elements only need to be tracked if there are xpath subscriptions
+        if self._subscriptions.has_filters:
+            return self._state._track_modified()
+        return nullcontext()
+
+    def _select_filters(self, queries: list[XMLQuery]) -> dict[str, Any] | None:
+        # xpath filters are evaluated before writes so that elements that are no longer selected after the writes (e.g. they were deleted) are also matched
+        if not self._subscriptions.has_filters or not any(
+            query.is_write for query in queries
+        ):
+            return None
+        return self._subscriptions.select_filters(self._state.xpath)
+
+    def _publish(
+        self,
+        queries: list[XMLQuery],
+        results: list[Any],
+        modified: list[Any] | None,
+        before: dict[str, Any] | None = None,
+    ):
+        if not self._subscriptions:
+            return
+        writes = [
+            query
+            for query, result in zip(queries, results)
+            if query.is_write and not isinstance(result, Exception)
+        ]
+        if not writes:
+            return
+        filtered = dict()
+        if modified:
+            filtered = self._subscriptions.match_filters(
+                modified, self._state.xpath, before
+            )
+        for query in writes:
+            subscribers = self._subscriptions.match_type(query)
+            subscribers.update(filtered)
+            for subscriber in subscribers.values():
+                try:
+                    subscriber.__notify__(query)
+                except ValueError:
+                    # the subscriber was garbage collected before unsubscribing
+                    self._subscriptions.remove(subscriber)
+                except Exception:
+                    # the write has taken place, a failing subscriber must not prevent the others from being notified
+                    _LOGGER.exception(f"Failed to notify subscriber: {subscriber}")
+
+    def _append(self, queries: list[XMLQuery]):
+        try:
+            self._journal.append(queries)
+        except Exception:
+            # the write has taken place, the observation must not report an error. The journal has failed and will not accept further queries (see `XMLJournal`)
+            _LOGGER.exception(f"Failed to append to journal: {self._journal}")
+
+
+class AsyncXMLAmbient(XMLAmbient):
+    """An `XMLAmbient` for use with `asyncio`, it provides awaitable versions of `__select__`, `__update__` and `execute_many` that do not block the event loop.
+
+    The work of each action (xpath evaluation, serialisation, etc.) is done in a thread pool. Read-only actions may overlap with each other, but never with a write action. Actions are started in the order they are awaited, write actions are therefore applied in order and a read that is awaited after a write will observe its effects.
+
+    Each action may be given a `timeout`, if the action does not complete in time the resulting observation will be an `ErrorActiveObservation` (wrapping a `TimeoutError`). Actions may also be cancelled (e.g. via `asyncio.Task.cancel`). Note that once an action has started it will run to completion (its effect on the state cannot be undone), a timeout or cancellation only stops the caller from waiting for it.
+
+    The synchronous `__select__`, `__update__` and `execute_many` methods should not be used while awaitable actions are running.
+    """
+
+    def __init__(
+        self,
+        agents: list[Agent],
+        xml: str | None = None,
+        namespaces: dict[str, str] | None = None,
+        xml_state: XMLState | None = None,
+        read_workers: int = 4,
+        **kwargs: dict[str, Any],
+    ):
+        """Constructor.
+
+        Args:
+            agents (list[Agent]): list of agents to add to this `Ambient` initially.
+            xml (str | None, optional): initial xml data. Defaults to <xml></xml>.
+            namespaces (dict[str, str], optional): namespace map associated with the initial `xml` data. Defaults to an empty dict.
+            xml_state (XMLState | None, optional): XMLState to use as the underlying state. Defaults to using `star_ray_xml._XMLState` with the arguments `xml` and `namespaces` as provided.
+            read_workers (int, optional): number of threads used to execute actions, this is the maximum number of read-only actions that may run at once. Defaults to 4.
+            kwargs (dict[str, Any]): Additional optional arguments.
+        """
+        if read_workers < 1:
             raise ValueError(
-                f"`star_ray` pub-sub is not supported by ambient of type: `{XMLAmbient}`."
+                f"`read_workers` must be at least 1, received: {read_workers}"
             )
-        except Exception as e:
+        super().__init__(
+            agents,
+            xml=xml,
+            namespaces=namespaces,
+            xml_state=xml_state,
+            read_workers=read_workers,
+            **kwargs,
+        )
+        self._lock = _AsyncReadWriteLock()
+
+    async def __aselect__(
+        self, action: XMLQuery | Subscribe | Unsubscribe, timeout: float | None = None
+    ) -> ActiveObservation | ErrorActiveObservation:
+        """Awaitable version of `__select__`.
+
+        Args:
+            action (XMLQuery | Subscribe | Unsubscribe): action to execute.
+            timeout (float | None, optional): maximum time (in seconds) to wait for the action to complete. Defaults to None (no timeout).
+
+        Returns:
+            ActiveObservation | ErrorActiveObservation: the resulting observation.
+        """
+        if isinstance(action, Subscribe | Unsubscribe):
+            return self.__subscribe__(action)
+        return await self._run(action, self.__select__, (action,), False, timeout)
+
+    async def __aupdate__(
+        self, action: XMLQuery, timeout: float | None = None
+    ) -> ActiveObservation | ErrorActiveObservation | None:
+        """Awaitable version of `__update__`.
+
+        Args:
+            action (XMLQuery): action to execute.
+            timeout (float | None, optional): maximum time (in seconds) to wait for the action to complete. Defaults to None (no timeout).
+
+        Returns:
+            ActiveObservation | ErrorActiveObservation | None: the resulting observation.
+        """
+        return await self._run(action, self.__update__, (action,), True, timeout)
+
+    async def aexecute_many(
+        self, actions: list[XMLQuery], timeout: float | None = None
+    ) -> list[ActiveObservation | ErrorActiveObservation | None]:
+        """Awaitable version of `execute_many`, the batch is treated as a single read-only action if all of its actions are read-only, otherwise it is treated as a single write action.
+
+        Args:
+            actions (list[XMLQuery]): the actions to execute.
+            timeout (float | None, optional): maximum time (in seconds) to wait for the whole batch to complete. Defaults to None (no timeout).
+
+        Returns:
+            list[ActiveObservation | ErrorActiveObservation | None]: the resulting observation of each action (in the same order as `actions`), if the batch timed out each observation will be an `ErrorActiveObservation`.
+        """
+        write = not all(
+            isinstance(action, XMLQuery) and action.is_read for action in actions
+        )
+        # the batch is executed in a single thread, it must not wait on the same executor
+        result = await self._run(
+            None, self._execute_many, (actions, None), write, timeout
+        )
+        if isinstance(result, TimeoutError | asyncio.TimeoutError):
+            return [
+                ErrorActiveObservation.from_exception(action, result)
+                for action in actions
+            ]
+        return result
+
+    async def _run(
+        self,
+        action: XMLQuery | None,
+        fun: Callable[..., Any],
+        args: tuple[Any, ...],
+        write: bool,
+        timeout: float | None,
+    ):
+        try:
+            return await asyncio.wait_for(self._run_locked(fun, args, write), timeout)
+        except (TimeoutError, asyncio.TimeoutError) as e:
+            if action is None:
+                return e
             return ErrorActiveObservation.from_exception(action, e)
+
+    async def _run_locked(
+        self, fun: Callable[..., Any], args: tuple[Any, ...], write: bool
+    ):
+        await self._lock.acquire(write)
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                self._executor, fun, *args
+            )
+        except BaseException:
+            self._lock.release(write)
+            raise
+        # the lock is held until the work is complete, even if the caller stops waiting
+        future.add_done_callback(lambda _: self._lock.release(write))
+        return await asyncio.shield(future)
@@ -0,0 +1,239 @@
+"""Defines the `XMLCodec` class, a compact binary encoding of `XMLQuery` events and their observations for sending them between processes.
+
+The encoding is based on [msgpack](https://msgpack.org/) which must be installed to use the codec (`pip install star-ray-xml[codec]`). Each event is encoded as an array containing a code that identifies its type followed by the values of its fields, field names are not included. Both ends must therefore agree on the types that are registered with the codec (and their definitions).
+"""
+
+from typing import Any
+from collections.abc import Callable
+from pydantic import BaseModel
+from star_ray.event import ActiveObservation, ErrorActiveObservation
+
+# msgpack is optional, it is only required to use `XMLCodec`
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from .query import (
+    _constructor,
+    Expr,
+    Select,
+    SelectStream,
+    SelectChanges,
+    Update,
+    Insert,
+    InsertMany,
+    Delete,
+    Replace,
+)
+
+__all__ = ("XMLCodec",)
+
+# types that are registered with every codec, see `XMLCodec.register`
+_DEFAULT_TYPES = {
+    1: Select,
+    2: SelectStream,
+    3: SelectChanges,
+    4: Update,
+    5: Insert,
+    6: Delete,
+    7: Replace,
+    8: InsertMany,
+    16: ActiveObservation,
+    17: ErrorActiveObservation,
+}
+# codes below this are reserved for the default types
+MIN_USER_CODE = 64
+
+# msgpack extension types
+_EXT_EXPR = 1
+_EXT_SET = 2
+
+
+class XMLCodec:
+    """Compact binary codec for `XMLQuery` events (e.g. `Select`, `Update`) and the observations that result from them (`ActiveObservation`, `ErrorActiveObservation`).
+
+    Decoding validates each event as usual (as if it were created from a dict of its fields). If the data comes from a trusted peer (e.g. another process that is running the same code, and that encoded the events with this codec) validation can be skipped by creating the codec with `trusted=True`, this is much faster.
+
+    Observation values may consist of python literals (None, bool, int, float, str, bytes, list, dict, set), tuples are decoded as lists. Other values cannot be encoded, with the exception of the arguments of an `ErrorActiveObservation` which are encoded as strings.
+
+    Example:
+        ```
+        codec = XMLCodec()
+        data = codec.encode(Update(xpath="//*[@id='a']", attrs={"x": Expr("{x} + 1")}))
+        action = codec.decode(data)
+        ```
+    """
+
+    def __init__(self, trusted: bool = False):
+        """Constructor.
+
+        Args:
+            trusted (bool, optional): whether the data to decode is trusted, if so decoded events are not validated. Defaults to False.
+
+        Raises:
+            ImportError: if `msgpack` is not installed.
+        """
+        super().__init__()
+        if msgpack is None:
+            raise ImportError(
+                f"`{XMLCodec.__name__}` requires the `msgpack` package, install it with: `pip install star-ray-xml[codec]`"
+            )
+        self._trusted = trusted
+        self._types: dict[int, type[BaseModel]] = dict()
+        self._codes: dict[type[BaseModel], int] = dict()
+        self._fields: dict[type[BaseModel], tuple[str, ...]] = dict()
+        self._constructors: dict[int, Callable[[dict[str, Any]], BaseModel]] = dict()
+        self._expr_constructor = (
+            _constructor(Expr) if self._trusted else Expr.model_validate
+        )
+        for code, cls in _DEFAULT_TYPES.items():
+            self._register(cls, code)
+        self._packer = msgpack.Packer(default=self._default, use_bin_type=True)
+        self._error_packer = msgpack.Packer(
+            default=self._default_error, use_bin_type=True
+        )
+
+    @property
+    def trusted(self) -> bool:
+        """Whether the data to decode is trusted, if so decoded events are not validated."""
+        return self._trusted
+
+    def register(self, cls: type[BaseModel], code: int) -> None:
+        """Register an event type with this codec, e.g. a custom `XMLQuery`. The same type must be registered with the same code by the codec that decodes the data.
+
+        Args:
+            cls (type[BaseModel]): the event type.
+            code (int): the code that identifies the type, must be at least `MIN_USER_CODE` (lower codes are reserved).
+
+        Raises:
+            ValueError: if the code is reserved or already in use, or if the type is already registered.
+        """
+        if code < MIN_USER_CODE:
+            raise ValueError(
+                f"Codes less than {MIN_USER_CODE} are reserved, received: {code}"
+            )
+        if code in self._types:
+            raise ValueError(
+                f"Code {code} is already in use by: `{self._types[code].__name__}`"
+            )
+        if cls in self._codes:
+            raise ValueError(f"`{cls.__name__}` is already registered.")
+        self._register(cls, code)
+
+    def _register(self, cls: type[BaseModel], code: int):
+        self._types[code] = cls
+        self._codes[cls] = code
+        self._fields[cls] = tuple(cls.model_fields)
+        if self._trusted:
+            self._constructors[code] = _constructor(cls)
+        else:
+            self._constructors[code] = cls.model_validate
+
+    def encode(self, event: BaseModel) -> bytes:
+        """Encode an event.
+
+        Args:
+            event (BaseModel): the event, its type must be registered with this codec.
+
+        Raises:
+            TypeError: if the type of the event (or one of its values) is not supported.
+
+        Returns:
+            bytes: the encoded event.
+        """
+        return self._packer.pack(self._to_array(event))
+
+    def encode_many(self, events: list[BaseModel]) -> bytes:
+        """Encode a list of events, this is more efficient than encoding each event separately.
+
+        Args:
+            events (list[BaseModel]): the events, their types must be registered with this codec.
+
+        Raises:
+            TypeError: if the type of an event (or one of its values) is not supported.
+
+        Returns:
+            bytes: the encoded events.
+        """
+        return self._packer.pack([self._to_array(event) for event in events])
+
+    def decode(self, data: bytes) -> BaseModel:
+        """Decode an event that was encoded with `encode`.
+
+        Args:
+            data (bytes): the encoded event.
+
+        Raises:
+            ValueError: if the data is not a valid event.
+
+        Returns:
+            BaseModel: the event.
+        """
+        return self._from_array(self._unpack(data))
+
+    def decode_many(self, data: bytes) -> list[BaseModel]:
+        """Decode a list of events that was encoded with `encode_many`.
+
+        Args:
+            data (bytes): the encoded events.
+
+        Raises:
+            ValueError: if the data is not a valid list of events.
+
+        Returns:
+            list[BaseModel]: the events.
+        """
+        return [self._from_array(array) for array in self._unpack(data)]
+
+    def _to_array(self, event: BaseModel) -> list[Any]:
+        cls = type(event)
+        code = self._codes.get(cls, None)
+        if code is None:
+            raise TypeError(
+                f"Failed to encode event of type: `{cls.__name__}`, it is not registered."
+            )
+        array = [code]
+        array.extend(getattr(event, field) for field in self._fields[cls])
+        if cls is ErrorActiveObservation:
+            # exception arguments are not restricted to literals
+            i = self._fields[cls].index("exception_args") + 1
+            array[i] = msgpack.ExtType(0, self._error_packer.pack(array[i]))
+        return array
+
+    def _from_array(self, array: list[Any]) -> BaseModel:
+        try:
+            code = array[0]
+            data = dict(zip(self._fields[self._types[code]], array[1:]))
+        except (KeyError, IndexError, TypeError):
+            raise ValueError("Failed to decode event, the data is not valid.")
+        return self._constructors[code](data)
+
+    def _unpack(self, data: bytes) -> Any:
+        try:
+            return msgpack.unpackb(
+                data, ext_hook=self._ext_hook, raw=False, strict_map_key=False
+            )
+        except (msgpack.UnpackException, ValueError) as e:
+            raise ValueError(f"Failed to decode event: {e}") from e
+
+    def _default(self, value: Any) -> Any:
+        if isinstance(value, Expr):
+            return msgpack.ExtType(_EXT_EXPR, value.expr.encode("utf-8"))
+        elif isinstance(value, set | frozenset):
+            # a packer cannot be used while it is packing
+            data = msgpack.packb(list(value), default=self._default, use_bin_type=True)
+            return msgpack.ExtType(_EXT_SET, data)
+        raise TypeError(f"Failed to encode value of type: `{type(value).__name__}`")
+
+    def _default_error(self, value: Any) -> Any:
+        return str(value)
+
+    def _ext_hook(self, code: int, data: bytes) -> Any:
+        if code == _EXT_EXPR:
+            return self._expr_constructor(dict(expr=data.decode("utf-8")))
+        elif code == _EXT_SET:
+            return set(self._unpack(data))
+        elif code == 0:
+            return self._unpack(data)  # see `_to_array`
+        raise ValueError(f"Unknown extension type: {code}")
@@ -0,0 +1,235 @@
+"""Defines the `XMLJournal` class, a record of the write queries that were executed by an `XMLAmbient` which can be used to audit or replay a run."""
+
+import os
+from threading import Lock
+from typing import IO, Any
+from collections.abc import Iterator
+from itertools import islice
+
+from .query import XMLQuery, Update, Insert, InsertMany, Delete, Replace
+from .state import _XMLState
+from ._persist import _truncate_incomplete
+
+__all__ = ("XMLJournal",)
+
+# fsync policies, see `XMLJournal`
+NEVER = "never"
+FLUSH = "flush"
+ALWAYS = "always"
+FSYNC_POLICIES = (NEVER, FLUSH, ALWAYS)
+
+# query types that can be read from a journal by default, see `XMLJournal.read`
+_DEFAULT_TYPES = (Update, Insert, InsertMany, Delete, Replace)
+
+
+class XMLJournal:
+    """An append-only file of write queries (e.g. `Update`, `Insert`), typically those that were successfully executed by an `XMLAmbient` (see its `journal` argument). Replaying the queries in order against the initial xml data will rebuild the state (see `replay`).
+
+    Each query is written as a single line containing the name of its type and its JSON representation (see `pydantic.BaseModel.model_dump_json`), the file can therefore be inspected with standard tools.
+
+    Queries are buffered in memory and written to the file in batches, once `buffer_size` bytes have been buffered or when `flush` (or `close`) is called. When the data is forced to disk (`os.fsync`) depends on the `fsync` policy:
+    - "never": data is only passed to the operating system, changes are lost only if the machine fails (or if the process fails before the buffer is written).
+    - "flush": each time the buffer is written.
+    - "always": every call to `append` writes the buffer and waits for the data to reach the disk, this is the safest but slowest policy.
+
+    If queries cannot be appended (e.g. a query cannot be serialized or the file cannot be written) the journal fails (see `error`), every later call to `append` raises an exception. A journal with a gap could not be replayed, the file instead keeps the queries that were appended before the failure (an incomplete last line, left by a failed write, is ignored by `read`) and so can still be replayed up to that point.
+
+    Example:
+        ```
+        journal = XMLJournal("run.journal")
+        ambient = XMLAmbient(agents, xml=xml, journal=journal)
+        ...
+        journal.close()
+        state = XMLJournal.replay("run.journal", xml)
+        ```
+    """
+
+    def __init__(
+        self,
+        path: str,
+        buffer_size: int = 65536,
+        fsync: str = NEVER,
+        truncate: bool = False,
+    ):
+        """Constructor.
+
+        Args:
+            path (str): path of the journal file, queries are appended to the file if it already exists.
+            buffer_size (int, optional): number of bytes to buffer before writing to the file. Defaults to 65536.
+            fsync (str, optional): when the data is forced to disk, one of: "never", "flush", "always" (see class documentation). Defaults to "never".
+            truncate (bool, optional): whether to remove existing queries from the file. Defaults to False.
+
+        Raises:
+            ValueError: if `fsync` is unknown.
+        """
+        super().__init__()
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(
+                f"Unknown `fsync` policy: `{fsync}`, must be one of: {FSYNC_POLICIES}"
+            )
+        self._path = path
+        self._buffer_size = buffer_size
+        self._fsync = fsync
+        self._buffer: list[bytes] = []
+        self._buffered = 0
+        self._error: Exception | None = None
+        self._lock = Lock()
+        self._file: IO[bytes] = open(path, "wb" if truncate else "a+b")
+        if not truncate:
+            _truncate_incomplete(self._file)
+
+    @property
+    def path(self) -> str:
+        """Path of the journal file."""
+        return self._path
+
+    @property
+    def error(self) -> Exception | None:
+        """The exception that caused the journal to fail, or None if it has not failed (see class documentation)."""
+        return self._error
+
+    def append(self, queries: list[XMLQuery]) -> None:
+        """Append queries to the journal.
+
+        Args:
+            queries (list[XMLQuery]): the queries.
+
+        Raises:
+            RuntimeError: if the journal has already failed.
+            Exception: if the queries could not be appended (e.g. a query could not be serialized, or an `OSError` if the file could not be written), the journal then fails.
+        """
+        if not queries:
+            return
+        try:
+            lines = [
+                b"%s\t%s\n"
+                % (
+                    type(query).__name__.encode("utf-8"),
+                    query.model_dump_json().encode("utf-8"),
+                )
+                for query in queries
+            ]
+        except Exception as e:
+            with self._lock:
+                self._check()
+                self._fail(e, written=False)
+            raise
+        with self._lock:
+            self._check()
+            self._buffer.extend(lines)
+            self._buffered += sum(len(line) for line in lines)
+            if self._fsync == ALWAYS or self._buffered >= self._buffer_size:
+                try:
+                    self._flush()
+                except Exception as e:
+                    self._fail(e, written=True)
+                    raise
+
+    def _check(self):
+        if self._error is not None:
+            raise RuntimeError(
+                f"Failed to append to journal: `{self._path}`, it failed previously (see `error`)."
+            ) from self._error
+
+    def _fail(self, error: Exception, written: bool):
+        # `written` is whether the failure occurred while writing the buffer, in which case the file may be incomplete and nothing more is written. Otherwise the queries that were appended before the failure are still written.
+        self._error = error
+        if not written:
+            try:
+                self._flush()
+            except Exception:
+                pass  # the original error is raised
+        self._buffer.clear()
+        self._buffered = 0
+
+    def flush(self) -> None:
+        """Write all buffered queries to the file, nothing is written if the journal has failed."""
+        with self._lock:
+            if self._error is None:
+                self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            self._file.write(b"".join(self._buffer))
+            self._buffer.clear()
+            self._buffered = 0
+        self._file.flush()
+        if self._fsync != NEVER:
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        """Write all buffered queries and close the file."""
+        with self._lock:
+            if not self._file.closed:
+                try:
+                    if self._error is None:
+                        self._flush()
+                finally:
+                    self._file.close()
+
+    @staticmethod
+    def read(
+        path: str, types: list[type[XMLQuery]] | None = None
+    ) -> Iterator[XMLQuery]:
+        """Read the queries in a journal file. An incomplete last line (e.g. if the process was terminated while writing) is ignored.
+
+        Args:
+            path (str): path of the journal file.
+            types (list[type[XMLQuery]] | None, optional): additional query types that may appear in the journal (e.g. custom write queries), the primitive write queries are always supported. Defaults to None.
+
+        Raises:
+            ValueError: if the journal contains an unknown query type or an invalid query.
+
+        Yields:
+            XMLQuery: the queries (in the order they were appended).
+        """
+        classes = {cls.__name__: cls for cls in _DEFAULT_TYPES}
+        if types is not None:
+            classes.update((cls.__name__, cls) for cls in types)
+        with open(path, "rb") as file:
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break  # incomplete write
+                name, _, data = line.partition(b"\t")
+                cls = classes.get(name.decode("utf-8"), None)
+                if cls is None:
+                    raise ValueError(
+                        f"Unknown query type: `{name.decode('utf-8')}` in journal: `{path}`, it should be given in `types`."
+                    )
+                yield cls.model_validate_json(data)
+
+    @staticmethod
+    def replay(
+        path: str,
+        xml: str,
+        types: list[type[XMLQuery]] | None = None,
+        batch_size: int = 1024,
+        **kwargs: Any,
+    ) -> _XMLState:
+        """Rebuild a state by executing the queries in a journal file against the initial xml data. Queries are read lazily and executed in batches (see `_XMLState.execute_many`), the journal is never held in memory in its entirety.
+
+        Args:
+            path (str): path of the journal file.
+            xml (str): the initial xml data, this should be the same as the initial data of the journaled run.
+            types (list[type[XMLQuery]] | None, optional): additional query types that may appear in the journal, see `read`. Defaults to None.
+            batch_size (int, optional): maximum number of queries to execute in each batch. Defaults to 1024.
+            kwargs (dict[str, Any]): additional keyword arguments for the `_XMLState` constructor (e.g. `namespaces`).
+
+        Raises:
+            ValueError: if the journal is not valid, or if a query failed (the state has diverged from the journaled run).
+
+        Returns:
+            _XMLState: the state.
+        """
+        state = _XMLState(xml, **kwargs)
+        queries = XMLJournal.read(path, types=types)
+        executed = 0
+        while batch := list(islice(queries, batch_size)):
+            results = state.execute_many(batch)
+            for i, result in enumerate(results):
+                if isinstance(result, Exception):
+                    raise ValueError(
+                        f"Failed to replay query {executed + i} in journal: `{path}`"
+                    ) from result
+            executed += len(batch)
+        return state
@@ -0,0 +1,344 @@
+"""Defines the `XMLProfiler` class which records the time taken by each query that is executed against an `_XMLState` (or by an `XMLAmbient`), and the sinks (`HistogramSink`, `CallbackSink`) that the resulting `QueryProfile`s are sent to."""
+
+import bisect
+from abc import ABC, abstractmethod
+from time import perf_counter
+from threading import Lock, local
+from typing import Any, NamedTuple
+from collections.abc import Callable, Sequence
+from contextlib import nullcontext, AbstractContextManager
+
+from star_ray.utils import _LOGGER
+
+from .query import XMLQuery
+
+__all__ = (
+    "XMLProfiler",
+    "QueryProfile",
+    "ProfileSink",
+    "HistogramSink",
+    "CallbackSink",
+)
+
+# upper bounds (seconds) of the buckets of a `HistogramSink`, the last bucket is unbounded
+DEFAULT_BOUNDS = tuple(m * 10.0**e for e in range(-6, 1) for m in (1, 2, 5))
+
+# fields of `QueryProfile` that are summed by a `HistogramSink` (in this order, see `_Group.add`)
+_SUMMED = ("total_time", "xpath_time", "serialize_time", "literal_time", "elements")
+
+
+class QueryProfile(NamedTuple):
+    """The profile of a single query, see `XMLProfiler`."""
+
+    query_type: str  # name of the type of the query, e.g. "Select"
+    xpath: str | None  # xpath of the query (if it has one)
+    source: Any  # source of the query (typically the id of an agent)
+    total_time: float  # time taken to execute the query (seconds)
+    xpath_time: float  # time taken to evaluate xpaths (seconds)
+    elements: int  # number of elements (or other results) matched by xpaths
+    serialize_time: float  # time taken to serialize selected elements (seconds)
+    literal_time: float  # time taken to decode selected attribute values and literal results (seconds)
+    failed: bool  # whether the query raised an exception
+
+
+class ProfileSink(ABC):
+    """Base class for sinks that receive the profile of each query from an `XMLProfiler`. Sinks may receive profiles from multiple threads at once."""
+
+    @abstractmethod
+    def record(self, profile: QueryProfile) -> None:
+        """Receive the profile of a query.
+
+        Args:
+            profile (QueryProfile): the profile.
+        """
+        pass
+
+
+class CallbackSink(ProfileSink):
+    """Sink that calls a function with the profile of each query, e.g. to log slow queries."""
+
+    def __init__(self, callback: Callable[[QueryProfile], None]):
+        """Constructor.
+
+        Args:
+            callback (Callable[[QueryProfile], None]): function to call with each profile.
+        """
+        super().__init__()
+        self._callback = callback
+
+    def record(self, profile: QueryProfile) -> None:  # noqa: D102
+        self._callback(profile)
+
+
+class HistogramSink(ProfileSink):
+    """Sink that aggregates profiles in memory. Profiles are grouped by the values of some of their fields (by default, the type and xpath of the query). For each group the number of queries, the sum of each time (and of the number of elements), the maximum time and a histogram of the times are kept.
+
+    Example:
+        ```
+        sink = HistogramSink()
+        ambient = XMLAmbient(agents, xml=xml, profiler=XMLProfiler([sink]))
+        ...
+        print(sink.report(10))  # the 10 xpaths that took the most time
+        ```
+    """
+
+    def __init__(
+        self,
+        group_by: Sequence[str] = ("query_type", "xpath"),
+        bounds: Sequence[float] = DEFAULT_BOUNDS,
+    ):
+        """Constructor.
+
+        Args:
+            group_by (Sequence[str], optional): fields of `QueryProfile` to group profiles by, e.g. ("source",) to group by agent. Defaults to ("query_type", "xpath").
+            bounds (Sequence[float], optional): increasing upper bounds (seconds) of the buckets of each histogram, times greater than the last bound are counted in an additional bucket. Defaults to 1, 2 and 5 times each power of 10 from 1 microsecond to 1 second.
+
+        Raises:
+            ValueError: if a field in `group_by` is unknown.
+        """
+        super().__init__()
+        for field in group_by:
+            if field not in QueryProfile._fields:
+                raise ValueError(
+                    f"Unknown field: `{field}`, must be one of: {QueryProfile._fields}"
+                )
+        self._group_by = tuple(QueryProfile._fields.index(f) for f in group_by)
+        self._group_names = tuple(group_by)
+        self._bounds = list(bounds)
+        self._groups: dict[tuple, _Group] = dict()
+        self._lock = Lock()
+
+    def record(self, profile: QueryProfile) -> None:  # noqa: D102
+        key = tuple(profile[i] for i in self._group_by)
+        bucket = bisect.bisect_left(self._bounds, profile.total_time)
+        with self._lock:
+            group = self._groups.get(key, None)
+            if group is None:
+                group = _Group(len(self._bounds) + 1)
+                self._groups[key] = group
+            group.add(profile, bucket)
+
+    def clear(self) -> None:
+        """Remove all recorded profiles."""
+        with self._lock:
+            self._groups.clear()
+
+    def get_stats(self) -> list[dict[str, Any]]:
+        """Get the aggregated profiles of each group.
+
+        Returns:
+            list[dict[str, Any]]: for each group, the values of the `group_by` fields along with: `count`, `failures`, `max_time`, `mean_time`, the sums `total_time`, `xpath_time`, `serialize_time`, `literal_time` and `elements`, an estimate of the median and 99th percentile time (`p50`, `p99`, the upper bound of the bucket that contains them) and the `histogram` as a list of (upper bound, count).
+        """
+        with self._lock:
+            groups = [(key, group.copy()) for key, group in self._groups.items()]
+        bounds = self._bounds + [float("inf")]
+        stats = []
+        for key, group in groups:
+            count, histogram = group.count, group.histogram
+            stat = dict(zip(self._group_names, key))
+            stat.update(count=count, failures=group.failures, max_time=group.max_time)
+            stat.update(zip(_SUMMED, group.sums))
+            stat["mean_time"] = stat["total_time"] / count
+            stat["p50"] = HistogramSink._quantile(histogram, bounds, count, 0.5)
+            stat["p99"] = HistogramSink._quantile(histogram, bounds, count, 0.99)
+            stat["histogram"] = list(zip(bounds, histogram))
+            stats.append(stat)
+        return stats
+
+    @staticmethod
+    def _quantile(
+        histogram: list[int], bounds: list[float], count: int, q: float
+    ) -> float:
+        target = q * count
+        seen = 0
+        for bound, n in zip(bounds, histogram):
+            seen += n
+            if seen >= target:
+                return bound
+        return bounds[-1]
+
+    def top(self, n: int = 10, key: str = "total_time") -> list[dict[str, Any]]:
+        """Get the aggregated profiles of the groups with the greatest value of `key` (see `get_stats`).
+
+        Args:
+            n (int, optional): maximum number of groups. Defaults to 10.
+            key (str, optional): value to order groups by, e.g. "total_time", "mean_time", "max_time" or "count". Defaults to "total_time".
+
+        Returns:
+            list[dict[str, Any]]: the aggregated profiles (see `get_stats`), in decreasing order of `key`.
+        """
+        return sorted(self.get_stats(), key=lambda stat: stat[key], reverse=True)[:n]
+
+    def report(self, n: int = 10, key: str = "total_time") -> str:
+        """Get a table of the groups with the greatest value of `key`, e.g. the xpaths that took the most time.
+
+        Args:
+            n (int, optional): maximum number of groups. Defaults to 10.
+            key (str, optional): value to order groups by, see `top`. Defaults to "total_time".
+
+        Returns:
+            str: the table.
+        """
+        columns = ("count", "total_time", "mean_time", "p99", "max_time")
+        columns += ("xpath_time", "serialize_time", "literal_time", "elements")
+        lines = [
+            " ".join(f"{column:>14}" for column in columns)
+            + "".join(f" {name}" for name in self._group_names)
+        ]
+        for stat in self.top(n, key=key):
+            values = [f"{stat['count']:>14}"]
+            values.extend(f"{stat[column]:>14.6f}" for column in columns[1:-1])
+            values.append(f"{stat['elements']:>14}")
+            values.extend(str(stat[name]) for name in self._group_names)
+            lines.append(" ".join(values))
+        return "\n".join(lines)
+
+
+class _Group:
+    """Aggregated profiles of a group, see `HistogramSink`."""
+
+    __slots__ = ("count", "failures", "max_time", "sums", "histogram")
+
+    def __init__(self, buckets: int):
+        self.count = 0
+        self.failures = 0
+        self.max_time = 0.0
+        self.sums = [0] * len(_SUMMED)
+        self.histogram = [0] * buckets
+
+    def add(self, profile: QueryProfile, bucket: int):
+        self.count += 1
+        self.failures += profile.failed
+        self.max_time = max(self.max_time, profile.total_time)
+        sums = self.sums
+        sums[0] += profile.total_time
+        sums[1] += profile.xpath_time
+        sums[2] += profile.serialize_time
+        sums[3] += profile.literal_time
+        sums[4] += profile.elements
+        self.histogram[bucket] += 1
+
+    def copy(self) -> "_Group":
+        group = _Group(0)
+        group.count = self.count
+        group.failures = self.failures
+        group.max_time = self.max_time
+        group.sums = list(self.sums)
+        group.histogram = list(self.histogram)
+        return group
+
+
+class XMLProfiler:
+    """Records the time taken by each query that is executed against an `_XMLState` (see its `profiler` argument) or by an `XMLAmbient` (see its `profiler` argument), and sends the resulting `QueryProfile` to each of its sinks.
+
+    Along with the total time, the time taken to evaluate xpaths, to serialize selected elements and to decode selected attribute values (or literal xpath results) are recorded, as is the number of elements that were matched.
+
+    A query that executes other queries (e.g. a custom `XMLQuery`) is profiled as a whole, the queries that it executes are not profiled separately. Queries that are executed concurrently (e.g. by `execute_many`) are profiled separately in each thread.
+
+    Profiling is disabled by not giving a profiler, in which case the overhead is a single attribute check per query. Exceptions raised by a sink are logged, they do not affect the query or the other sinks.
+    """
+
+    def __init__(self, sinks: list[ProfileSink] | None = None):
+        """Constructor.
+
+        Args:
+            sinks (list[ProfileSink] | None, optional): sinks to send profiles to. Defaults to None, in which case sinks should be added with `add_sink`.
+        """
+        super().__init__()
+        self._sinks: list[ProfileSink] = [] if sinks is None else list(sinks)
+        self._local = local()
+
+    @property
+    def sinks(self) -> list[ProfileSink]:
+        """Sinks that profiles are sent to."""
+        return list(self._sinks)
+
+    def add_sink(self, sink: ProfileSink) -> None:
+        """Add a sink that profiles will be sent to.
+
+        Args:
+            sink (ProfileSink): the sink.
+        """
+        self._sinks.append(sink)
+
+    def remove_sink(self, sink: ProfileSink) -> None:
+        """Remove a sink, profiles will no longer be sent to it.
+
+        Args:
+            sink (ProfileSink): the sink.
+        """
+        self._sinks.remove(sink)
+
+    def profile(self, query: XMLQuery) -> AbstractContextManager["_Frame | None"]:
+        """Profile the execution of a query, the profile is sent to each sink when the context exits. If a query is already being profiled in this thread, the execution is instead attributed to that query.
+
+        Args:
+            query (XMLQuery): the query.
+
+        Returns:
+            AbstractContextManager[_Frame | None]: context in which the query is executed.
+        """
+        if getattr(self._local, "frame", None) is not None:
+            return nullcontext()
+        return _Frame(self, query)
+
+    def current(self) -> "_Frame | None":
+        """Get the profile of the query that is currently being executed in this thread, if any. Times and element counts should be added to it by the state.
+
+        Returns:
+            _Frame | None: the profile in progress.
+        """
+        return getattr(self._local, "frame", None)
+
+    def _record(self, profile: QueryProfile):
+        # a sink that fails must not cause the query to fail (or be reported as failed)
+        for sink in self._sinks:
+            try:
+                sink.record(profile)
+            except Exception:
+                _LOGGER.exception(f"Failed to record profile with sink: {sink}")
+
+
+class _Frame:
+    """A profile in progress, see `XMLProfiler.profile`."""
+
+    __slots__ = (
+        "profiler",
+        "query",
+        "start",
+        "xpath_time",
+        "elements",
+        "serialize_time",
+        "literal_time",
+    )
+
+    def __init__(self, profiler: XMLProfiler, query: XMLQuery):
+        self.profiler = profiler
+        self.query = query
+        self.xpath_time = 0.0
+        self.elements = 0
+        self.serialize_time = 0.0
+        self.literal_time = 0.0
+
+    def __enter__(self) -> "_Frame":
+        self.profiler._local.frame = self
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        total_time = perf_counter() - self.start
+        self.profiler._local.frame = None
+        query = self.query
+        profile = QueryProfile(
+            type(query).__name__,
+            getattr(query, "xpath", None),
+            getattr(query, "source", None),
+            total_time,
+            self.xpath_time,
+            self.elements,
+            self.serialize_time,
+            self.literal_time,
+            exc_type is not None,
+        )
+        self.profiler._record(profile)
+        return False
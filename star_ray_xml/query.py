@@ -3,15 +3,20 @@
 These include:
 - The `XMLQuery` class, which should be the base class for all XML queries.
 - The primitive XML queries: `Select`, `Update`, `Insert`, `Delete`, `Replace`.
+- `InsertMany`, which inserts many elements in a single query.
 """
 
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from typing import Any, TYPE_CHECKING
+from collections.abc import Callable
+from functools import cache
+from typing import Any, Literal, TYPE_CHECKING
 from pydantic import BaseModel
+from pydantic_core import PydanticUndefined
 from star_ray.event import Action
-from star_ray.utils.literal_eval import literal_eval_with_ops
+
+from ._expr import _compile_expr
 
 if TYPE_CHECKING:
     from .state import XMLState, _Element
@@ -20,12 +25,16 @@ __all__ = (
     "XMLQuery",
     "XPathQuery",
     "Select",
+    "SelectStream",
+    "SelectChanges",
     "Update",
     "Delete",
     "Replace",
     "Insert",
+    "InsertMany",
     "XMLQueryError",
     "XPathElementsNotFound",
+    "XPathCostExceeded",
 )
 
 
@@ -48,6 +57,8 @@ class Expr(BaseModel):  # TODO test this
         ```
 
     Note that special attributes (prefixed with `@`) are not currently supported.
+
+    The expression is parsed once and the parsed form is reused by every evaluation. When an `Update` matches many elements, expressions that only use arithmetic on numeric attributes are evaluated for all elements in a single vectorized pass (this requires `numpy`).
     """
 
     expr: str
@@ -65,9 +76,7 @@ class Expr(BaseModel):  # TODO test this
         Returns:
             Any: the result of the evaluation, which is typically a python literal (e.g. int, float, bool, str, list, dict).
         """
-        expr = self.expr.format_map(element.get_attributes())
-        result = literal_eval_with_ops(expr)
-        return result
+        return _compile_expr(self.expr).eval(element._base)
 
 
 class XMLQueryError(Exception):
@@ -88,6 +97,10 @@ class XPathElementsNotFound(XMLQueryError):
     """Error that indicates that an `xpath` query found no elements."""
 
 
+class XPathCostExceeded(XMLQueryError):
+    """Error that indicates that the estimated cost of an `xpath` query exceeds the budget of the state (see `_XMLState`), the xpath is not evaluated."""
+
+
 class XMLQuery(ABC, Action):
     """Base class for XML queries. Defines the `__execute__` api.
 
@@ -231,6 +244,58 @@ class Insert(XPathQuery):
         return state.insert(self)
 
 
+class InsertMany(XPathQuery):
+    """Query to insert many XML elements in a single query, this is much faster than using an `Insert` query for each element. The elements are given either as a list of fragments (one element per fragment) or as a single string containing any number of (sibling) elements, they are parsed together in a single pass of the parser and inserted as consecutive children of the parent starting at `index`.
+
+    If `fan_out` is True the elements are inserted into EVERY element found by the `xpath` (each parent receives its own copy of the elements), otherwise the `xpath` must locate exactly one parent (as with `Insert`).
+
+    GOTCHA: as with `Insert`, each element must contain all relevant namespace information and its tag (or name) should be qualified with a prefix. Unlike `Insert`, text cannot be inserted, any text between the elements becomes the tail of the preceding element.
+    """
+
+    elements: list[str] | str
+    index: int = 0
+    fan_out: bool = False
+
+    @staticmethod
+    def new(
+        xpath: str, elements: list[str] | str, index: int = 0, fan_out: bool = False
+    ):
+        """Factory method for `InsertMany` with positional arguments.
+
+        Args:
+            xpath (str): xpath used to locate the parent element(s) where the given `elements` will be inserted.
+            elements (list[str] | str): elements to insert, either a list of elements or a single string containing the (concatenated) elements.
+            index (int, optional): the index to insert the first element at. Defaults to 0.
+            fan_out (bool, optional): whether to insert the elements into every element found by the `xpath`. Defaults to False.
+
+        Returns:
+            InsertMany: insert many query.
+
+        See:
+            `insert_many` for further details.
+        """
+        return InsertMany(xpath=xpath, elements=elements, index=index, fan_out=fan_out)
+
+    @property
+    def is_read(self):  # noqa
+        return False
+
+    @property
+    def is_write(self):  # noqa
+        return True
+
+    @property
+    def is_write_tree(self):  # noqa
+        return True
+
+    @property
+    def is_write_element(self):  # noqa
+        return False
+
+    def __execute__(self, state: XMLState) -> Any:  # noqa
+        return state.insert_many(self)
+
+
 class Delete(XPathQuery):
     """Query to delete an XML element."""
 
@@ -312,17 +377,35 @@ class Replace(XPathQuery):
 
 
 class Select(XPathQuery):
-    """Query to select XML elements and their attributes."""
+    """Query to select XML elements and their attributes.
+
+    When entire elements are selected (`attrs` is None) they are serialised according to `format`:
+    - "c14n"  : canonical XML (`str`), this is the most expensive but gives the same result for equivalent elements.
+    - "xml"   : XML as written by `lxml` (`str`), this is much cheaper than "c14n" but may differ in its details (e.g. `<g/>` rather than `<g></g>`).
+    - "bytes" : as "xml" but encoded (UTF-8) `bytes`, this avoids encoding the result separately if it is to be sent elsewhere (e.g. over a socket).
+    - "dict"  : a structured representation (`dict`) containing the tag, attributes (as python literals), text and children of the element, see `_Element.as_dict`. This avoids the need to parse the result. Children are only included up to `depth`.
+
+    If `format` is None the default of the state is used (see `_XMLState`), which is "c14n" unless otherwise configured.
+    """
 
     attrs: list[str] | None
+    format: Literal["c14n", "xml", "bytes", "dict"] | None = None
+    depth: int | None = None
 
     @staticmethod
-    def new(xpath: str, attrs: list[str] = None):
+    def new(
+        xpath: str,
+        attrs: list[str] = None,
+        format: str | None = None,
+        depth: int | None = None,
+    ):
         """Factory method for `Select` with positional arguments.
 
         Args:
             xpath (str): the xpath of the element(s) to select.
             attrs (list[str], optional): attributes to select. Defaults to None, which will cause the entire element to be selected.
+            format (str | None, optional): format of selected elements, one of "c14n", "xml", "bytes" or "dict". Defaults to None, in which case the default of the state is used.
+            depth (int | None, optional): maximum depth of children to include in the "dict" format. Defaults to None (no limit).
 
         Returns:
             Select: the select query.
@@ -330,7 +413,7 @@ class Select(XPathQuery):
         See:
             `select` for further details.
         """
-        return Select(xpath=xpath, attrs=attrs)
+        return Select(xpath=xpath, attrs=attrs, format=format, depth=depth)
 
     @property
     def is_read(self):  # noqa
@@ -352,11 +435,166 @@ class Select(XPathQuery):
         return state.select(self)
 
 
+class SelectStream(Select):
+    """Query to select XML elements and their attributes where the results are produced lazily, see `XMLState.iter_select`. This should be used for queries that may select a very large number of elements (or very large elements), memory use is bounded by `chunk_size` rather than by the number of results.
+
+    The result is an iterator over the results of the select (one per xpath result) or, if `chunk_size` is given, over lists of (at most) `chunk_size` results. The results are always consistent with the state at the time the query was executed. The iterator should be consumed (or closed) promptly, while it is in use the state records the elements that it modifies (see `_XMLState.snapshot`).
+    """
+
+    chunk_size: int | None = None
+
+    @staticmethod
+    def new(
+        xpath: str,
+        attrs: list[str] = None,
+        chunk_size: int | None = None,
+        format: str | None = None,
+        depth: int | None = None,
+    ):
+        """Factory method for `SelectStream` with positional arguments.
+
+        Args:
+            xpath (str): the xpath of the element(s) to select.
+            attrs (list[str], optional): attributes to select. Defaults to None, which will cause the entire element to be selected.
+            chunk_size (int | None, optional): number of results in each chunk. Defaults to None, in which case results are produced one at a time.
+            format (str | None, optional): format of selected elements, see `Select`. Defaults to None, in which case the default of the state is used.
+            depth (int | None, optional): maximum depth of children to include in the "dict" format. Defaults to None (no limit).
+
+        Returns:
+            SelectStream: the select query.
+
+        See:
+            `select` for further details.
+        """
+        return SelectStream(
+            xpath=xpath,
+            attrs=attrs,
+            chunk_size=chunk_size,
+            format=format,
+            depth=depth,
+        )
+
+    def __execute__(self, state: XMLState) -> Any:  # noqa
+        return state.iter_select(self, chunk_size=self.chunk_size)
+
+
+class SelectChanges(XMLQuery):
+    """Query to select the changes that have been made to the XML state since a given version, see `XMLChange` for details. This allows an agent to keep an up to date view of the XML state without repeatedly selecting all of it.
+
+    If `since` is None the result contains the entire XML document instead of changes, this should be used to initially get the state.
+
+    The result is a dict containing:
+    - "version" : the current version of the state, this should be used as `since` in the next query.
+    - "changes" : the list of changes (oldest first), or "xml" if `since` was None.
+
+    Changes are only recorded if the XML state was created with a change log (see `_XMLState`). Only a limited number of changes are kept, if the requested changes are no longer available the query will fail and the agent should select the entire document again.
+    """
+
+    since: int | None = None
+
+    @staticmethod
+    def new(since: int | None = None):
+        """Factory method for `SelectChanges` with positional arguments.
+
+        Args:
+            since (int | None, optional): the version of the last change that was seen. Defaults to None, which will select the entire XML document.
+
+        Returns:
+            SelectChanges: the query.
+        """
+        return SelectChanges(since=since)
+
+    @property
+    def is_read(self):  # noqa
+        return True
+
+    @property
+    def is_write(self):  # noqa
+        return False
+
+    @property
+    def is_write_tree(self):  # noqa
+        return False
+
+    @property
+    def is_write_element(self):  # noqa
+        return False
+
+    def __execute__(self, state: XMLState) -> Any:  # noqa
+        return state.select_changes(self)
+
+
+def select_stream(
+    xpath: str,
+    attrs: list[str] = None,
+    chunk_size: int | None = None,
+    format: str | None = None,
+    depth: int | None = None,
+):
+    """Select XML data lazily, see `SelectStream` and `select` for details.
+
+    Args:
+        xpath (str): the xpath of the element(s) to select.
+        attrs (list[str], optional): attributes to select. Defaults to None, which will cause the entire element to be selected.
+        chunk_size (int | None, optional): number of results in each chunk. Defaults to None, in which case results are produced one at a time.
+        format (str | None, optional): format of selected elements, see `Select`. Defaults to None, in which case the default of the state is used.
+        depth (int | None, optional): maximum depth of children to include in the "dict" format. Defaults to None (no limit).
+
+    Returns:
+        SelectStream: the query.
+    """
+    return SelectStream(
+        xpath=xpath,
+        attrs=attrs,
+        chunk_size=chunk_size,
+        format=format,
+        depth=depth,
+    )
+
+
+def select_changes(since: int | None = None):
+    """Select the changes that have been made to the XML state since version `since`, see `SelectChanges` for details.
+
+    Args:
+        since (int | None, optional): the version of the last change that was seen. Defaults to None, which will select the entire XML document.
+
+    Returns:
+        SelectChanges: the query.
+    """
+    return SelectChanges(since=since)
+
+
 def insert(xpath: str, element: str, index: int = 0):
     """TODO."""
     return Insert(xpath=xpath, element=element, index=index)
 
 
+def insert_many(
+    xpath: str, elements: list[str] | str, index: int = 0, fan_out: bool = False
+):
+    """Insert many XML elements in a single query, see `InsertMany` for details.
+
+    Example:
+        ```
+        elements = [
+            f'<svg:rect xmlns:svg="http://www.w3.org/2000/svg" id="r{i}"/>'
+            for i in range(5000)
+        ]
+        state.insert_many(insert_many("//*[@id='layer']", elements))
+        ```
+
+    Args:
+        xpath (str): xpath used to locate the parent element(s) where the given `elements` will be inserted.
+        elements (list[str] | str): elements to insert, either a list of elements or a single string containing the (concatenated) elements.
+        index (int, optional): the index to insert the first element at. Defaults to 0.
+        fan_out (bool, optional): whether to insert the elements into every element found by the `xpath`, otherwise exactly one element must be found. Defaults to False.
+
+    Returns:
+        InsertMany: the query.
+    """
+    return InsertMany(xpath=xpath, elements=elements, index=index, fan_out=fan_out)
+
+
 def delete(xpath: str):
     """TODO."""
     return Delete(xpath=xpath)
@@ -389,12 +627,19 @@ def update(xpath: str, attrs: dict[str, Any]):
     return Update(xpath=xpath, attrs=attrs)
 
 
-def select(xpath: str, attrs: list[str] = None):
+def select(
+    xpath: str,
+    attrs: list[str] = None,
+    format: str | None = None,
+    depth: int | None = None,
+):
     """Select XML data.
 
     Args:
         xpath (str): the xpath of the element(s) to select.
         attrs (list[str], optional): attributes to select. Defaults to None, which will cause the entire element to be selected.
+        format (str | None, optional): format of selected elements, one of "c14n", "xml", "bytes" or "dict" (see `Select`). Defaults to None, in which case the default of the state is used.
+        depth (int | None, optional): maximum depth of children to include in the "dict" format. Defaults to None (no limit).
 
     XML elements hold different kinds of data which can be selected as follows:
     - tag             : `@tag`
@@ -422,7 +667,80 @@ def select(xpath: str, attrs: list[str] = None):
     Returns:
         Select: select query
     """
-    return Select(xpath=xpath, attrs=attrs)
+    return Select(xpath=xpath, attrs=attrs, format=format, depth=depth)
+
+
+@cache
+def _constructor(cls: type[BaseModel]) -> Callable[[dict[str, Any]], BaseModel]:
+    """Get a function that creates an instance of `cls` from a dict of its fields WITHOUT validation. This is equivalent to `cls.model_construct(**fields)` but is much faster, it should only be used for queries that are created by library code (where the fields are known to be valid).
+
+    The instance is created by setting the attributes that pydantic (v2) stores on each model directly (see `_MODEL_SLOTS`), if these differ in the installed version of pydantic then `cls.model_construct` is used instead.
+
+    Args:
+        cls (type[BaseModel]): the model type.
+
+    Returns:
+        Callable[[dict[str, Any]], BaseModel]: the constructor, missing fields are given their default values.
+    """
+    if (
+        BaseModel.__slots__ != _MODEL_SLOTS
+        or cls.__private_attributes__
+        or cls.model_config.get("extra", None) == "allow"
+    ):
+        return lambda fields: cls.model_construct(**fields)
+    num_fields = len(cls.model_fields)
+    # default values in field order, default factories are called for each model
+    template, factories, required = dict(), [], set()
+    for name, field in cls.model_fields.items():
+        template[name] = field.default
+        if field.default_factory is not None:
+            factories.append((name, field.default_factory))
+        elif field.default is PydanticUndefined:
+            required.add(name)
+    new = cls.__new__
+
+    def construct(fields: dict[str, Any]) -> BaseModel:
+        # the dict becomes the `__dict__` of the model, it must not be shared with the caller
+        data = dict(fields)
+        if len(fields) < num_fields:
+            if not required.issubset(fields):
+                return cls.model_construct(**fields)
+            data = template.copy()
+            data.update(fields)
+            for name, factory in factories:
+                if name not in fields:
+                    data[name] = factory()
+        model = new(cls)
+        _object_setattr(model, "__dict__", data)
+        _object_setattr(model, "__pydantic_fields_set__", set(fields))
+        _object_setattr(model, "__pydantic_extra__", None)
+        _object_setattr(model, "__pydantic_private__", None)
+        return model
+
+    return construct
+
+
+def _construct(cls: type[BaseModel], **fields: Any) -> BaseModel:
+    """Create an instance of `cls` WITHOUT validation, see `_constructor`.
+
+    Args:
+        cls (type[BaseModel]): the model type.
+        fields (dict[str, Any]): the fields of the model.
+
+    Returns:
+        BaseModel: the model.
+    """
+    return _constructor(cls)(fields)
+
+
+_object_setattr = object.__setattr__
+# the attributes of each model instance (as of pydantic 2.x), see `_constructor`
+_MODEL_SLOTS = (
+    "__dict__",
+    "__pydantic_fields_set__",
+    "__pydantic_extra__",
+    "__pydantic_private__",
+)
 
 
 # TODO do the others is_select_query, is_insert_query, is_replace_query, is_delete_query
@@ -1,27 +1,57 @@
 """Defines the `XMLSensor` class which is a useful sensor implementation for observing XML related data."""
 
 from star_ray.agent import Agent, Sensor, attempt
+from star_ray.event import Observation, ErrorObservation
 from star_ray.pubsub import Subscribe
-from .query import select, Select, XMLQuery
+from .query import _construct, Select, SelectStream, SelectChanges, XMLQuery
 
 
 class XMLSensor(Sensor):
-    """Sensor that will observe all changes to an XMLAmbient. It subscribes to receive all events that subclass `XMLQuery` and initially attempts to sense all XML data (as XML source code)."""
+    """Sensor that will observe all changes to an XMLAmbient. It subscribes to receive all events that subclass `XMLQuery` and initially attempts to sense all XML data (as XML source code).
 
-    def __init__(self, *args, **kwargs):
-        """Constructor."""
+    If `chunk_size` is given, the document is instead selected with a `SelectStream` action as the sequence of nodes (elements and text) that are children of the root element. The resulting observation will contain an iterator over chunks of these nodes rather than a list, which allows very large documents to be processed without holding all of the data in memory at once.
+
+    In incremental mode the sensor will instead take a `SelectChanges` action each cycle. The first observation will contain the entire XML document, subsequent observations contain only the changes that were made since the previous observation (see `XMLChange`). This requires the XML state to record changes (see `_XMLState` `change_log_size`). If the changes are no longer available (or an error otherwise occurs) the entire document will be selected again on the next cycle.
+    """
+
+    def __init__(
+        self,
+        *args,
+        incremental: bool = False,
+        chunk_size: int | None = None,
+        **kwargs,
+    ):
+        """Constructor.
+
+        Args:
+            args (list[Any]): additional optional arguments.
+            incremental (bool, optional): whether to sense only the changes made to the XML state in each cycle. Defaults to False.
+            chunk_size (int | None, optional): number of results in each chunk when selecting all xml data (see `select_all`). Defaults to None, in which case the data is selected all at once.
+            kwargs (dict[str, Any]): additional optional keyword arguments.
+        """
         super().__init__(*args, **kwargs)
         self._subscriptions = (XMLQuery,)
+        self._incremental = incremental
+        self._chunk_size = chunk_size
+        self._version = None  # version of the most recently observed changes
+        self._pending = set()  # ids of `SelectChanges` actions awaiting observation
 
     @attempt
     def select_all(self) -> Select:
-        """An attempt method that takes an action to select all current xml data.
+        """An attempt method that takes an action to select all current xml data. If this sensor was given a `chunk_size` the data will be selected lazily (see `SelectStream`).
 
         Returns:
             Select: the action
         """
-        action = select("/*")  # select all xml data
-        return action
+        if self._chunk_size is not None:
+            # the root element would be a single result, select its children instead
+            return _construct(
+                SelectStream,
+                xpath="/*/node()",
+                attrs=None,
+                chunk_size=self._chunk_size,
+            )
+        return _construct(Select, xpath="/*", attrs=None)  # select all xml data
 
     @attempt
     def element_exists(self, element_id: str) -> Select:
@@ -33,12 +63,43 @@ class XMLSensor(Sensor):
         Returns:
             Select: the action
         """
-        return select(f"//*[@id='{element_id}']", ["id"])
+        return _construct(Select, xpath=f"//*[@id='{element_id}']", attrs=["id"])
+
+    @property
+    def incremental(self) -> bool:
+        """Whether this sensor is in incremental mode."""
+        return self._incremental
+
+    @property
+    def version(self) -> int | None:
+        """Version of the XML state that was most recently observed in incremental mode, None if the state has not yet been observed."""
+        return self._version
 
     def on_add(self, agent: Agent) -> None:  # noqa: D102
         super().on_add(agent)
-        # initially get all xml data - this will be avaliable on the first sense cycle
-        self.select_all()
+        if not self._incremental:
+            # initially get all xml data - this will be avaliable on the first sense cycle
+            self.select_all()
+
+    def __sense__(self) -> list[SelectChanges]:  # noqa: D105
+        if not self._incremental:
+            return []
+        action = _construct(SelectChanges, since=self._version)
+        self._pending.add(action.id)
+        return [action]
+
+    def __transduce__(self, events: list[Observation]) -> list[Observation]:  # noqa: D105
+        if self._pending:
+            for event in events:
+                action_id = getattr(event, "action_id", None)
+                if action_id not in self._pending:
+                    continue
+                self._pending.discard(action_id)
+                if isinstance(event, ErrorObservation):
+                    self._version = None  # select the entire document again
+                else:
+                    self._version = event.values["version"]
+        return events
 
     def __subscribe__(self) -> list[Subscribe]:  # noqa: D105
         return [Subscribe(topic=sub) for sub in self._subscriptions]
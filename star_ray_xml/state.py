@@ -1,22 +1,48 @@
 """Package defining the `XMLState` class along with its default implementation (based on `lxml`)."""
 
+from copy import deepcopy
 from abc import ABC, abstractmethod
 from typing import Any
+from contextlib import contextmanager, nullcontext, AbstractContextManager
+from collections.abc import Callable, Iterator, Sequence
 from functools import wraps
+from time import perf_counter
+from itertools import chain, islice
+from concurrent.futures import Executor, wait
 from lxml import etree as ET
 
 from .query import (
+    _construct,
     Select,
+    SelectChanges,
     Update,
     Delete,
     Replace,
     Insert,
+    InsertMany,
+    XMLQuery,
     XMLQueryError,
     XPathElementsNotFound,
+    Expr,
+)
+from ._expr import _compile_expr, VECTORIZE_MIN_ELEMENTS
+from ._element import _Element, _ElementList, XML_START_PATTERN, C14N, FORMATS
+from ._cache import _XPathCache, _LITERAL_CACHE
+from ._index import _IdIndex, _SecondaryIndex, _parse_id_xpath, _parse_index_xpath
+from ._planner import _DocumentStats, _XPathPlanner, _depth
+from ._changes import _ChangeLog, XMLChange, UPDATE, INSERT, DELETE, REPLACE
+from ._snapshot import _SnapshotLog, _SnapshotRoot
+from ._undo import _UndoLog
+from .profiler import XMLProfiler, _Frame
+from ._persist import (
+    _ChangeLogFile,
+    _write_snapshot,
+    _read_snapshot,
+    _read_changes,
+    LOG_SUFFIX,
 )
-from ._element import _Element, XML_START_PATTERN
 
-__all__ = ("XMLState", "_XMLState")
+__all__ = ("XMLState", "_XMLState", "XMLSnapshot")
 
 # special variable keys
 TEXT = "@text"  # inner text of the element
@@ -26,14 +52,19 @@ TAG = "@tag"  # <svg:g/> tag = "g"
 NAME = "@name"  # <svg:g/> name = "svg:g"
 PREFIX = "@prefix"  # <svg:g/> prefix = "svg"
 
+ID = "id"  # attribute that is indexed by `_XMLState` for fast lookup
+
+# number of results that a snapshot selects at a time when streaming, see `XMLSnapshot.iter_select`
+STREAM_READ_SIZE = 256
+
 
 def _set_xpath_on_exception(fun):
     """Utility decorator that sets the `xpath` attribute of an `XMLQueryError` if it is raised in a function."""
 
     @wraps(fun)
-    def _set_xpath_on_exception(*args):
+    def _set_xpath_on_exception(*args, **kwargs):
         try:
-            return fun(*args)
+            return fun(*args, **kwargs)
         except XMLQueryError as e:
             e.kwargs["xpath"] = args[1].xpath
             raise
@@ -41,6 +72,61 @@ def _set_xpath_on_exception(fun):
     return _set_xpath_on_exception
 
 
+def _writes(fun):
+    """Utility decorator for the methods of `_XMLState` that modify the tree, see `_XMLState._write`."""
+
+    @wraps(fun)
+    def _writes(self, *args, **kwargs):
+        if self._snapshot_log is None:
+            return fun(self, *args, **kwargs)
+        with self._write():
+            return fun(self, *args, **kwargs)
+
+    return _writes
+
+
+def _outermost(elements: _ElementList) -> list[_Element]:
+    """Drop the results of a `Delete` that are inside an element that is also deleted (e.g. nested groups found by `//svg:g`, or an attribute of a deleted element), they are removed along with that element."""
+    removed = {element._base for element in elements if element.is_element}
+    if not removed:
+        return list(elements)
+    result = []
+    for element in elements:
+        if element.is_literal:
+            result.append(element)
+            continue
+        base = element._base if element.is_element else element._base.getparent()
+        if base is None:
+            result.append(element)
+        elif not element.is_element and base in removed:
+            continue
+        elif not any(ancestor in removed for ancestor in base.iterancestors()):
+            result.append(element)
+    return result
+
+
+def _check_chunk_size(chunk_size: int | None):
+    if chunk_size is not None and chunk_size < 1:
+        raise ValueError(f"`chunk_size` must be positive, received: {chunk_size}")
+
+
+def _chunked(results: Iterator[Any], chunk_size: int | None) -> Iterator[Any]:
+    """Group `results` into lists of (at most) `chunk_size`, results are not grouped if `chunk_size` is None."""
+    if chunk_size is None:
+        yield from results
+        return
+    while chunk := list(islice(results, chunk_size)):
+        yield chunk
+
+
+def _releasing(results: Iterator[Any], snapshot: "XMLSnapshot") -> Iterator[Any]:
+    """Produce `results` (that are selected from `snapshot`), the snapshot is released once they have all been produced or if the iterator is closed (or garbage collected) before then."""
+    try:
+        yield from results
+    finally:
+        snapshot.release()
+
+
 class XMLState(ABC):
     """A class to represent and manipulate XML data."""
 
@@ -60,6 +146,19 @@ class XMLState(ABC):
             query (Insert): insert query
         """
 
+    def insert_many(self, query: InsertMany):
+        """Inserts many new elements into the XML state based on the provided `InsertMany` query. See the query class for details. Implementations are not required to support this query.
+
+        Args:
+            query (InsertMany): insert many query
+
+        Raises:
+            XMLQueryError: if the query is not supported by this state.
+        """
+        raise XMLQueryError(
+            f"`{InsertMany.__name__}` is not supported by state of type: `{type(self).__name__}`."
+        )
+
     @abstractmethod
     def replace(self, query: Replace):
         """Replaces elements in the XML state based on the provided `Replace` query. See the query class for details.
@@ -84,36 +183,299 @@ class XMLState(ABC):
             query (Select): select query
         """
 
+    def iter_select(
+        self, query: Select, chunk_size: int | None = None
+    ) -> Iterator[Any]:
+        """Retrieves data from the XML state based on the provided `Select` query, producing the results lazily (see `SelectStream`). This default implementation selects all of the results up front, implementations should override it to produce results as they are consumed.
+
+        Args:
+            query (Select): select query
+            chunk_size (int | None, optional): number of results in each chunk. Defaults to None, in which case results are produced one at a time.
+
+        Raises:
+            ValueError: if `chunk_size` is not positive.
+
+        Returns:
+            Iterator[Any]: the results, or lists of (at most) `chunk_size` results.
+        """
+        _check_chunk_size(chunk_size)
+        return _chunked(iter(self.select(query)), chunk_size)
+
+    def select_changes(self, query: SelectChanges) -> dict[str, Any]:
+        """Retrieves the changes that have been made to the XML state based on the provided `SelectChanges` query. See the query class for details. Implementations are not required to support this query.
+
+        Args:
+            query (SelectChanges): select changes query
+
+        Raises:
+            XMLQueryError: if changes are not recorded by this state.
+        """
+        raise XMLQueryError(
+            f"`{SelectChanges.__name__}` is not supported by state of type: `{type(self).__name__}`."
+        )
+
+    def snapshot(self) -> "XMLState":
+        """Take a read-only snapshot of this state that is pinned to the current version, it will not observe subsequent modifications to the state. Implementations are not required to support snapshots.
+
+        Raises:
+            NotImplementedError: if snapshots are not supported by this state.
+
+        Returns:
+            XMLState: the snapshot.
+        """
+        raise NotImplementedError(
+            f"Snapshots are not supported by state of type: `{type(self).__name__}`."
+        )
+
+    def transaction(self) -> AbstractContextManager["XMLState"]:
+        """Begin a transaction, all modifications that are made to the state while the transaction is in progress are applied atomically: if an exception is raised the modifications are undone (rolled back) and the exception is propagated, otherwise they are kept (committed). Implementations are not required to support transactions.
+
+        Example:
+            ```
+            with state.transaction():
+                state.delete(delete("//*[@id='a']"))
+                state.insert(insert("//*[@id='b']", element))
+            ```
+
+        Raises:
+            NotImplementedError: if transactions are not supported by this state.
+
+        Returns:
+            AbstractContextManager[XMLState]: context manager for the transaction.
+        """
+        raise NotImplementedError(
+            f"Transactions are not supported by state of type: `{type(self).__name__}`."
+        )
+
+    def execute_many(
+        self, queries: list[XMLQuery], executor: Executor | None = None
+    ) -> list[Any]:
+        """Executes a batch of queries in order (via `XMLQuery.__execute__`). A query that fails does not prevent the remaining queries from being executed, its exception is instead given in place of its result.
+
+        Implementations may override this method to execute the batch more efficiently (e.g. by making use of `executor`), but must preserve the result of executing each query in order.
+
+        Args:
+            queries (list[XMLQuery]): queries to execute.
+            executor (Executor | None, optional): executor that may be used to execute read-only queries concurrently. This default implementation does not use it. Defaults to None.
+
+        Returns:
+            list[Any]: the result of each query (in the same order as `queries`), or the exception that was raised by the query.
+        """
+        results = []
+        for query in queries:
+            try:
+                results.append(query.__execute__(self))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def close(self) -> None:
+        """Release any resources (e.g. open files) that are held by this state, it should be called when the state is no longer in use. This default implementation does nothing."""
+        pass
+
 
 class _XMLState(XMLState):
     """Default implementation of `XMLState`. Underlying xml parsing and queries are handled by the `lxml` package."""
 
     def __init__(
         self,
-        xml: str,
+        xml: str | bytes | ET._Element,
         namespaces: dict[str, str] | None = None,
         parser: ET.XMLParser | None = None,
+        xpath_cache_size: int = 1024,
+        id_index: bool = True,
+        change_log_size: int = 0,
+        select_format: str = C14N,
+        profiler: XMLProfiler | None = None,
+        query_planner: bool = False,
+        xpath_budget: float | None = None,
+        indexes: Sequence[str] | None = None,
     ):
+        """Constructor.
+
+        Args:
+            xml (str | bytes | ET._Element): initial xml data, or the root element of an already parsed tree (see `load`).
+            namespaces (dict[str, str] | None, optional): namespace map (prefix -> URI) used when evaluating xpath queries. Defaults to an empty dict.
+            parser (ET.XMLParser | None, optional): parser used for the initial `xml` data and any new elements. Defaults to a parser that removes comments.
+            xpath_cache_size (int, optional): the maximum number of compiled xpath expressions to keep, the least recently used expression is evicted when this is exceeded. A value of 0 disables the cache. Defaults to 1024.
+            id_index (bool, optional): whether to maintain an index of the `id` attribute of each element. Queries of the form `//*[@id='...']` (or `//svg:rect[@id='...']`) are answered directly from the index without evaluating the xpath. The index is kept up to date by all write queries, but not by direct modification of elements. Defaults to True.
+            change_log_size (int, optional): the maximum number of changes to keep in the change log (see `get_changes`), the oldest changes are discarded when this is exceeded. A value of 0 disables the change log. Defaults to 0.
+            select_format (str, optional): format of elements selected by `Select` queries that do not specify a format, one of "c14n", "xml", "bytes" or "dict" (see `Select`). Defaults to "c14n".
+            profiler (XMLProfiler | None, optional): profiler that records the time taken by each query (see `XMLProfiler`). Defaults to None, in which case queries are not profiled.
+            query_planner (bool, optional): whether to analyse each xpath before it is evaluated. Statistics of the document (the number of elements with each tag and at each depth) are maintained and used to estimate the cost of each xpath (see `estimate_xpath_cost`). Xpaths that start with an id lookup followed by other steps (e.g. `//*[@id='g']//svg:rect`) are evaluated relative to the element found with the id index (e.g. `.//svg:rect`) rather than by searching the whole document, and nested descendant searches (e.g. `//svg:g//svg:rect`) are rewritten as a single search (e.g. `//svg:rect[ancestor::svg:g]`) when this is estimated to be cheaper. Like the id index, the statistics are kept up to date by all write queries, but not by direct modification of elements. Defaults to False.
+            xpath_budget (float | None, optional): maximum estimated cost of an xpath (roughly, the number of elements that are visited to evaluate it), xpaths that exceed it are not evaluated and fail with `XPathCostExceeded`. This enables the `query_planner`. Defaults to None, in which case there is no maximum.
+            indexes (Sequence[str] | None, optional): secondary indexes to maintain in addition to the id index, each is either "tag" (index elements by tag) or "@" followed by the name of an attribute (index elements by the value of the attribute, e.g. "@class"). Queries of the form `//svg:rect`, `//*[@class]` or `//*[@class='...']` (optionally with a tag, e.g. `//svg:rect[@class='...']`) are answered from the indexes if possible, otherwise the xpath is evaluated as usual. Like the id index, the indexes are kept up to date by all write queries, but not by direct modification of elements. Defaults to None, in which case there are no secondary indexes.
+
+        Raises:
+            ValueError: if `select_format` is unknown, or if an index is invalid.
+        """
         super().__init__()
+        if select_format not in FORMATS:
+            raise ValueError(
+                f"Unknown `select_format`: `{select_format}`, must be one of: {FORMATS}"
+            )
+        self._select_format = select_format
         if parser is None:
             parser = ET.XMLParser(remove_comments=True)
         self._parser = parser
-        self._root = _Element(ET.fromstring(xml, parser=self._parser))
+        if not isinstance(xml, ET._Element):
+            xml = ET.fromstring(xml, parser=self._parser)
+        self._root = _Element(xml)
         self._namespaces = dict() if namespaces is None else namespaces
+        self._xpath_cache = _XPathCache(maxsize=xpath_cache_size)
+        self._id_index = None
+        if id_index:
+            self._id_index = _IdIndex(ID)
+            self._id_index.build(self._root._base)
+        self._indexes = None
+        if indexes:
+            self._indexes = _SecondaryIndex(indexes)
+            self._indexes.build(self._root._base)
+        self._stats = None
+        self._planner = None
+        if query_planner or xpath_budget is not None:
+            self._stats = _DocumentStats()
+            self._stats.build(self._root._base)
+            self._planner = _XPathPlanner(
+                self._stats,
+                self._namespaces,
+                budget=xpath_budget,
+                cache_size=xpath_cache_size,
+            )
+        self._changes = None
+        if change_log_size > 0:
+            self._changes = _ChangeLog(change_log_size)
+        # elements modified by write queries, see `_track_modified`
+        self._modified: list[tuple[ET._Element, str | None, bool]] | None = None
+        # modifications made while snapshots are in use, see `snapshot`
+        self._snapshot_log: _SnapshotLog | None = None
+        # undo log of the transaction in progress, see `transaction`
+        self._undo: _UndoLog | None = None
+        self._profiler = profiler
 
     def __str__(self):
         return str(ET.tostring(self._root._base, method="c14n2", with_comments=False))
 
-    def xpath(self, xpath: str) -> list[_Element]:
-        """Query inner xml using xpath producing a (possibly empty) list of elements that are the result of the query.
+    def xpath(self, xpath: str) -> _ElementList:
+        """Query inner xml using xpath producing a (possibly empty) sequence of elements that are the result of the query. Elements are only wrapped (see `_Element`) when they are accessed.
+
+        Compiled expressions are cached (see `get_xpath_cache_info`) so that repeated queries do not pay the cost of parsing and compiling the expression. Pure id lookups (e.g. `//*[@id='...']`) are answered from the id index if it is enabled, as are lookups by tag or attribute value if there are secondary indexes (see `indexes`).
 
         Args:
             xpath (str): xpath query
 
         Returns:
-            list[_Element]: elements that result from the query
+            _ElementList: elements that result from the query
+        """
+        if self._profiler is not None:
+            frame = self._profiler.current()
+            if frame is not None:
+                start = perf_counter()
+                elements = self._xpath(xpath)
+                frame.xpath_time += perf_counter() - start
+                frame.elements += len(elements)
+                return elements
+        return self._xpath(xpath)
+
+    def _xpath(self, xpath: str) -> _ElementList:
+        if self._id_index is not None:
+            elements = self._xpath_from_id_index(xpath)
+            if elements is not None:
+                return elements
+        if self._indexes is not None:
+            elements = self._xpath_from_indexes(xpath)
+            if elements is not None:
+                return elements
+        if self._planner is not None:
+            return self._xpath_planned(xpath)
+        return self._evaluate(self._root, xpath)
+
+    def _evaluate(self, element: _Element, xpath: str) -> _ElementList:
+        if self._xpath_cache.maxsize == 0:
+            return element.xpath(xpath, namespaces=self._namespaces)
+        compiled = self._xpath_cache.compile(xpath, self._namespaces)
+        return element.xpath(compiled)
+
+    def _xpath_planned(self, xpath: str) -> _ElementList:
+        plan = self._planner.plan(xpath)
+        if plan.anchor is not None and self._id_index is not None:
+            anchors = self._id_index.lookup(*plan.anchor, root=self._root._base)
+            if anchors is not None:
+                if not anchors:
+                    return _ElementList([])
+                depth = _depth(anchors[0])
+                cost = self._planner.estimate_relative(plan.relative_steps, depth)
+                self._planner.check(xpath, cost)
+                return self._evaluate(_Element(anchors[0]), plan.relative)
+        self._planner.check(xpath, plan.cost)
+        return self._evaluate(self._root, plan.xpath)
+
+    def estimate_xpath_cost(self, xpath: str) -> float:
+        """Estimate the cost of evaluating an xpath (roughly, the number of elements that are visited) from statistics of the document, see `query_planner`. If the xpath is rewritten, this is the estimated cost of the rewritten xpath. The estimate does not account for the id index.
+
+        Args:
+            xpath (str): the xpath.
+
+        Raises:
+            ValueError: if the query planner is not enabled.
+
+        Returns:
+            float: the estimated cost.
         """
-        return self._root.xpath(xpath, namespaces=self._namespaces)
+        if self._planner is None:
+            raise ValueError(
+                "The query planner is not enabled, see `query_planner` argument."
+            )
+        return self._planner.plan(xpath).cost
+
+    def _profile(self, fun: Callable[[XMLQuery], Any], query: XMLQuery) -> Any:
+        # executes a query method (e.g. `select`) while profiling, see `XMLProfiler`
+        with self._profiler.profile(query):
+            return fun(query)
+
+    @property
+    def profiler(self) -> XMLProfiler | None:
+        """Profiler that records the time taken by each query (see `XMLProfiler`), or None if queries are not profiled."""
+        return self._profiler
+
+    @profiler.setter
+    def profiler(self, profiler: XMLProfiler | None) -> None:
+        self._profiler = profiler
+
+    def get_xpath_cache_info(self) -> dict[str, int]:
+        """Get usage information for the compiled xpath cache, this can be used to choose an appropriate `xpath_cache_size`.
+
+        Returns:
+            dict[str, int]: containing `hits`, `misses`, `evictions`, `size` and `maxsize`.
+        """
+        return self._xpath_cache.info()
+
+    @staticmethod
+    def get_literal_cache_info() -> dict[str, int]:
+        """Get usage information for the cache of decoded attribute values. The cache is shared by all states, plain ints, floats and bools are decoded without it and are not counted.
+
+        Returns:
+            dict[str, int]: containing `hits`, `misses`, `evictions`, `size` and `maxsize`.
+        """
+        return _LITERAL_CACHE.info()
+
+    def _xpath_from_id_index(self, xpath: str) -> _ElementList | None:
+        lookup = _parse_id_xpath(xpath, self._namespaces)
+        if lookup is None:
+            return None
+        elements = self._id_index.lookup(*lookup, root=self._root._base)
+        if elements is None:
+            return None  # the index cannot answer this query, use lxml instead
+        return _ElementList(list(elements))
+
+    def _xpath_from_indexes(self, xpath: str) -> _ElementList | None:
+        lookup = _parse_index_xpath(xpath, self._namespaces)
+        if lookup is None:
+            return None
+        elements = self._indexes.lookup(*lookup, root=self._root._base)
+        if elements is None:
+            return None  # the indexes cannot answer this query, use lxml instead
+        return _ElementList(elements)
 
     def get_root(self) -> _Element:
         """Get the root element.
@@ -131,22 +493,119 @@ class _XMLState(XMLState):
         """
         return self._namespaces
 
-    @_set_xpath_on_exception
     def update(self, query: Update) -> None:
         """Updates the attributes of XML element(s) based on the `Update` query.
 
         Args:
             query (Update): query
         """
+        if self._profiler is not None and self._profiler.current() is None:
+            return self._profile(self.update, query)
+        self._apply_update(query, self._update_targets(query))
+
+    @_set_xpath_on_exception
+    def _update_targets(self, query: Update) -> _ElementList:
         elements = self.xpath(query.xpath)
         if len(elements) == 0:
             raise XPathElementsNotFound(
                 "Invalid xpath: `{xpath}` for `update`, no elements were found at this path.",
             )
-        for element in elements:
-            _XMLState.update_element_attributes(element, query.attrs)
+        return elements
+
+    @_set_xpath_on_exception
+    @_writes
+    def _apply_update(self, query: Update, elements: _ElementList) -> None:
+        attrs = query.attrs
+        if self._saving():
+            self._save_update_targets(elements, attrs)
+        element_attrs = _XMLState._eval_exprs_vectorized(elements, attrs)
+        if element_attrs is None:
+            element_attrs = [attrs] * len(elements)
+        if (
+            self._changes is None
+            and self._modified is None
+            and (self._id_index is None or ID not in attrs)
+            and (self._indexes is None or not self._indexes.is_affected(attrs))
+        ):
+            for element, values in zip(elements, element_attrs):
+                _XMLState.update_element_attributes(element, values)
+        else:
+            for element, values in zip(elements, element_attrs):
+                self._update_element(element, values)
+
+    @staticmethod
+    def _eval_exprs_vectorized(
+        elements: _ElementList, attrs: dict[str, Any]
+    ) -> list[dict[str, Any]] | None:
+        # evaluates `Expr` values for all elements at once, giving the attributes to use for each element (or None if nothing was evaluated)
+        if len(elements) < VECTORIZE_MIN_ELEMENTS or not any(
+            isinstance(value, Expr) for value in attrs.values()
+        ):
+            return None
+        if not all(element.is_element for element in elements):
+            return None  # the update will fail
+        bases = [element._base for element in elements]
+        results: dict[str, list[Any]] = dict()
+        assigned = set()
+        for attr, value in attrs.items():
+            if isinstance(value, Expr):
+                compiled = _compile_expr(value.expr)
+                # attributes are set in order, an expression must not depend on an attribute that is set before it
+                if compiled.is_vectorized and assigned.isdisjoint(compiled.names):
+                    values = compiled.eval_many(bases)
+                    if values is not None:
+                        results[attr] = values
+            if not attr.startswith("@"):
+                assigned.add(attr)
+        if not results:
+            return None
+        return [
+            {**attrs, **{attr: values[i] for attr, values in results.items()}}
+            for i in range(len(elements))
+        ]
+
+    def _save_update_targets(self, elements: _ElementList, attrs: dict[str, Any]):
+        # record the elements that will be modified by an update, see `_saving`
+        for base in elements.get_bases():
+            if not isinstance(base, ET._Element):
+                continue  # the update will fail
+            self._save_element(base)
+            if HEAD in attrs:
+                previous = base.getprevious()
+                if previous is not None:
+                    self._save_element(previous)
+                elif base.getparent() is not None:
+                    self._save_element(base.getparent())
+
+    def _update_element(self, element: _Element, attrs: dict[str, Any]):
+        if not element.is_element:
+            return _XMLState.update_element_attributes(element, attrs)  # raises
+        base = element._base
+        old_id = base.get(ID)
+        values = None if self._indexes is None else self._indexes.get_values(base)
+        path = None if self._changes is None else self._element_path(base)
+        if self._modified is not None:
+            self._modified.append((base, old_id, False))
+        try:
+            _XMLState.update_element_attributes(element, attrs)
+        finally:
+            if self._id_index is not None:
+                new_id = base.get(ID)
+                if new_id != old_id:
+                    self._id_index.remove(old_id, base)
+                    self._id_index.add(new_id, base)
+            if values is not None:
+                self._indexes.update(base, values)
+            if path is not None:
+                data = {
+                    attr: _XMLState._get_raw_attribute(element, attr)
+                    for attr in attrs
+                    if attr not in (TAG, NAME, PREFIX)
+                }
+                self._changes.record(UPDATE, path, data)
 
     @_set_xpath_on_exception
+    @_writes
     def insert(self, query: Insert) -> None:
         """Inserts an XML element based on the `Insert` query.
 
@@ -157,6 +616,8 @@ class _XMLState(XMLState):
             XPathElementsNotFound: if a parent element could not be found (this is defined by the `xpath` of the Insert query)
             XMLQueryError: If multiple parents were found - this is not currently supported by may be in the future.
         """
+        if self._profiler is not None and self._profiler.current() is None:
+            return self._profile(self.insert, query)
         elements = self.xpath(query.xpath)
         if len(elements) == 0:
             raise XPathElementsNotFound(
@@ -167,36 +628,145 @@ class _XMLState(XMLState):
                 "Invalid xpath: `{xpath}` for `insert`, found {elements_length} but only one is allowed.",
                 elements_length=len(elements),
             )
-        return _XMLState.insert_in_element(
-            elements[0],
+        parent = elements[0]
+        path = None
+        if self._changes is not None and parent.is_element:
+            path = self._element_path(parent._base)
+        if self._saving() and parent.is_element:
+            self._save_children(parent._base)
+        child = _XMLState.insert_in_element(
+            parent,
             query,
             parser=self._parser,
         )
+        if self._modified is not None and parent.is_element:
+            self._modified.append((parent._base, parent._base.get(ID), False))
+        if child is not None and self._id_index is not None:
+            self._id_index.add_subtree(child._base)
+        if child is not None and self._indexes is not None:
+            self._indexes.add_subtree(child._base)
+        if child is not None and self._stats is not None:
+            self._stats.add_subtree(child._base, _depth(child._base))
+        if path is not None:
+            self._changes.record(
+                INSERT, path, dict(element=query.element, index=query.index)
+            )
+
+    @_set_xpath_on_exception
+    @_writes
+    def insert_many(self, query: InsertMany) -> None:
+        """Inserts many XML elements based on the `InsertMany` query. The elements are parsed in a single pass of the parser and inserted into each parent in a single operation, each additional parent (see `InsertMany.fan_out`) receives a copy of the elements.
+
+        Args:
+            query (InsertMany): query
+
+        Raises:
+            XPathElementsNotFound: if a parent element could not be found (this is defined by the `xpath` of the InsertMany query)
+            XMLQueryError: if multiple parents were found and `fan_out` is False, if a parent is not an xml element or if the elements contain something other than xml elements (e.g. text).
+        """
+        if self._profiler is not None and self._profiler.current() is None:
+            return self._profile(self.insert_many, query)
+        parents = self.xpath(query.xpath)
+        if len(parents) == 0:
+            raise XPathElementsNotFound(
+                "Invalid xpath: `{xpath}` for `insert_many`, no parent element was found at this path.",
+            )
+        if len(parents) > 1 and not query.fan_out:
+            raise XMLQueryError(
+                "Invalid xpath: `{xpath}` for `insert_many`, found {elements_length} but only one is allowed (see `fan_out`).",
+                elements_length=len(parents),
+            )
+        for parent in parents:
+            if not parent.is_element:
+                raise XMLQueryError(
+                    "Failed to insert into xpath result: `{element}` must be an xml element. (xpath: `{xpath}`)",
+                    element=parent,
+                )
+        children = _XMLState._new_elements(query.elements, parser=self._parser)
+        if not children:
+            return
+        for i, parent in enumerate(parents):
+            parent = parent._base
+            if i > 0:
+                children = [deepcopy(child) for child in children]
+            path = None
+            if self._changes is not None:
+                path = self._element_path(parent)
+            if self._saving():
+                self._save_children(parent)
+            parent[query.index : query.index] = children
+            if self._modified is not None:
+                self._modified.append((parent, parent.get(ID), False))
+            depth = _depth(parent) + 1 if self._stats is not None else 0
+            for child in children:
+                if self._id_index is not None:
+                    self._id_index.add_subtree(child)
+                if self._indexes is not None:
+                    self._indexes.add_subtree(child)
+                if self._stats is not None:
+                    self._stats.add_subtree(child, depth)
+            if path is not None:
+                # the changes are recorded as an `Insert` for each element so that they can be replayed by `apply_changes`
+                index = parent.index(children[0])
+                for j, child in enumerate(children):
+                    element = ET.tostring(child, encoding="unicode", with_tail=False)
+                    self._changes.record(
+                        INSERT, path, dict(element=element, index=index + j)
+                    )
 
-    @_set_xpath_on_exception  # TODO implement Replace!
+    @_set_xpath_on_exception
+    @_writes
     def replace(self, query: Replace) -> None:
         """Replaces an XML element based on the `Replace` query.
 
-        NOTE: THIS QUERY TYPE IS CURRENTLY NOT IMPLEMENTED but is planned as part of the next release.
-
         Args:
             query (Replace): query
 
         Raises:
-            XMLQueryError: If multiple elements were found to replace (only one is allowed).
-            NotImplementedError: THIS QUERY TYPE IS CURRENTLY NOT IMPLEMENTED
+            XPathElementsNotFound: if no element was found to replace.
+            XMLQueryError: If multiple elements were found to replace (only one is allowed), or the xpath result is not an xml element.
+            NotImplementedError: if the element to replace is the root element.
         """
+        if self._profiler is not None and self._profiler.current() is None:
+            return self._profile(self.replace, query)
         elements = self.xpath(query.xpath)
+        if len(elements) == 0:
+            raise XPathElementsNotFound(
+                "Invalid xpath: `{xpath}` for `replace`, no element was found at this path.",
+            )
         if len(elements) > 1:
             raise XMLQueryError(
                 "Invalid xpath: `{xpath}` for `replace`, found {elements_length} but only one is allowed.",
                 elements_length=len(elements),
             )
-        raise NotImplementedError(
-            "TODO element replacement (`replace`) is not currently implement."
-        )
+        element = elements[0]
+        if not element.is_element:
+            raise XMLQueryError(
+                "Failed to replace xpath result: `{element}` must be an xml element. (xpath: `{xpath}`)",
+                element=element,
+            )
+        path = None if self._changes is None else self._element_path(element._base)
+        if self._saving() and element._base.getparent() is not None:
+            self._save_children(element._base.getparent())
+        new_element = _XMLState._replace_element(element, query.element, self._parser)
+        if self._modified is not None:
+            self._modified.append((element._base, element._base.get(ID), True))
+            self._modified.append((new_element._base, new_element._base.get(ID), False))
+        if self._id_index is not None:
+            self._id_index.remove_subtree(element._base)
+            self._id_index.add_subtree(new_element._base)
+        if self._indexes is not None:
+            self._indexes.remove_subtree(element._base)
+            self._indexes.add_subtree(new_element._base)
+        if self._stats is not None:
+            depth = _depth(new_element._base)
+            self._stats.remove_subtree(element._base, depth)
+            self._stats.add_subtree(new_element._base, depth)
+        if path is not None:
+            self._changes.record(REPLACE, path, dict(element=query.element))
 
     @_set_xpath_on_exception
+    @_writes
     def delete(self, query: Delete) -> None:
         """Deletes one or more XML elements based on the `Delete` query.
 
@@ -206,15 +776,334 @@ class _XMLState(XMLState):
         Raises:
             XMLQueryError: If no elements were found for deletion.
         """
+        if self._profiler is not None and self._profiler.current() is None:
+            return self._profile(self.delete, query)
         elements = self.xpath(query.xpath)
         if len(elements) == 0:
             raise XPathElementsNotFound(
                 "Invalid xpath: `{xpath}` for `delete`, no elements were found at this path.",
             )
+        if len(elements) > 1:
+            elements = _outermost(elements)
+        if self._saving():
+            self._save_delete_targets(elements)
+        if (
+            self._id_index is None
+            and self._indexes is None
+            and self._changes is None
+            and self._modified is None
+        ):
+            for element in elements:
+                _XMLState.delete_element(element)
+        else:
+            for element in elements:
+                self._delete_element(element)
+
+    def _save_delete_targets(self, elements: list[_Element]):
+        # record the elements that will be modified by a delete, see `_saving`
         for element in elements:
+            if element.is_literal:
+                continue  # the delete will fail
+            parent = element.get_parent()
+            if parent is None:
+                continue
+            if element.is_element:
+                self._save_children(parent._base)
+            else:
+                self._save_element(parent._base)
+
+    def _delete_element(self, element: _Element):
+        if element.is_literal:
+            return _XMLState.delete_element(element)  # raises
+        if element.is_element:
+            path = None if self._changes is None else self._element_path(element._base)
+            parent = element._base.getparent()
             _XMLState.delete_element(element)
+            if self._modified is not None:
+                self._modified.append((element._base, element._base.get(ID), True))
+                self._modified.append((parent, parent.get(ID), False))
+            if self._id_index is not None:
+                self._id_index.remove_subtree(element._base)
+            if self._indexes is not None:
+                self._indexes.remove_subtree(element._base)
+            if self._stats is not None and parent is not None:
+                self._stats.remove_subtree(element._base, _depth(parent) + 1)
+            if path is not None:
+                self._changes.record(DELETE, path)
+            return
+        # attributes, text or tail of the parent element are deleted
+        parent = element.get_parent()
+        path = None
+        if self._changes is not None and parent is not None and parent.is_element:
+            path = self._element_path(parent._base)
+        values = None
+        if self._indexes is not None and element.is_attribute:
+            values = self._indexes.get_values(parent._base)
+        _XMLState.delete_element(element)
+        if values is not None:
+            self._indexes.update(parent._base, values)
+        if self._modified is not None:
+            _id = str(element._base) if element.attribute_name == ID else None
+            self._modified.append((parent._base, _id or parent._base.get(ID), False))
+        if element.is_attribute:
+            if self._id_index is not None and element.attribute_name == ID:
+                self._id_index.remove(str(element._base), parent._base)
+            attr = element.attribute_name
+        elif element.is_text:
+            attr = TEXT
+        else:
+            attr = TAIL
+        if path is not None:
+            self._changes.record(UPDATE, path, {attr: None})
+
+    def snapshot(self) -> "XMLSnapshot":
+        """Take a read-only snapshot of this state, see `XMLSnapshot` for details.
+
+        Taking a snapshot is O(1), the tree is shared with the state rather than copied. While the snapshot is in use (it has not been released or garbage collected) the state records each element before it is first modified (its attributes and text, or its children if they are inserted, deleted or replaced), as in a transaction (see `transaction`). The cost of a modification and the memory that is used therefore grow with the number of modified elements, not the size of the document. If the snapshot is read after the state was modified its tree is reconstructed, this copies the document (O(document)) once for all of the snapshots that were taken at the same version. Release snapshots (see `XMLSnapshot.release`) as soon as they are no longer needed, the state then stops recording modifications.
+
+        Snapshots may be read by other threads while the state is modified, but they must not be taken while a modification is in progress.
+
+        Returns:
+            XMLSnapshot: the snapshot.
+        """
+        if self._snapshot_log is None:
+            self._snapshot_log = _SnapshotLog(self._root._base)
+        return XMLSnapshot(self, self._snapshot_log.root())
+
+    @contextmanager
+    def _write(self) -> Iterator[None]:
+        # the tree must only be modified in this context, the modifications are recorded for the snapshots that are in use (see `snapshot`)
+        log = self._snapshot_log
+        if log is None or not log.begin_write():
+            self._snapshot_log = None  # no snapshots are in use
+            yield
+            return
+        try:
+            yield
+        finally:
+            log.end_write()
+
+    def _saving(self) -> bool:
+        # whether elements must be recorded before they are modified, for the undo log of a transaction or for snapshots
+        return self._undo is not None or (
+            self._snapshot_log is not None and self._snapshot_log.recording
+        )
+
+    def _save_element(self, element: ET._Element):
+        # record the attributes, text and tail of an element before it is modified, see `_saving`
+        if self._undo is not None:
+            self._undo.save_element(element)
+        if self._snapshot_log is not None and self._snapshot_log.recording:
+            self._snapshot_log.save_element(element)
+
+    def _save_children(self, element: ET._Element):
+        # record the text and children of an element before its children are modified, see `_saving`
+        if self._undo is not None:
+            self._undo.save_children(element)
+        if self._snapshot_log is not None and self._snapshot_log.recording:
+            self._snapshot_log.save_children(element)
+
+    @contextmanager
+    def transaction(self) -> Iterator["_XMLState"]:
+        """Begin a transaction, all modifications that are made to the state by queries while the transaction is in progress are applied atomically. If an exception is raised the modifications are undone (rolled back) and the exception is propagated, otherwise they are kept (committed). This allows a query that executes several other queries (e.g. in a custom `XMLQuery.__execute__`) to leave the state unchanged if one of them fails.
+
+        Before an element is first modified in a transaction its attributes and text (or its children, if they are inserted, deleted or replaced) are recorded in an undo log. The cost of a transaction therefore depends on the size of the modification rather than the size of the document.
+
+        Transactions may be nested, rolling back a nested transaction only undoes the modifications that were made since it began. Changes are only recorded in the change log (see `get_changes`) once the outermost transaction is committed. Elements that are modified directly (rather than by a query) are not recorded and cannot be rolled back.
+
+        Example:
+            ```
+            with state.transaction():
+                state.delete(delete("//*[@id='a']"))
+                state.insert(insert("//*[@id='b']", element))
+            ```
+
+        Yields:
+            _XMLState: this state.
+        """
+        outermost = self._undo is None
+        if outermost:
+            self._undo = _UndoLog()
+            if self._changes is not None:
+                self._changes.hold()
+        held = 0 if self._changes is None else self._changes.held
+        self._undo.begin()
+        try:
+            yield self
+        except BaseException:
+            with self._write():
+                if self._snapshot_log is not None and self._snapshot_log.recording:
+                    self._snapshot_log.save_all(self._undo.pending())
+                self._undo.rollback(self._id_index, self._stats, self._indexes)
+            if self._changes is not None:
+                self._changes.discard(held)
+            raise
+        else:
+            self._undo.commit()
+        finally:
+            if outermost:
+                self._undo = None
+                if self._changes is not None:
+                    self._changes.release()
+
+    @contextmanager
+    def _track_modified(
+        self,
+    ) -> Iterator[list[tuple[ET._Element, str | None, bool]]]:
+        # collects the elements that are modified by write queries while the context is active as tuples: (element, `id` before the modification, whether the element was removed from the tree). Inserting or deleting a child modifies the parent.
+        modified = []
+        self._modified = modified
+        try:
+            yield modified
+        finally:
+            self._modified = None
+
+    def _element_path(self, element: ET._Element) -> str:
+        # path to the element that can be used to locate it in a copy of this state
+        _id = element.get(ID)
+        if (
+            _id is not None
+            and self._id_index is not None
+            and self._id_index.is_unique(_id)
+            and "'" not in _id
+        ):
+            return f"//*[@id='{_id}']"
+        return element.getroottree().getpath(element)
+
+    def get_version(self) -> int:
+        """Get the current version of the state, this is the version of the most recent change in the change log (see `get_changes`).
+
+        Returns:
+            int: the version, this is always 0 if the change log is disabled (and the state has not been saved, see `save`).
+        """
+        return 0 if self._changes is None else self._changes.version
+
+    def get_changes(self, since: int) -> list[XMLChange]:
+        """Get all changes that were made after version `since` (see `XMLChange`).
+
+        Args:
+            since (int): the version.
+
+        Raises:
+            XMLQueryError: if the change log is disabled, if the version is invalid or if some of the changes are no longer available.
+
+        Returns:
+            list[XMLChange]: the changes (oldest first).
+        """
+        if self._changes is None or self._changes.maxsize == 0:
+            raise XMLQueryError(
+                "Changes are not recorded, a `change_log_size` must be given to record changes."
+            )
+        return self._changes.since(since)
+
+    def select_changes(self, query: SelectChanges) -> dict[str, Any]:
+        """Select the changes that have been made to the XML state based on the `SelectChanges` query.
+
+        Args:
+            query (SelectChanges): query
+
+        Raises:
+            XMLQueryError: if the change log is disabled, if the version is invalid or if some of the changes are no longer available.
+
+        Returns:
+            dict[str, Any]: containing the current "version" and the "changes" made since `query.since` (or "xml", the whole document, if `query.since` is None).
+        """
+        if self._profiler is not None and self._profiler.current() is None:
+            return self._profile(self.select_changes, query)
+        if self._changes is None or self._changes.maxsize == 0:
+            raise XMLQueryError(
+                "Changes are not recorded, a `change_log_size` must be given to record changes."
+            )
+        if query.since is None:
+            return dict(version=self.get_version(), xml=self._root.as_string())
+        return dict(version=self.get_version(), changes=self.get_changes(query.since))
+
+    @_writes
+    def apply_changes(self, changes: list[XMLChange]) -> None:
+        """Apply changes (that were made to another state) to this state. This can be used to keep a copy of a state up to date (see `SelectChanges`).
+
+        Args:
+            changes (list[XMLChange]): the changes to apply, in the order they were made.
+        """
+        for change in changes:
+            if change.kind == UPDATE:
+                elements = self.xpath(change.path)
+                if self._saving():
+                    self._save_update_targets(elements, change.data)
+                for element in elements:
+                    old_id = element._base.get(ID)
+                    values = None
+                    if self._indexes is not None:
+                        values = self._indexes.get_values(element._base)
+                    _XMLState._set_raw_attributes(element, change.data)
+                    if self._id_index is not None and ID in change.data:
+                        self._id_index.remove(old_id, element._base)
+                        self._id_index.add(element._base.get(ID), element._base)
+                    if values is not None:
+                        self._indexes.update(element._base, values)
+            elif change.kind == INSERT:
+                self.insert(_construct(Insert, xpath=change.path, **change.data))
+            elif change.kind == DELETE:
+                self.delete(_construct(Delete, xpath=change.path))
+            elif change.kind == REPLACE:
+                self.replace(_construct(Replace, xpath=change.path, **change.data))
+            else:
+                raise ValueError(f"Unknown change kind: {change.kind}")
+
+    def save(self, path: str, sync: bool = False) -> None:
+        """Save this state to a file so that it can be restored later (see `load`). A snapshot of the state is written to `path`, after which every change that is made to the state is appended to a log file (`path` + ".log"). Saving again writes a new snapshot and starts a new log. This allows long simulations to be checkpointed cheaply: only changes are written between checkpoints, and only the changes that were made since the last checkpoint need to be replayed when the state is loaded.
+
+        Changes are recorded even if the change log is disabled (`change_log_size=0`), in that case they are only written to the file and cannot be selected (see `get_changes`). The log file remains open until the state is closed (see `close`).
+
+        Args:
+            path (str): path of the snapshot file.
+            sync (bool, optional): whether to wait for each change to be written to disk (`os.fsync`), otherwise changes are only flushed to the operating system, which is much faster but recent changes may be lost if the machine (rather than the process) fails. Defaults to False.
+        """
+        if self._changes is None:
+            self._changes = _ChangeLog(0)
+        self.close()
+        _write_snapshot(path, self._root._base, self._changes.version)
+        self._changes.file = _ChangeLogFile(path + LOG_SUFFIX, truncate=True, sync=sync)
+
+    @classmethod
+    def load(cls, path: str, sync: bool = False, **kwargs: Any) -> "_XMLState":
+        """Load a state that was saved with `save`. The snapshot file is memory-mapped and parsed in place, then any changes that were logged since the snapshot was taken are replayed. Subsequent changes continue to be appended to the same log file.
+
+        The version of the loaded state is the version of the most recent logged change, but earlier changes are not available to `get_changes`.
+
+        Args:
+            path (str): path of the snapshot file.
+            sync (bool, optional): whether to wait for each change to be written to disk, see `save`. Defaults to False.
+            kwargs (dict[str, Any]): additional keyword arguments for the constructor (e.g. `namespaces`), these should match those of the saved state.
+
+        Raises:
+            ValueError: if the files are not valid.
+
+        Returns:
+            _XMLState: the state.
+        """
+        if kwargs.get("parser", None) is None:
+            kwargs["parser"] = ET.XMLParser(remove_comments=True)
+        root, version = _read_snapshot(path, kwargs["parser"])
+        state = cls(root, **kwargs)
+        changes = state._changes if state._changes is not None else _ChangeLog(0)
+        # replayed changes are already in the log file and are not recorded again
+        state._changes = None
+        try:
+            replay = list(_read_changes(path + LOG_SUFFIX, version))
+            state.apply_changes(replay)
+        finally:
+            state._changes = changes
+        changes.reset(replay[-1].version if replay else version)
+        changes.file = _ChangeLogFile(path + LOG_SUFFIX, sync=sync)
+        return state
+
+    def close(self) -> None:
+        """Stop writing changes to the log file (see `save`)."""
+        if self._changes is not None and self._changes.file is not None:
+            self._changes.file.close()
+            self._changes.file = None
 
-    @_set_xpath_on_exception
     def select(self, query: Select) -> list[Any]:
         """Select an element or its attributes based on the `Select` query.
 
@@ -224,12 +1113,166 @@ class _XMLState(XMLState):
         Returns:
             list[Any]: list of results of the select (one per xpath result), typically will consist of python literal types (int, float, bool, str, list, dict).
         """
-        elements = self.xpath(query.xpath)
+        if self._profiler is not None and self._profiler.current() is None:
+            return self._profile(self.select, query)
+        return self._select(query, self.xpath(query.xpath))
+
+    def iter_select(
+        self, query: Select, chunk_size: int | None = None
+    ) -> Iterator[Any]:
+        """Select an element or its attributes based on the `Select` query, producing the results lazily as they are consumed (see `SelectStream`).
+
+        The results are selected from a snapshot (see `snapshot`) and so are consistent with the state at the time of the call, even if the state is modified before they are consumed. The snapshot is in use until the results have all been consumed or the iterator is closed (or garbage collected), while it is in use the state records the elements that it modifies.
+
+        Args:
+            query (Select): query
+            chunk_size (int | None, optional): number of results in each chunk. Defaults to None, in which case results are produced one at a time.
+
+        Raises:
+            ValueError: if `chunk_size` is not positive.
+
+        Returns:
+            Iterator[Any]: the results (one per xpath result), or lists of (at most) `chunk_size` results.
+        """
+        snapshot = self.snapshot()
+        try:
+            results = snapshot.iter_select(query, chunk_size=chunk_size)
+        except BaseException:
+            snapshot.release()
+            raise
+        return _releasing(results, snapshot)
+
+    def execute_many(
+        self,
+        queries: list[XMLQuery],
+        executor: Executor | None = None,
+        atomic: bool = False,
+    ) -> list[Any]:
+        """Executes a batch of queries in order. A query that fails does not prevent the remaining queries from being executed, its exception is instead given in place of its result.
+
+        `Select` queries that share an xpath are evaluated once for each run of consecutive read-only queries. Any write query will cause the xpath to be evaluated again by later queries.
+
+        If an `executor` is given, each run of consecutive read-only queries is executed concurrently using it. Write queries act as a barrier, they are executed (in order) only once all of the preceding reads have completed, and reads that follow a write will wait for it to complete. Reads therefore always see a stable state of the tree. Write queries are never executed concurrently, the modification of an element by `lxml` holds the GIL and so would not be any faster (and changes must be recorded in order).
+
+        If this state has a profiler (see `XMLProfiler`) each query is profiled separately.
+
+        Args:
+            queries (list[XMLQuery]): queries to execute.
+            executor (Executor | None, optional): executor (typically a `ThreadPoolExecutor`) to execute queries with. Defaults to None, in which case all queries are executed in order in the calling thread.
+            atomic (bool, optional): whether to execute each write query in its own transaction (see `transaction`), a write query that fails (e.g. part way through updating many elements) then leaves the state unchanged. This has a cost proportional to the number of modified elements. Defaults to False.
+
+        Returns:
+            list[Any]: the result of each query (in the same order as `queries`), or the exception that was raised by the query.
+        """
+        results = [None] * len(queries)
+        if executor is None:
+            self._execute_sequence(
+                queries, range(len(queries)), results, dict(), atomic=atomic
+            )
+            return results
+        reads: list[int] = []
+        for i, query in enumerate(queries):
+            if query.is_read:
+                reads.append(i)
+            else:
+                self._execute_reads_concurrent(queries, reads, results, executor)
+                reads = []
+                self._execute_sequence(queries, (i,), results, dict(), atomic=atomic)
+        self._execute_reads_concurrent(queries, reads, results, executor)
+        return results
+
+    def _execute_reads_concurrent(
+        self,
+        queries: list[XMLQuery],
+        indices: list[int],
+        results: list[Any],
+        executor: Executor,
+    ):
+        # group selects by xpath so that each xpath is only evaluated once
+        groups: dict[str, list[int]] = dict()
+        others: list[tuple[int]] = []
+        for i in indices:
+            if type(queries[i]) is Select:
+                groups.setdefault(queries[i].xpath, []).append(i)
+            else:
+                others.append((i,))
+        tasks = list(chain(groups.values(), others))
+        if len(tasks) < 2:
+            for task in tasks:
+                self._execute_sequence(queries, task, results, dict())
+            return
+        futures = [
+            executor.submit(self._execute_sequence, queries, task, results, dict())
+            for task in tasks
+        ]
+        for future in wait(futures).done:
+            future.result()
+
+    def _execute_sequence(
+        self,
+        queries: list[XMLQuery],
+        indices: list[int],
+        results: list[Any],
+        xpath_results: dict[str, _ElementList],
+        atomic: bool = False,
+    ):
+        # executes the queries at `indices` in order, results are set in place
+        for i in indices:
+            query = queries[i]
+            try:
+                with self.transaction() if atomic and query.is_write else nullcontext():
+                    if self._profiler is None:
+                        results[i] = self._execute_shared(query, xpath_results)
+                    else:
+                        with self._profiler.profile(query):
+                            results[i] = self._execute_shared(query, xpath_results)
+            except Exception as e:
+                results[i] = e
+
+    def _execute_shared(
+        self, query: XMLQuery, xpath_results: dict[str, _ElementList]
+    ) -> Any:
+        # subclasses of `Select` may define their own `__execute__`
+        if type(query) is Select:
+            elements = xpath_results.get(query.xpath, None)
+            if elements is None:
+                elements = self.xpath(query.xpath)
+                xpath_results[query.xpath] = elements
+            return self._select(query, elements)
+        if not query.is_read:
+            xpath_results.clear()
+        return query.__execute__(self)
+
+    @_set_xpath_on_exception
+    def _select(self, query: Select, elements: _ElementList) -> list[Any]:
         if len(elements) == 0:
             raise XPathElementsNotFound(
                 "Invalid xpath: `{xpath}` for `select`, no elements were found at this path.",
             )
-        result = [_XMLState.select_from_element(element, query) for element in elements]
+        if self._profiler is not None:
+            frame = self._profiler.current()
+            if frame is not None:
+                return self._select_profiled(query, elements, frame)
+        result = [
+            _XMLState.select_from_element(element, query, self._select_format)
+            for element in elements
+        ]
+        return result
+
+    def _select_profiled(
+        self, query: Select, elements: _ElementList, frame: _Frame
+    ) -> list[Any]:
+        # as `_select`, time taken to serialize elements and to decode values are added to `frame`
+        result = []
+        for element in elements:
+            start = perf_counter()
+            result.append(
+                _XMLState.select_from_element(element, query, self._select_format)
+            )
+            if element.is_element and not query.attrs:
+                frame.serialize_time += perf_counter() - start
+            else:
+                frame.literal_time += perf_counter() - start
         return result
 
     @staticmethod
@@ -257,6 +1300,34 @@ class _XMLState(XMLState):
                     "Cannot update namespace prefix on an element. (xpath: `{xpath}`)"
                 )
 
+    @staticmethod
+    def _get_raw_attribute(element: _Element, attr: str) -> str | None:
+        if not attr.startswith("@"):
+            return element._base.get(attr)
+        elif attr == TEXT:
+            return element._base.text
+        elif attr == TAIL:
+            return element._base.tail
+        elif attr == HEAD:
+            return element.head
+        return None
+
+    @staticmethod
+    def _set_raw_attributes(element: _Element, attrs: dict[str, str | None]):
+        base = element._base
+        for attr, value in attrs.items():
+            if not attr.startswith("@"):
+                if value is None:
+                    base.attrib.pop(attr, None)
+                else:
+                    base.set(attr, value)
+            elif attr == TEXT:
+                base.text = value
+            elif attr == TAIL:
+                base.tail = value
+            elif attr == HEAD:
+                element.head = value
+
     @staticmethod
     def _replace_element(
         element: _Element,
@@ -273,6 +1344,7 @@ class _XMLState(XMLState):
             parser=parser,
         )
         parent.replace(element, replace)
+        return replace
 
     @staticmethod
     def _update_unicode_element(element: _Element, value: Any):
@@ -301,6 +1373,7 @@ class _XMLState(XMLState):
             if XML_START_PATTERN.match(query.element):
                 child = _XMLState._new_element(query.element, parser=parser)
                 element.insert(query.index, child)
+                return child
             else:
                 _XMLState._insert_text_at(element, query.element, index=query.index)
         else:
@@ -325,6 +1398,32 @@ class _XMLState(XMLState):
         # TODO implement this inside _Element, we want to avoid using ET everywhere in this class
         return _Element(ET.fromstring(xml, parser=parser))
 
+    @staticmethod
+    def _new_elements(xml: list[str] | str, parser: ET.XMLParser) -> list[ET._Element]:
+        # the elements are wrapped in a single root so that they are parsed in one pass
+        if not isinstance(xml, str):
+            xml = "".join(xml)
+        root = ET.fromstring(f"<_>{xml}</_>", parser=parser)
+        if root.text and not root.text.isspace():
+            raise XMLQueryError(
+                "Failed to insert: `{text}`, only xml elements can be inserted by `insert_many`. (xpath: `{xpath}`)",
+                text=root.text,
+            )
+        children = list(root)
+        for child in children:
+            if not isinstance(child.tag, str):
+                raise XMLQueryError(
+                    "Failed to insert: `{element}`, only xml elements can be inserted by `insert_many`. (xpath: `{xpath}`)",
+                    element=child,
+                )
+            if child.tail and not child.tail.isspace():
+                raise XMLQueryError(
+                    "Failed to insert: `{text}`, only xml elements can be inserted by `insert_many`. (xpath: `{xpath}`)",
+                    text=child.tail,
+                )
+            child.tail = None
+        return children
+
     @staticmethod
     def delete_element(element: _Element):
         if element.is_literal:
@@ -373,12 +1472,12 @@ class _XMLState(XMLState):
                 )
 
     @staticmethod
-    def select_from_element(element: _Element, query: Select):
+    def select_from_element(element: _Element, query: Select, format: str = C14N):
         if element.is_element:
             if query.attrs:
                 return dict(_XMLState._iter_element_attributes(element, query.attrs))
             else:
-                return element.as_string()
+                return element.serialize(query.format or format, depth=query.depth)
         elif element.is_unicode_result:
             if query.attrs:
                 raise XMLQueryError(
@@ -429,3 +1528,192 @@ class _XMLState(XMLState):
                 raise XMLQueryError(
                     f"Unknown special attribute: {attr}, must be one of: {TAG, NAME, PREFIX, TEXT, TAIL, HEAD}"
                 )
+
+
+class XMLSnapshot(XMLState):
+    """A read-only view of an `_XMLState` that is pinned to the version of the state at the time it was taken (see `_XMLState.snapshot`). Write queries will fail with an `XMLQueryError`.
+
+    Snapshots allow consistent reads while the state continues to be modified (e.g. by another thread). Taking a snapshot does not copy the state, instead the tree is shared with the state and the elements that the state modifies are recorded (see `_XMLState.snapshot`). The cost of modifying the state while snapshots are in use therefore grows with the number of modified elements, not the size of the document or the number of snapshots. The tree of a snapshot is only reconstructed (a copy of the document) if the snapshot is read after the state was modified, once for all of the snapshots that were taken at the same version. Snapshots should be released (see `release`) when they are no longer needed, e.g. by using them as a context manager:
+
+    Example:
+        ```
+        with state.snapshot() as snapshot:
+            snapshot.select(select("//*[@id='a']"))
+        state.update(
+            update("//*[@id='a']", {"x": 1})
+        )  # the modification is not recorded
+        ```
+    """
+
+    def __init__(self, state: _XMLState, snapshot_root: _SnapshotRoot):
+        """Constructor, snapshots should be created via `_XMLState.snapshot`.
+
+        Args:
+            state (_XMLState): the state.
+            snapshot_root (_SnapshotRoot): root shared by the snapshots taken at the current version.
+        """
+        super().__init__()
+        self._snapshot_root: _SnapshotRoot | None = snapshot_root
+        self._version = state.get_version()
+        self._namespaces = state._namespaces
+        self._xpath_cache = state._xpath_cache  # shared, the cache is thread safe
+        self._select_format = state._select_format
+
+    @property
+    def version(self) -> int:
+        """The version of the state that this snapshot is pinned to (see `_XMLState.get_version`)."""
+        return self._version
+
+    def get_version(self) -> int:
+        """Get the version of the state that this snapshot is pinned to (see `_XMLState.get_version`).
+
+        Returns:
+            int: the version.
+        """
+        return self._version
+
+    def get_namespaces(self) -> dict[str, str]:
+        """Get XML namespaces (prefix -> URI).
+
+        Returns:
+            dict[str, str]: namespaces
+        """
+        return self._namespaces
+
+    def __enter__(self) -> "XMLSnapshot":
+        """Use the snapshot as a context manager, it is released (see `release`) when the context exits.
+
+        Returns:
+            XMLSnapshot: this snapshot.
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:  # noqa: D105
+        self.release()
+
+    def release(self) -> None:
+        """Release this snapshot, it can no longer be read. Once all of the snapshots that are in use have been released (or garbage collected) the state no longer records the elements that it modifies. Releasing a snapshot that has already been released has no effect."""
+        self._snapshot_root = None
+
+    @property
+    def released(self) -> bool:
+        """Whether this snapshot has been released (see `release`)."""
+        return self._snapshot_root is None
+
+    def _read(self) -> AbstractContextManager[ET._Element]:
+        if self._snapshot_root is None:
+            raise XMLQueryError("Failed to read snapshot, it has been released.")
+        return self._snapshot_root.read()
+
+    def snapshot(self) -> "XMLSnapshot":
+        """Snapshots are immutable, the snapshot itself is returned.
+
+        Returns:
+            XMLSnapshot: this snapshot.
+        """
+        return self
+
+    @_set_xpath_on_exception
+    def select(self, query: Select) -> list[Any]:
+        """Select an element or its attributes based on the `Select` query, see `_XMLState.select`.
+
+        Args:
+            query (Select): query
+
+        Returns:
+            list[Any]: list of results of the select (one per xpath result).
+        """
+        with self._read() as root:
+            elements = self._xpath(root, query.xpath)
+            if len(elements) == 0:
+                raise XPathElementsNotFound(
+                    "Invalid xpath: `{xpath}` for `select`, no elements were found at this path.",
+                )
+            return [
+                _XMLState.select_from_element(element, query, self._select_format)
+                for element in elements
+            ]
+
+    @_set_xpath_on_exception
+    def iter_select(
+        self, query: Select, chunk_size: int | None = None
+    ) -> Iterator[Any]:
+        """Select an element or its attributes based on the `Select` query, producing the results lazily as they are consumed, see `_XMLState.iter_select`.
+
+        Args:
+            query (Select): query
+            chunk_size (int | None, optional): number of results in each chunk. Defaults to None, in which case results are produced one at a time.
+
+        Raises:
+            ValueError: if `chunk_size` is not positive.
+
+        Returns:
+            Iterator[Any]: the results (one per xpath result), or lists of (at most) `chunk_size` results.
+        """
+        _check_chunk_size(chunk_size)
+        with self._read() as root:
+            elements = self._xpath(root, query.xpath)
+            if len(elements) == 0:
+                raise XPathElementsNotFound(
+                    "Invalid xpath: `{xpath}` for `select`, no elements were found at this path.",
+                )
+        results = self._iter_select(query, root, elements.get_bases())
+        return _chunked(results, chunk_size)
+
+    def _iter_select(
+        self, query: Select, root: ET._Element, bases: list[Any]
+    ) -> Iterator[Any]:
+        # results are selected a few at a time, the read must not be held while they are consumed
+        i = 0
+        while i < len(bases):
+            with self._read() as current:
+                if current is not root:
+                    # the tree was copied for the snapshot, find the same elements in the copy
+                    root = current
+                    bases = self._xpath(root, query.xpath).get_bases()
+                try:
+                    results = [
+                        _XMLState.select_from_element(
+                            _Element(base), query, self._select_format
+                        )
+                        for base in bases[i : i + STREAM_READ_SIZE]
+                    ]
+                except XMLQueryError as e:
+                    e.kwargs["xpath"] = query.xpath
+                    raise
+            i += len(results)
+            yield from results
+
+    def as_string(self) -> str:
+        """Get the XML source of this snapshot.
+
+        Returns:
+            str: the XML source.
+        """
+        with self._read() as root:
+            return _Element(root).as_string()
+
+    def _xpath(self, root: ET._Element, xpath: str) -> _ElementList:
+        if self._xpath_cache.maxsize == 0:
+            return _Element(root).xpath(xpath, namespaces=self._namespaces)
+        return _Element(root).xpath(self._xpath_cache.compile(xpath, self._namespaces))
+
+    def update(self, query: Update):  # noqa: D102
+        self._read_only(query)
+
+    def insert(self, query: Insert):  # noqa: D102
+        self._read_only(query)
+
+    def insert_many(self, query: InsertMany):  # noqa: D102
+        self._read_only(query)
+
+    def replace(self, query: Replace):  # noqa: D102
+        self._read_only(query)
+
+    def delete(self, query: Delete):  # noqa: D102
+        self._read_only(query)
+
+    def _read_only(self, query: XMLQuery):
+        raise XMLQueryError(
+            f"Failed to execute `{type(query).__name__}`, snapshots are read-only."
+        )
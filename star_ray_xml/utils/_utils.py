@@ -4,6 +4,7 @@ import re
 import ast
 import html
 from lxml import etree as ET
+from .._cache import _literal_eval
 
 _XPATH_ID_PATTERN = re.compile(r".*@id='([^']*)'")
 
@@ -14,6 +15,8 @@ def extract_id_from_xpath(xpath: str):
 
 def xml_to_primitive(value: str):
     """Converts a string attribute value to an appropriate Python type using ast.literal_eval."""
+    if isinstance(value, str):
+        return _literal_eval(value)
     try:
         # Safely evaluate value as a Python literal
         return ast.literal_eval(value)
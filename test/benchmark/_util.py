@@ -0,0 +1,51 @@
+"""Utilities shared by the benchmarks in this directory. Benchmarks are run as scripts, e.g. `python test/benchmark/bench_parallel_select.py`, they are not part of the unit tests."""
+
+import time
+from collections.abc import Callable
+
+NAMESPACES = {"svg": "http://www.w3.org/2000/svg"}
+
+
+def generate_svg(n: int, group_size: int = 100) -> str:
+    """Generate an SVG-like document containing (roughly) `n` elements.
+
+    The document consists of `n // group_size` groups (`svg:g`) each containing `group_size` rectangles (`svg:rect`). Each element has a unique `id`, rectangles have numeric `x`, `y`, `width` and `height` attributes and a `class` attribute (one of 10 values).
+
+    Args:
+        n (int): number of elements.
+        group_size (int, optional): number of elements in each group. Defaults to 100.
+
+    Returns:
+        str: the document.
+    """
+    groups = max(1, n // (group_size + 1))
+    parts = ['<svg:svg xmlns:svg="http://www.w3.org/2000/svg" id="root">']
+    i = 0
+    for g in range(groups):
+        parts.append(f'<svg:g id="g{g}">')
+        for _ in range(group_size):
+            parts.append(
+                f'<svg:rect id="r{i}" class="c{i % 10}" x="{i % 1000}" y="{i // 1000}" width="10" height="10"/>'
+            )
+            i += 1
+        parts.append("</svg:g>")
+    parts.append("</svg:svg>")
+    return "".join(parts)
+
+
+def measure(fun: Callable[[], object], repeat: int = 5) -> list[float]:
+    """Time `fun` a number of times.
+
+    Args:
+        fun (Callable[[], object]): function to time.
+        repeat (int, optional): number of times to call `fun`. Defaults to 5.
+
+    Returns:
+        list[float]: time taken (seconds) for each call.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fun()
+        times.append(time.perf_counter() - start)
+    return times
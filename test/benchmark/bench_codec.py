@@ -0,0 +1,57 @@
+"""Benchmark for the binary encoding of queries with `XMLCodec`. Reports the time taken to encode and decode a batch of queries, and the size of the encoded queries, compared with pydantic's JSON serialisation (`model_dump_json`, `model_validate_json`)."""
+
+import argparse
+from star_ray_xml import XMLCodec, Expr, select, update
+
+from _util import measure
+
+
+def main():  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    queries = []
+    for i in range(args.queries // 2):
+        queries.append(select(xpath=f"//*[@id='e{i}']", attrs=["x", "y"]))
+        queries.append(
+            update(xpath=f"//*[@id='e{i}']", attrs={"x": Expr("{x} + 1"), "y": i})
+        )
+    types = [type(query) for query in queries]
+
+    def json_encode():
+        return [query.model_dump_json() for query in queries]
+
+    def json_decode(data):
+        return [cls.model_validate_json(d) for cls, d in zip(types, data)]
+
+    print(f"{'method':>20} {'encode':>10} {'decode':>10} {'bytes':>10}")
+    data = json_encode()
+    t_encode = min(measure(json_encode, repeat=args.repeat))
+    t_decode = min(measure(lambda: json_decode(data), repeat=args.repeat))
+    size = sum(len(d) for d in data)
+    print(f"{'json':>20} {t_encode:10.4f} {t_decode:10.4f} {size:10}")
+
+    for trusted in (False, True):
+        codec = XMLCodec(trusted=trusted)
+        name = "codec" + ("(trusted)" if trusted else "")
+        data = [codec.encode(query) for query in queries]
+        t_encode = min(
+            measure(lambda: [codec.encode(q) for q in queries], repeat=args.repeat)
+        )
+        t_decode = min(
+            measure(lambda: [codec.decode(d) for d in data], repeat=args.repeat)
+        )
+        size = sum(len(d) for d in data)
+        print(f"{name:>20} {t_encode:10.4f} {t_decode:10.4f} {size:10}")
+
+        data = codec.encode_many(queries)
+        t_encode = min(measure(lambda: codec.encode_many(queries), repeat=args.repeat))
+        t_decode = min(measure(lambda: codec.decode_many(data), repeat=args.repeat))
+        name = name + "[many]"
+        print(f"{name:>20} {t_encode:10.4f} {t_decode:10.4f} {len(data):10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark for the secondary indexes of `_XMLState` (see its `indexes` argument). Reports the time taken to build the indexes, to answer queries by tag and by attribute value with and without the indexes, and the cost of maintaining the indexes during updates and inserts."""
+
+import argparse
+from star_ray_xml import _XMLState, update, insert
+
+from _util import generate_svg, measure, NAMESPACES
+
+INDEXES = ["tag", "@class"]
+XPATHS = [
+    "//svg:g",
+    "//svg:rect",
+    "//*[@class='c1']",
+    "//svg:rect[@class='c1']",
+    "//*[@class]",
+]
+
+
+def main():  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--elements", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    xml = generate_svg(args.elements)
+    groups = max(1, args.elements // 101)  # see `generate_svg`
+    rects = groups * 100
+    states = {}
+    for indexes in [None, INDEXES]:
+
+        def build():
+            states[indexes is not None] = _XMLState(xml, NAMESPACES, indexes=indexes)
+
+        t = min(measure(build, args.repeat))
+        print(f"build (indexes={indexes}): {t * 1e3:.1f} ms")
+
+    print(f"\n{'xpath':>24} {'elements':>9} {'indexed (ms)':>13} {'lxml (ms)':>10}")
+    for xpath in XPATHS:
+        t_indexed = min(measure(lambda: states[True].xpath(xpath), args.repeat))
+        t_plain = min(measure(lambda: states[False].xpath(xpath), args.repeat))
+        n = len(states[True].xpath(xpath))
+        print(f"{xpath:>24} {n:>9} {t_indexed * 1e3:13.3f} {t_plain * 1e3:10.3f}")
+
+    # updates of an indexed attribute and inserts in the middle of the document
+    updates = [
+        update(f"//*[@id='r{i * 7919 % rects}']", {"class": f"c{i % 10}"})
+        for i in range(args.queries)
+    ]
+    new = """<svg:rect xmlns:svg="http://www.w3.org/2000/svg" class="c1"/>"""
+    inserts = [
+        insert(f"//*[@id='g{i * 31 % groups}']", new, index=0)
+        for i in range(args.queries)
+    ]
+    print(f"\n{'query':>24} {'indexed (us)':>13} {'plain (us)':>11}")
+    for name, queries in [("update", updates), ("insert", inserts)]:
+        times = []
+        for indexed in [True, False]:
+            state = states[indexed]
+
+            def run():
+                for query in queries:
+                    query.__execute__(state)
+
+            times.append(min(measure(run, 1)) / len(queries))
+        print(f"{name:>24} {times[0] * 1e6:13.2f} {times[1] * 1e6:11.2f}")
+    # the first lookup after the inserts moves the inserted elements into place
+    t = min(measure(lambda: states[True].xpath("//svg:rect"), 1))
+    print(f"\nfirst lookup of //svg:rect after inserts: {t * 1e3:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
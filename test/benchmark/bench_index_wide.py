@@ -0,0 +1,55 @@
+"""Benchmark for the secondary indexes of `_XMLState` in a wide and flat document (a single parent with many children, e.g. an SVG without groups). Reports the time taken by an insert that is indexed (appended at the end or placed at the start of the parent, compared with an append without indexes, which `lxml` takes time proportional to the number of children to make) and the time taken by the first lookup after some elements were inserted out of document order (they are moved into place)."""
+
+import argparse
+from star_ray_xml import _XMLState, insert
+
+from _util import generate_svg, measure, NAMESPACES
+
+NEW = """<svg:rect xmlns:svg="http://www.w3.org/2000/svg" class="c1"/>"""
+
+
+def main():  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--elements", type=int, nargs="+", default=[1000, 10_000, 100_000]
+    )
+    parser.add_argument("--inserts", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(
+        f"{'elements':>10} {'append (us)':>12} {'append, no index (us)':>22} "
+        f"{'insert at start (us)':>21} "
+        + " ".join(f"{f'lookup, {k} inserts (ms)':>24}" for k in args.inserts)
+    )
+    for n in args.elements:
+        xml = generate_svg(n, group_size=n)
+        append = insert("//*[@id='g0']", NEW, index=2 * n)
+        t_append = []
+        for indexes in [["tag"], None]:
+            state = _XMLState(xml, NAMESPACES, indexes=indexes)
+            state.xpath("//svg:rect")
+            t_append.append(min(measure(lambda: state.insert(append), args.repeat)))
+        state = _XMLState(xml, NAMESPACES, indexes=["tag"])
+        state.xpath("//svg:rect")
+        t_start = min(
+            measure(lambda: state.insert(insert("//*[@id='g0']", NEW)), args.repeat)
+        )
+        t_lookups = []
+        for k in args.inserts:
+            times = []
+            for _ in range(args.repeat):
+                state = _XMLState(xml, NAMESPACES, indexes=["tag"])
+                state.xpath("//svg:rect")
+                for i in range(k):
+                    state.insert(insert("//*[@id='g0']", NEW, index=i * n // k))
+                times.extend(measure(lambda: state.xpath("//svg:rect"), 1))
+            t_lookups.append(min(times))
+        print(
+            f"{n:>10} {t_append[0] * 1e6:12.2f} {t_append[1] * 1e6:22.2f} "
+            f"{t_start * 1e6:21.2f} " + " ".join(f"{t * 1e3:24.3f}" for t in t_lookups)
+        )
+
+
+if __name__ == "__main__":
+    main()
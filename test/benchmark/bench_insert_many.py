@@ -0,0 +1,53 @@
+"""Benchmark for `InsertMany`. Reports the time taken to insert many elements into a document with an `Insert` query per element compared to a single `InsertMany` query (given a list of elements or one concatenated string of elements), and to insert the same elements into many parents (`fan_out`)."""
+
+import argparse
+from star_ray_xml import _XMLState, insert, insert_many
+
+from _util import generate_svg, measure, NAMESPACES
+
+ELEMENT = (
+    """<svg:rect xmlns:svg="http://www.w3.org/2000/svg" id="new{i}" x="{i}" y="0"/>"""
+)
+
+
+def main():  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--elements", type=int, default=20_000)
+    parser.add_argument("--inserts", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    xml = generate_svg(args.elements)
+    elements = [ELEMENT.format(i=i) for i in range(args.inserts)]
+    benchmarks = {
+        "insert": lambda: [insert("//*[@id='g0']", e) for e in elements],
+        "insert_many (list)": lambda: [insert_many("//*[@id='g0']", elements)],
+        "insert_many (str)": lambda: [insert_many("//*[@id='g0']", "".join(elements))],
+    }
+    print(f"{'query':>20} {'total (ms)':>11} {'per element (us)':>17}")
+    for name, queries in benchmarks.items():
+        times = []
+        for _ in range(args.repeat):
+            # each run starts from a fresh state so that the document does not grow
+            state = _XMLState(xml, NAMESPACES)
+            queries_ = queries()
+
+            def run():
+                for query in queries_:
+                    query.__execute__(state)
+
+            times.append(min(measure(run, 1)))
+        t = min(times)
+        print(f"{name:>20} {t * 1e3:11.2f} {t / args.inserts * 1e6:17.2f}")
+
+    # a share of the elements is inserted into every group
+    groups = max(1, args.elements // 101)  # see `generate_svg`
+    fragment = elements[: max(1, args.inserts // groups)]
+    state = _XMLState(xml, NAMESPACES)
+    query = insert_many("//svg:g", fragment, fan_out=True)
+    t = min(measure(lambda: query.__execute__(state), 1))
+    print(f"\nfan out {len(fragment)} elements to {groups} groups: {t * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
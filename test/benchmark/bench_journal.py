@@ -0,0 +1,56 @@
+"""Benchmark for `XMLJournal`. Reports the time taken to execute updates with `XMLAmbient.__update__` with and without a journal (for each `fsync` policy), and the time taken to replay the journal in batches (`XMLJournal.replay`) and one query at a time."""
+
+import os
+import argparse
+import tempfile
+from star_ray_xml import XMLAmbient, XMLJournal, _XMLState, update, Expr
+
+from _util import generate_svg, measure, NAMESPACES
+
+
+def main():  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--elements", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    xml = generate_svg(args.elements)
+    queries = [
+        update(f"//*[@id='r{i % args.elements}']", {"x": Expr("{x} + 1")})
+        for i in range(args.queries)
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "run.journal")
+
+        def run(fsync: str | None):
+            journal = None
+            if fsync is not None:
+                journal = XMLJournal(path, fsync=fsync, truncate=True)
+            ambient = XMLAmbient([], xml=xml, namespaces=NAMESPACES, journal=journal)
+            for query in queries:
+                ambient.__update__(query)
+            if journal is not None:
+                journal.close()
+
+        print(f"{'method':>20} {'seconds':>10}")
+        for fsync in [None, "never", "flush", "always"]:
+            t = min(measure(lambda: run(fsync), repeat=args.repeat))
+            print(f"{f'update ({fsync})':>20} {t:10.4f}")
+
+        def replay_sequential():
+            state = _XMLState(xml, namespaces=NAMESPACES)
+            for query in XMLJournal.read(path):
+                query.__execute__(state)
+
+        def replay():
+            XMLJournal.replay(path, xml, namespaces=NAMESPACES)
+
+        t = min(measure(replay_sequential, repeat=args.repeat))
+        print(f"{'replay (sequential)':>20} {t:10.4f}")
+        t = min(measure(replay, repeat=args.repeat))
+        print(f"{'replay (batched)':>20} {t:10.4f}")
+
+
+if __name__ == "__main__":
+    main()
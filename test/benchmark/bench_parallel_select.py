@@ -0,0 +1,43 @@
+"""Benchmark for concurrent execution of `Select` queries with `XMLState.execute_many`. Reports the time taken to execute a batch of selects for an increasing number of worker threads (up to the number of cores)."""
+
+import os
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from star_ray_xml import _XMLState, select
+
+from _util import generate_svg, measure, NAMESPACES
+
+
+def main():  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--elements", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    state = _XMLState(generate_svg(args.elements), namespaces=NAMESPACES)
+    # each query has a distinct xpath so that none of them share work
+    queries = [
+        select(xpath=f"//svg:rect[@x > {i} and @class='c{i % 10}']", attrs=["id"])
+        for i in range(args.queries)
+    ]
+    workers = [1]
+    while workers[-1] * 2 <= (os.cpu_count() or 1):
+        workers.append(workers[-1] * 2)
+
+    serial = min(measure(lambda: state.execute_many(queries), repeat=args.repeat))
+    print(f"{'workers':>8} {'seconds':>10} {'speedup':>8}")
+    print(f"{'serial':>8} {serial:10.4f} {1.0:8.2f}")
+    for n in workers:
+        with ThreadPoolExecutor(max_workers=n) as executor:
+            t = min(
+                measure(
+                    lambda: state.execute_many(queries, executor=executor),
+                    repeat=args.repeat,
+                )
+            )
+        print(f"{n:8d} {t:10.4f} {serial / t:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Benchmark for saving and loading a state (`_XMLState.save`, `_XMLState.load`). Reports the time taken to create a state from an xml string, to save it, and to load it with an increasing number of logged changes to replay."""
+
+import os
+import argparse
+import tempfile
+from star_ray_xml import _XMLState, update
+
+from _util import generate_svg, measure, NAMESPACES
+
+
+def main():  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--elements", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    xml = generate_svg(args.elements)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "state.xml")
+        t = min(measure(lambda: _XMLState(xml, namespaces=NAMESPACES), args.repeat))
+        print(f"{'from string':>24} {t:10.4f}")
+
+        state = _XMLState(xml, namespaces=NAMESPACES)
+        t = min(measure(lambda: state.save(path), args.repeat))
+        print(f"{'save':>24} {t:10.4f}")
+
+        logged = 0
+        for changes in [0, 1_000, 10_000]:
+            for i in range(logged, changes):
+                state.update(update(f"//*[@id='r{i}']", {"x": i}))
+            logged = changes
+
+            def load():
+                _XMLState.load(path, namespaces=NAMESPACES).close()
+
+            t = min(measure(load, args.repeat))
+            print(f"{f'load ({changes} changes)':>24} {t:10.4f}")
+        state.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""Benchmark for the query planner of `_XMLState` (see its `query_planner` argument). Reports the estimated cost of some xpaths and the time taken to evaluate them with and without the planner, including xpaths that are evaluated relative to an element found with the id index and nested descendant searches that are rewritten."""
+
+import argparse
+from star_ray_xml import _XMLState
+
+from _util import generate_svg, measure, NAMESPACES
+
+XPATHS = [
+    "/svg:svg/svg:g",
+    "//svg:rect",
+    "//*[contains(@class, 'c1')]",
+    "//*[@id='g3']//svg:rect",
+    "//*[@id='g3']/following-sibling::*",
+    "//*[@id='missing']/svg:rect",
+    "//svg:g//svg:rect",
+    "//*//*",
+]
+
+
+def main():  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--elements", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    xml = generate_svg(args.elements)
+    planned = _XMLState(xml, namespaces=NAMESPACES, query_planner=True)
+    plain = _XMLState(xml, namespaces=NAMESPACES)
+    print(f"{'xpath':>36} {'cost':>12} {'planned (ms)':>13} {'plain (ms)':>11}")
+    for xpath in XPATHS:
+        cost = planned.estimate_xpath_cost(xpath)
+        t_planned = min(measure(lambda: planned.xpath(xpath), args.repeat))
+        t_plain = min(measure(lambda: plain.xpath(xpath), args.repeat))
+        print(f"{xpath:>36} {cost:12.0f} {t_planned * 1e3:13.3f} {t_plain * 1e3:11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""Benchmark suite for the primitive queries (`Select`, `Update`, `Insert`, `Delete`) executed against an `_XMLState` directly and through an `XMLAmbient`, for documents of increasing size. Reports the throughput (queries per second) and latency percentiles of each query kind.
+
+Results can be written as JSON (`--output`) and compared with the results of a previous run (`--compare`), e.g. to detect a regression before a release:
+
+    python bench_primitives.py --output base.json
+    ... make changes ...
+    python bench_primitives.py --output new.json --compare base.json
+
+When comparing, the exit code is 1 if the median latency of any benchmark increased by more than `--threshold`.
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+from collections.abc import Callable
+from lxml import etree as ET
+from star_ray.event import ErrorActiveObservation
+from star_ray_xml import (
+    XMLAmbient,
+    XMLQuery,
+    _XMLState,
+    select,
+    update,
+    insert,
+    delete,
+    Expr,
+)
+
+from _util import generate_svg, NAMESPACES
+
+PERCENTILES = (50, 90, 99)
+
+
+def _queries(size: int, n: int, scans: int, seed: int) -> dict[str, list[XMLQuery]]:
+    # queries for each benchmark, they are executed in order and timed individually
+    rng = random.Random(seed)
+    groups = max(1, size // 101)  # see `generate_svg`
+    rects = groups * 100
+    ids = [rng.randrange(rects) for _ in range(n)]
+    new = """<svg:rect xmlns:svg="http://www.w3.org/2000/svg" id="new{i}" x="0"/>"""
+    return {
+        "select (elements)": [select(f"//*[@id='r{i}']") for i in ids],
+        "select (attrs)": [select(f"//*[@id='r{i}']", attrs=["x", "y"]) for i in ids],
+        # cannot use the id index, each query scans the whole document
+        "select (literal)": [
+            select(f"number(//*[@id='r{i}']/@x)") for i in ids[:scans]
+        ],
+        "update": [update(f"//*[@id='r{i}']", {"x": i}) for i in ids],
+        "update (expr)": [
+            update(f"//*[@id='r{i}']", {"x": Expr("{x} + 1")}) for i in ids
+        ],
+        # each inserted element is deleted again so that the size of the document does not change
+        "insert": [
+            insert(f"//*[@id='g{i % groups}']", new.format(i=i)) for i in range(n)
+        ],
+        "delete": [delete(f"//*[@id='new{i}']") for i in range(n)],
+    }
+
+
+def _run_state(state: _XMLState) -> Callable[[XMLQuery], None]:
+    def run(query: XMLQuery):
+        query.__execute__(state)
+
+    return run
+
+
+def _run_ambient(ambient: XMLAmbient) -> Callable[[XMLQuery], None]:
+    def run(query: XMLQuery):
+        if query.is_read:
+            result = ambient.__select__(query)
+        else:
+            result = ambient.__update__(query)
+        if isinstance(result, ErrorActiveObservation):
+            raise RuntimeError(f"Query failed: {query}, {result}")
+
+    return run
+
+
+def _measure(run: Callable[[XMLQuery], None], queries: list[XMLQuery]) -> dict:
+    # time each query, returns the throughput and latency percentiles (seconds)
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        run(query)
+        latencies.append(time.perf_counter() - start)
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    result = dict(
+        queries=len(latencies),
+        throughput=len(latencies) / sum(latencies),
+        mean=statistics.fmean(latencies),
+    )
+    result.update((f"p{p}", quantiles[p - 1]) for p in PERCENTILES)
+    result["max"] = max(latencies)
+    return result
+
+
+def _benchmark(sizes: list[int], n: int, scans: int, seed: int) -> list[dict]:
+    results = []
+    print(
+        f"{'target':>8} {'elements':>9} {'benchmark':>18} {'queries/s':>10}"
+        + "".join(f" {f'p{p} (us)':>10}" for p in PERCENTILES)
+    )
+    for size in sizes:
+        xml = generate_svg(size)
+        targets = {
+            "state": lambda: _run_state(_XMLState(xml, namespaces=NAMESPACES)),
+            "ambient": lambda: _run_ambient(
+                XMLAmbient([], xml=xml, namespaces=NAMESPACES)
+            ),
+        }
+        for target, create in targets.items():
+            run = create()
+            for name, queries in _queries(size, n, scans, seed).items():
+                result = _measure(run, queries)
+                results.append(
+                    dict(target=target, elements=size, benchmark=name, **result)
+                )
+                print(
+                    f"{target:>8} {size:>9} {name:>18} {result['throughput']:10.0f}"
+                    + "".join(f" {result[f'p{p}'] * 1e6:10.1f}" for p in PERCENTILES)
+                )
+    return results
+
+
+def _key(result: dict) -> tuple[str, int, str]:
+    return result["target"], result["elements"], result["benchmark"]
+
+
+def _compare(results: list[dict], baseline: list[dict], threshold: float) -> bool:
+    # print the change in median latency of each benchmark, returns whether there was a regression
+    baseline = {_key(result): result for result in baseline}
+    regression = False
+    print(f"\n{'target':>8} {'elements':>9} {'benchmark':>18} {'p50 change':>11}")
+    for result in results:
+        base = baseline.get(_key(result), None)
+        if base is None:
+            continue
+        change = result["p50"] / base["p50"] - 1
+        flag = ""
+        if change > threshold:
+            flag, regression = "  REGRESSION", True
+        target, size, name = _key(result)
+        print(f"{target:>8} {size:>9} {name:>18} {change:+10.1%}{flag}")
+    return regression
+
+
+def main():  # noqa: D103
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--scan-queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None)
+    parser.add_argument("--compare", type=str, default=None)
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    results = _benchmark(args.sizes, args.queries, args.scan_queries, args.seed)
+    if args.output is not None:
+        meta = dict(
+            time=time.strftime("%Y-%m-%dT%H:%M:%S"),
+            python=platform.python_version(),
+            lxml=".".join(str(v) for v in ET.LXML_VERSION),
+            platform=platform.platform(),
+            queries=args.queries,
+            scan_queries=args.scan_queries,
+            seed=args.seed,
+        )
+        with open(args.output, "w") as file:
+            json.dump(dict(meta=meta, results=results), file, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = json.load(file)["results"]
+        if _compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Benchmark for `XMLProfiler`. Reports the time taken to execute select and update queries against an `_XMLState` without a profiler and with a profiler that sends profiles to a `HistogramSink`, followed by the report of the slowest xpaths."""
+
+import argparse
+from star_ray_xml import _XMLState, XMLProfiler, HistogramSink, select, update, Expr
+
+from _util import generate_svg, measure, NAMESPACES
+
+
+def main():  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--elements", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rects = args.elements // 101 * 100  # see `generate_svg`
+    queries = [
+        select(f"//*[@id='r{i % rects}']", attrs=["x", "y"])
+        for i in range(args.queries)
+    ]
+    queries += [
+        update(f"//*[@id='r{i % rects}']", {"x": Expr("{x} + 1")})
+        for i in range(args.queries)
+    ]
+    queries.append(select("//svg:rect[@class='c1']"))
+    state = _XMLState(generate_svg(args.elements), namespaces=NAMESPACES)
+
+    def run():
+        for query in queries:
+            query.__execute__(state)
+
+    sink = HistogramSink(group_by=("query_type",))
+    print(f"{'profiler':>10} {'us/query':>10}")
+    for profiler in [None, XMLProfiler([sink])]:
+        state.profiler = profiler
+        t = min(measure(run, args.repeat)) / len(queries)
+        print(f"{'on' if profiler else 'off':>10} {t * 1e6:10.2f}")
+    print()
+    print(sink.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Benchmark for the construction of queries. Reports the time taken to construct queries with validation (the public factories, e.g. `select`, `update`), with pydantic's `model_construct` and with the unvalidated constructor that is used by library code (`_construct`, e.g. by `XMLSensor`)."""
+
+import argparse
+from star_ray_xml import Select, Update, Expr, select, update
+from star_ray_xml.query import _construct
+
+from _util import measure
+
+
+def main():  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    n = args.queries
+    xpath = "//*[@id='e1']"
+    attrs = {"x": 1, "y": 2.0, "fill": "red", "visible": True, "z": Expr("{z} + 1")}
+    cases = {
+        "select": {
+            "validated": lambda: [select(xpath, ["id"]) for _ in range(n)],
+            "model_construct": lambda: [
+                Select.model_construct(xpath=xpath, attrs=["id"]) for _ in range(n)
+            ],
+            "_construct": lambda: [
+                _construct(Select, xpath=xpath, attrs=["id"]) for _ in range(n)
+            ],
+        },
+        "update": {
+            "validated": lambda: [update(xpath, attrs) for _ in range(n)],
+            "model_construct": lambda: [
+                Update.model_construct(xpath=xpath, attrs=attrs) for _ in range(n)
+            ],
+            "_construct": lambda: [
+                _construct(Update, xpath=xpath, attrs=attrs) for _ in range(n)
+            ],
+        },
+    }
+    print(f"{'query':>8} {'method':>16} {'us/query':>10} {'speedup':>8}")
+    for query, methods in cases.items():
+        baseline = None
+        for method, fun in methods.items():
+            t = min(measure(fun, repeat=args.repeat)) / n
+            baseline = t if baseline is None else baseline
+            print(f"{query:>8} {method:>16} {t * 1e6:10.2f} {baseline / t:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
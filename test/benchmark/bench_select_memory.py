@@ -0,0 +1,44 @@
+"""Benchmark for the memory used and objects allocated by a large `Select` query. Reports the time, peak traced memory and number of `_Element` wrappers that are alive at the same time when selecting every element of the document with `select("//*")`."""
+
+import gc
+import argparse
+import tracemalloc
+from star_ray_xml import _XMLState, select
+from star_ray_xml._element import _Element
+
+from _util import generate_svg, measure, NAMESPACES
+
+
+def count_wrappers() -> int:  # noqa: D103
+    return sum(isinstance(obj, _Element) for obj in gc.get_objects())
+
+
+def main():  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--elements", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    state = _XMLState(generate_svg(args.elements), namespaces=NAMESPACES)
+    query = select(xpath="//*", attrs=["id"])
+
+    t = min(measure(lambda: state.select(query), repeat=args.repeat))
+    tracemalloc.start()
+    result = state.select(query)
+    _, select_peak = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    elements = state.xpath("//*")
+    _, xpath_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    wrappers = count_wrappers()
+
+    print(f"{'results':>24} {len(result):12d}")
+    print(f"{'select seconds':>24} {t:12.4f}")
+    print(f"{'select peak MiB':>24} {select_peak / 2**20:12.2f}")
+    print(f"{'xpath peak MiB':>24} {xpath_peak / 2**20:12.2f}")
+    print(f"{'live wrappers (xpath)':>24} {wrappers:12d}")
+    del elements
+
+
+if __name__ == "__main__":
+    main()
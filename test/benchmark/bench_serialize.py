@@ -0,0 +1,32 @@
+"""Benchmark for the serialisation of selected elements. Reports the time taken and throughput (MiB/s of output) of selecting the entire document, and each group of elements, in each of the formats supported by `Select` ("c14n", "xml", "bytes")."""
+
+import argparse
+from star_ray_xml import _XMLState, select
+
+from _util import generate_svg, measure, NAMESPACES
+
+FORMATS = ("c14n", "xml", "bytes")
+
+
+def main():  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--elements", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    state = _XMLState(generate_svg(args.elements), namespaces=NAMESPACES)
+    print(f"{'xpath':>12} {'format':>8} {'seconds':>10} {'MiB/s':>10} {'speedup':>8}")
+    for xpath in ["/*", "//svg:g"]:
+        baseline = None
+        for format in FORMATS:
+            query = select(xpath=xpath, format=format)
+            size = sum(len(result) for result in state.select(query))
+            t = min(measure(lambda: state.select(query), repeat=args.repeat))
+            baseline = t if baseline is None else baseline
+            print(
+                f"{xpath:>12} {format:>8} {t:10.4f} {size / t / 2**20:10.1f} {baseline / t:8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
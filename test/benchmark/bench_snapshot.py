@@ -0,0 +1,47 @@
+"""Benchmark for `_XMLState.snapshot`. Reports the time taken to take a snapshot, the time taken by a write while no snapshot is in use and while a snapshot is in use (the modified elements are recorded for the snapshot, the tree is not copied) and the time taken by the first read of a snapshot after the state was modified (the tree of the snapshot is reconstructed, this copies the document)."""
+
+import argparse
+from star_ray_xml import _XMLState, update, select
+
+from _util import generate_svg, measure, NAMESPACES
+
+
+def main():  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--elements", type=int, nargs="+", default=[1000, 10_000, 100_000]
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    query = update("//*[@id='r0']", {"x": 1})
+    read = select("//*[@id='r0']", ["x"])
+    print(
+        f"{'elements':>10} {'snapshot (us)':>14} {'write (us)':>11} "
+        f"{'write, in use (us)':>19} {'records':>8} {'first read (us)':>16}"
+    )
+    for n in args.elements:
+        state = _XMLState(generate_svg(n), NAMESPACES)
+        t_snapshot = min(measure(state.snapshot, args.repeat))
+        t_write = min(measure(lambda: state.update(query), args.repeat))
+
+        snapshots = [state.snapshot()]
+        t_in_use = min(measure(lambda: state.update(query), args.repeat))
+        records = len(state._snapshot_log._records)
+
+        def first_read():
+            state.update(query)
+            snapshot = state.snapshot()
+            state.update(query)
+            return lambda: snapshot.select(read)
+
+        t_read = min(min(measure(first_read(), 1)) for _ in range(args.repeat))
+        snapshots.clear()
+        print(
+            f"{n:>10} {t_snapshot * 1e6:14.2f} {t_write * 1e6:11.2f} "
+            f"{t_in_use * 1e6:19.2f} {records:>8} {t_read * 1e6:16.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
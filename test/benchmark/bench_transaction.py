@@ -0,0 +1,35 @@
+"""Benchmark for transactions (`_XMLState.transaction`). Reports the time taken to roll back a small transaction as the size of the document increases, compared to the time taken to copy the document (the alternative way to restore the state)."""
+
+import copy
+import argparse
+from star_ray_xml import _XMLState, update, insert, delete
+
+from _util import generate_svg, measure, NAMESPACES
+
+
+def main():  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'elements':>10} {'rollback':>10} {'copy':>10}")
+    for elements in [1_000, 10_000, 100_000]:
+        state = _XMLState(generate_svg(elements), namespaces=NAMESPACES)
+
+        def rollback():
+            try:
+                with state.transaction():
+                    state.update(update("//*[@id='r1']", {"x": 1}))
+                    state.insert(insert("//*[@id='g0']", "<rect id='new'/>"))
+                    state.delete(delete("//*[@id='r2']"))
+                    raise ValueError()
+            except ValueError:
+                pass
+
+        t1 = min(measure(rollback, args.repeat))
+        t2 = min(measure(lambda: copy.deepcopy(state._root), args.repeat))
+        print(f"{elements:>10} {t1:10.6f} {t2:10.6f}")
+
+
+if __name__ == "__main__":
+    main()
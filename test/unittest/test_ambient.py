@@ -0,0 +1,450 @@
+"""Unit tests for `XMLAmbient`."""
+
+import os
+import time
+import asyncio
+import unittest
+import tempfile
+from typing import Any
+from star_ray.event import ActiveObservation, ErrorActiveObservation
+from star_ray.pubsub import Subscriber, Subscribe, Unsubscribe
+from star_ray_xml import (
+    XMLAmbient,
+    _XMLState,
+    AsyncXMLAmbient,
+    XMLJournal,
+    XMLProfiler,
+    HistogramSink,
+    CallbackSink,
+    QueryProfile,
+    XMLUpdateQuery,
+    Expr,
+    Select,
+    Update,
+    select,
+    select_stream,
+    update,
+    insert,
+    delete,
+)
+
+XML = """<svg:svg xmlns:svg="http://www.w3.org/2000/svg"><svg:circle id="c1" cx="1"/><svg:circle id="c2" cx="2"/></svg:svg>"""
+NAMESPACES = {"svg": "http://www.w3.org/2000/svg"}
+
+
+class TestXMLAmbient(unittest.TestCase):
+    """Test cases for `XMLAmbient`."""
+
+    def test_execute_many(self):
+        """Each action should get its own observation, in order."""
+        ambient = XMLAmbient([], xml=XML, namespaces=NAMESPACES)
+        actions = [
+            select(xpath="//svg:circle", attrs=["cx"]),
+            update(xpath="//svg:circle", attrs={"cx": 0}),
+            select(xpath="//svg:missing"),
+            select(xpath="//*[@id='c2']", attrs=["cx"]),
+        ]
+        observations = ambient.execute_many(actions)
+        self.assertEqual(len(observations), len(actions))
+        self.assertIsInstance(observations[0], ActiveObservation)
+        self.assertEqual(observations[0].action_id, actions[0].id)
+        self.assertListEqual(observations[0].values, [{"cx": 1}, {"cx": 2}])
+        self.assertIsNone(observations[1])
+        self.assertIsInstance(observations[2], ErrorActiveObservation)
+        self.assertListEqual(observations[3].values, [{"cx": 0}])
+
+    def test_select_stream(self):
+        """Streamed results should not observe writes that happen after the select."""
+        ambient = XMLAmbient([], xml=XML, namespaces=NAMESPACES)
+        observation = ambient.__select__(
+            select_stream(xpath="//svg:circle", attrs=["cx"], chunk_size=1)
+        )
+        ambient.__update__(update(xpath="//svg:circle", attrs={"cx": 0}))
+        self.assertListEqual(list(observation.values), [[{"cx": 1}], [{"cx": 2}]])
+        observation = ambient.__select__(select_stream(xpath="//svg:missing"))
+        self.assertIsInstance(observation, ErrorActiveObservation)
+
+    def test_xpath_budget(self):
+        """Actions with xpaths that exceed the budget should fail without affecting others."""
+        ambient = XMLAmbient([], xml=XML, namespaces=NAMESPACES, xpath_budget=10)
+        observation = ambient.__select__(select(xpath="//*[contains(@id, 'c')]"))
+        self.assertIsInstance(observation, ErrorActiveObservation)
+        observation = ambient.__select__(select(xpath="//*[@id='c2']", attrs=["cx"]))
+        self.assertListEqual(observation.values, [{"cx": 2}])
+
+
+class _Subscriber(Subscriber):
+    """A `Subscriber` that keeps the messages it receives."""
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def __notify__(self, message: Any) -> None:  # noqa: D105
+        self.messages.append(message)
+
+
+class TestSubscribe(unittest.TestCase):
+    """Test cases for `XMLAmbient.__subscribe__`."""
+
+    def subscribe(self, ambient: XMLAmbient, topic: Any) -> _Subscriber:
+        """Subscribe a new subscriber to `topic`."""
+        subscriber = _Subscriber()
+        observation = ambient.__subscribe__(
+            Subscribe(topic=topic, subscriber=subscriber)
+        )
+        self.assertNotIsInstance(observation, ErrorActiveObservation)
+        return subscriber
+
+    def test_subscribe(self):
+        """Only subscribers whose filters intersect the modified elements should be notified."""
+        ambient = XMLAmbient([], xml=XML, namespaces=NAMESPACES)
+        all_updates = self.subscribe(ambient, Update)
+        c1 = self.subscribe(ambient, "//*[@id='c1']")
+        c2 = self.subscribe(ambient, "//svg:circle[@id='c2']")
+        root = self.subscribe(ambient, "/svg:svg")
+        cx = self.subscribe(ambient, "//svg:circle[@cx > 1]")
+        ambient.__update__(update(xpath="//*[@id='c1']", attrs={"cx": 3}))
+        ambient.__select__(select(xpath="//svg:circle"))
+        ambient.__update__(insert(xpath="/svg:svg", element="<rect/>"))
+        ambient.__update__(update(xpath="//svg:missing", attrs={"cx": 3}))
+        ambient.__update__(delete(xpath="//*[@id='c2']"))
+        # the failed update is not published
+        self.assertListEqual([type(m) for m in all_updates.messages], [Update])
+        self.assertEqual(len(c1.messages), 1)
+        self.assertEqual(len(c2.messages), 1)
+        self.assertEqual(len(root.messages), 3)
+        # c1 is selected after the update, c2 is selected before it is deleted
+        self.assertEqual(len(cx.messages), 2)
+        self.assertEqual(c1.messages[0].id, all_updates.messages[0].id)
+
+    def test_subscribe_before_write(self):
+        """Subscribers should be notified of writes to elements that are no longer selected by their filter after the write."""
+        ambient = XMLAmbient([], xml=XML, namespaces=NAMESPACES)
+        ambient.__update__(update(xpath="//svg:circle", attrs={"fill": "red"}))
+        red = self.subscribe(ambient, "//*[@fill='red']")
+        circles = self.subscribe(ambient, "//svg:circle")
+        ambient.__update__(update(xpath="//*[@id='c1']", attrs={"fill": "blue"}))
+        self.assertEqual(len(red.messages), 1)
+        ambient.execute_many([delete(xpath="//*[@id='c2']")])
+        self.assertEqual(len(red.messages), 2)
+        self.assertEqual(len(circles.messages), 2)
+
+    def test_notify_error(self):
+        """A subscriber that fails to be notified should not cause the write to be reported as failed."""
+
+        class _Failing(Subscriber):
+            def __notify__(self, message: Any) -> None:
+                raise RuntimeError()
+
+        ambient = XMLAmbient([], xml=XML, namespaces=NAMESPACES)
+        failing = _Failing()
+        ambient.__subscribe__(Subscribe(topic=Update, subscriber=failing))
+        subscriber = self.subscribe(ambient, Update)
+        with self.assertLogs(level="ERROR"):
+            observation = ambient.__update__(
+                update(xpath="//*[@id='c1']", attrs={"cx": 3})
+            )
+        self.assertNotIsInstance(observation, ErrorActiveObservation)
+        self.assertEqual(len(subscriber.messages), 1)
+
+    def test_unsubscribe(self):
+        """Unsubscribed subscribers should no longer be notified."""
+        ambient = XMLAmbient([], xml=XML, namespaces=NAMESPACES)
+        subscriber = self.subscribe(ambient, "//*[@id='c1']")
+        ambient.__subscribe__(Unsubscribe(topic="//*[@id='c1']", subscriber=subscriber))
+        ambient.execute_many([update(xpath="//*[@id='c1']", attrs={"cx": 3})])
+        self.assertListEqual(subscriber.messages, [])
+        observation = ambient.__subscribe__(
+            Subscribe(topic="//svg:[", subscriber=subscriber)
+        )
+        self.assertIsInstance(observation, ErrorActiveObservation)
+
+
+class _Double(XMLUpdateQuery):
+    """A custom write query that doubles the `cx` attribute of all circles."""
+
+    def __execute__(self, state) -> Any:  # noqa: D105
+        return state.update(
+            update(xpath="//svg:circle", attrs={"cx": Expr("{cx} * 2")})
+        )
+
+
+class TestXMLJournal(unittest.TestCase):
+    """Test cases for `XMLJournal`."""
+
+    def setUp(self):  # noqa: D102
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, "run.journal")
+
+    def tearDown(self):  # noqa: D102
+        self._dir.cleanup()
+
+    def test_journal(self):
+        """Successful write actions should be journaled and replayed."""
+        journal = XMLJournal(self.path)
+        ambient = XMLAmbient([], xml=XML, namespaces=NAMESPACES, journal=journal)
+        actions = [
+            update(xpath="//svg:circle", attrs={"cx": Expr("{cx} + 1")}),
+            update(xpath="//svg:missing", attrs={"cx": 0}),  # fails
+            insert(xpath="/*", element="<rect id='r1'/>"),
+            _Double(),
+        ]
+        for action in actions:
+            ambient.__update__(action)
+        ambient.execute_many([select(xpath="/*"), delete(xpath="//*[@id='c1']")])
+        journal.close()
+        queries = list(XMLJournal.read(self.path, types=[_Double]))
+        self.assertListEqual(
+            [q.id for q in queries[:3]], [actions[0].id, actions[2].id, actions[3].id]
+        )
+        self.assertEqual(len(queries), 4)
+        state = XMLJournal.replay(
+            self.path, XML, types=[_Double], batch_size=2, namespaces=NAMESPACES
+        )
+        self.assertEqual(str(state), str(ambient.get_state()))
+        with self.assertRaises(ValueError):
+            list(XMLJournal.read(self.path))  # unknown type
+
+    def test_partial_failure(self):
+        """A write action that fails part way through its elements should leave the state unchanged, so that replaying the journal gives the same state."""
+        journal = XMLJournal(self.path)
+        ambient = XMLAmbient([], xml=XML, namespaces=NAMESPACES, journal=journal)
+        ambient.__update__(update(xpath="//*[@id='c1']", attrs={"r": 1}))
+        # c1 is updated before the expression fails for c2 (it has no `r`)
+        failing = update(xpath="//svg:circle", attrs={"cx": Expr("{r} + 1")})
+        observation = ambient.__update__(failing)
+        self.assertIsInstance(observation, ErrorActiveObservation)
+        observations = ambient.execute_many([failing, delete(xpath="//*[@id='c2']")])
+        self.assertIsInstance(observations[0], ErrorActiveObservation)
+        journal.close()
+        self.assertEqual(len(list(XMLJournal.read(self.path))), 2)
+        state = XMLJournal.replay(self.path, XML, namespaces=NAMESPACES)
+        self.assertEqual(str(state), str(ambient.get_state()))
+        self.assertListEqual(
+            state.select(select(xpath="//svg:circle", attrs=["cx"])), [{"cx": 1}]
+        )
+
+    def test_buffer(self):
+        """Queries should be buffered according to `buffer_size` and `fsync`."""
+        journal = XMLJournal(self.path, buffer_size=1024)
+        journal.append([update(xpath="/*", attrs={"x": 1})])
+        self.assertEqual(os.path.getsize(self.path), 0)
+        journal.flush()
+        size = os.path.getsize(self.path)
+        self.assertGreater(size, 0)
+        journal.close()
+        journal = XMLJournal(self.path, fsync="always")
+        journal.append([update(xpath="/*", attrs={"x": 2})])
+        self.assertGreater(os.path.getsize(self.path), size)
+        journal.close()
+        with self.assertRaises(ValueError):
+            XMLJournal(self.path, fsync="sometimes")
+
+    def test_failure(self):
+        """A write action that cannot be journaled should still be observed as successful (the error is logged), the journal should then fail and keep the queries that were appended before the failure."""
+        journal = XMLJournal(self.path, fsync="always")
+        ambient = XMLAmbient([], xml=XML, namespaces=NAMESPACES, journal=journal)
+        ambient.__update__(update(xpath="//*[@id='c1']", attrs={"cx": 5}))
+        journal._file.close()  # the next write to the file fails
+        with self.assertLogs(level="ERROR"):
+            observation = ambient.__update__(delete(xpath="//*[@id='c1']"))
+        self.assertNotIsInstance(observation, ErrorActiveObservation)
+        self.assertIsInstance(journal.error, ValueError)
+        self.assertEqual(
+            len(ambient.get_state().select(select(xpath="//svg:circle"))), 1
+        )
+        with self.assertLogs(level="ERROR"):
+            observations = ambient.execute_many([delete(xpath="//*[@id='c2']")])
+        self.assertNotIsInstance(observations[0], ErrorActiveObservation)
+        with self.assertRaises(RuntimeError):
+            journal.append([update(xpath="/*", attrs={"x": 1})])
+        journal.close()
+        state = XMLJournal.replay(self.path, XML, namespaces=NAMESPACES)
+        self.assertListEqual(
+            state.select(select(xpath="//svg:circle", attrs=["cx"])),
+            [{"cx": 5}, {"cx": 2}],
+        )
+
+    def test_serialization_failure(self):
+        """Queries that were buffered before a query fails to serialize should still be written."""
+
+        class _Unserializable(_Double):
+            def model_dump_json(self, **kwargs):  # noqa: D102
+                raise TypeError("unserializable")
+
+        journal = XMLJournal(self.path, buffer_size=1024)
+        journal.append([update(xpath="/*", attrs={"x": 1})])
+        with self.assertRaises(TypeError):
+            journal.append([_Unserializable()])
+        self.assertIsInstance(journal.error, TypeError)
+        journal.close()
+        self.assertEqual(len(list(XMLJournal.read(self.path))), 1)
+
+    def test_incomplete(self):
+        """An incomplete query at the end of the journal should be ignored."""
+        journal = XMLJournal(self.path)
+        journal.append([update(xpath="//svg:circle", attrs={"cx": 5})])
+        journal.close()
+        with open(self.path, "ab") as file:
+            file.write(b'Update\t{"xpath": "//svg:ci')
+        self.assertEqual(len(list(XMLJournal.read(self.path))), 1)
+        journal = XMLJournal(self.path)
+        journal.append([delete(xpath="//*[@id='c1']")])
+        journal.close()
+        state = XMLJournal.replay(self.path, XML, namespaces=NAMESPACES)
+        self.assertListEqual(
+            state.select(select(xpath="//svg:circle", attrs=["cx"])), [{"cx": 5}]
+        )
+
+
+class TestXMLProfiler(unittest.TestCase):
+    """Test cases for `XMLProfiler`."""
+
+    def setUp(self):  # noqa: D102
+        self.profiles: list[QueryProfile] = []
+        self.sink = HistogramSink()
+        self.profiler = XMLProfiler([self.sink, CallbackSink(self.profiles.append)])
+
+    def test_profile(self):
+        """Each action should be profiled, along with its xpath and source."""
+        ambient = XMLAmbient([], xml=XML, namespaces=NAMESPACES, profiler=self.profiler)
+        ambient.__select__(select(xpath="//svg:circle", attrs=["cx"]))
+        ambient.__select__(select(xpath="//svg:circle"))
+        ambient.__update__(update(xpath="//*[@id='c1']", attrs={"cx": 0}))
+        ambient.__select__(Select(xpath="//svg:missing", attrs=None, source=7))
+        self.assertEqual(len(self.profiles), 4)
+        attrs, elements, updated, missing = self.profiles
+        self.assertEqual(attrs.query_type, "Select")
+        self.assertEqual(attrs.xpath, "//svg:circle")
+        self.assertEqual(attrs.elements, 2)
+        self.assertGreater(attrs.literal_time, 0)
+        self.assertEqual(attrs.serialize_time, 0)
+        self.assertGreater(elements.serialize_time, 0)
+        self.assertEqual(elements.literal_time, 0)
+        self.assertEqual(updated.query_type, "Update")
+        self.assertEqual(updated.elements, 1)
+        self.assertGreaterEqual(updated.total_time, updated.xpath_time)
+        self.assertTrue(missing.failed)
+        self.assertEqual(missing.source, 7)
+        self.assertFalse(any(profile.failed for profile in self.profiles[:3]))
+
+    def test_nested(self):
+        """Queries executed by a custom query should be attributed to it."""
+        ambient = XMLAmbient([], xml=XML, namespaces=NAMESPACES, profiler=self.profiler)
+        ambient.__update__(_Double())
+        self.assertEqual(len(self.profiles), 1)
+        self.assertEqual(self.profiles[0].query_type, "_Double")
+        self.assertEqual(self.profiles[0].elements, 2)
+
+    def test_execute_many(self):
+        """Each action in a batch should be profiled, concurrently or not."""
+        for read_workers in [0, 2]:
+            self.profiles.clear()
+            ambient = XMLAmbient(
+                [],
+                xml=XML,
+                namespaces=NAMESPACES,
+                read_workers=read_workers,
+                profiler=self.profiler,
+            )
+            ambient.execute_many(
+                [
+                    select(xpath="//svg:circle"),
+                    select(xpath="//*[@id='c1']"),
+                    update(xpath="//*[@id='c1']", attrs={"cx": 0}),
+                    update(xpath="//*[@id='c2']", attrs={"cx": 0}),
+                ]
+            )
+            types = sorted(profile.query_type for profile in self.profiles)
+            self.assertListEqual(types, ["Select", "Select", "Update", "Update"])
+
+    def test_sink_error(self):
+        """A sink that fails should not cause the query to fail, other sinks should still receive the profile."""
+
+        def _fail(profile: QueryProfile):
+            raise RuntimeError()
+
+        profiler = XMLProfiler([CallbackSink(_fail), self.sink])
+        ambient = XMLAmbient([], xml=XML, namespaces=NAMESPACES, profiler=profiler)
+        with self.assertLogs(level="ERROR"):
+            observation = ambient.__update__(
+                update(xpath="//*[@id='c1']", attrs={"cx": 3})
+            )
+        self.assertNotIsInstance(observation, ErrorActiveObservation)
+        self.assertEqual(self.sink.top(1)[0]["count"], 1)
+        state = _XMLState(XML, namespaces=NAMESPACES, profiler=profiler)
+        with self.assertLogs(level="ERROR"):
+            state.update(update(xpath="//*[@id='c1']", attrs={"cx": 4}))
+        self.assertListEqual(
+            state.select(select(xpath="//*[@id='c1']", attrs=["cx"])), [{"cx": 4}]
+        )
+
+    def test_histogram(self):
+        """Profiles should be aggregated by query type and xpath."""
+        ambient = XMLAmbient([], xml=XML, namespaces=NAMESPACES, profiler=self.profiler)
+        for _ in range(3):
+            ambient.__select__(select(xpath="//svg:circle"))
+        ambient.__select__(select(xpath="//*[@id='c1']"))
+        top = self.sink.top(1, key="count")
+        self.assertEqual(len(top), 1)
+        self.assertEqual(top[0]["xpath"], "//svg:circle")
+        self.assertEqual(top[0]["count"], 3)
+        self.assertEqual(top[0]["elements"], 6)
+        self.assertEqual(sum(count for _, count in top[0]["histogram"]), 3)
+        self.assertLessEqual(top[0]["max_time"], top[0]["total_time"])
+        self.assertIn("//svg:circle", self.sink.report())
+        self.sink.clear()
+        self.assertListEqual(self.sink.get_stats(), [])
+        with self.assertRaises(ValueError):
+            HistogramSink(group_by=("agent",))
+
+
+class _SlowSelect(Select):
+    """A `Select` that takes some time to execute."""
+
+    delay: float = 0.1
+
+    def __execute__(self, state) -> Any:  # noqa: D105
+        time.sleep(self.delay)
+        return super().__execute__(state)
+
+
+class TestAsyncXMLAmbient(unittest.IsolatedAsyncioTestCase):
+    """Test cases for `AsyncXMLAmbient`."""
+
+    async def test_ordering(self):
+        """Reads awaited after a write should observe it, writes are applied in order."""
+        ambient = AsyncXMLAmbient([], xml=XML, namespaces=NAMESPACES)
+        observations = await asyncio.gather(
+            ambient.__aselect__(_SlowSelect(xpath="//svg:circle", attrs=["cx"])),
+            ambient.__aupdate__(update(xpath="//svg:circle", attrs={"cx": 10})),
+            ambient.__aupdate__(update(xpath="//svg:circle", attrs={"cx": 20})),
+            ambient.__aselect__(select(xpath="//svg:circle", attrs=["cx"])),
+        )
+        self.assertListEqual(observations[0].values, [{"cx": 1}, {"cx": 2}])
+        self.assertListEqual(observations[3].values, [{"cx": 20}, {"cx": 20}])
+        await ambient.__terminate__()
+
+    async def test_timeout(self):
+        """An action that takes too long should result in an error observation."""
+        ambient = AsyncXMLAmbient([], xml=XML, namespaces=NAMESPACES)
+        observation = await ambient.__aselect__(
+            _SlowSelect(xpath="//svg:circle", delay=0.2, attrs=None), timeout=0.01
+        )
+        self.assertIsInstance(observation, ErrorActiveObservation)
+        # the lock is held until the slow action completes
+        observation = await ambient.__aupdate__(
+            update(xpath="//svg:circle", attrs={"cx": 0}), timeout=1.0
+        )
+        self.assertIsNone(observation)
+        observations = await ambient.aexecute_many(
+            [select(xpath="//svg:circle", attrs=["cx"]), select(xpath="//svg:g")]
+        )
+        self.assertListEqual(observations[0].values, [{"cx": 0}, {"cx": 0}])
+        self.assertIsInstance(observations[1], ErrorActiveObservation)
+        await ambient.__terminate__()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,4 @@
-"""Unit tests for the primitive XML queries: Select, Delete, Update, Insert (and Replace soon! TODO)."""
+"""Unit tests for the primitive XML queries: Select, Delete, Update, Insert, InsertMany and Replace."""
 
 import unittest
 import re
@@ -10,7 +10,19 @@ from star_ray_xml import (
     delete,
     update,
     insert,
+    insert_many,
+    replace,
+    Select,
+    SelectStream,
+    SelectChanges,
+    Update,
+    Insert,
+    InsertMany,
+    Delete,
+    Replace,
+    Expr,
 )
+from star_ray_xml.query import _construct, _constructor
 
 XML = """
 <svg:svg width="200" height="200" xmlns:svg="http://www.w3.org/2000/svg">
@@ -37,7 +49,7 @@ class TestUpdate(unittest.TestCase):
         state = _XMLState(XML, namespaces=NAMESPACES)
         state.update(update(xpath="//svg:svg/svg:circle", attrs={"cx": "10"}))
         result = state.xpath("//svg:svg/svg:circle/@cx")
-        self.assertListEqual(result, ["10", "10"])
+        self.assertSequenceEqual(result, ["10", "10"])
 
     def test_update_error(self):
         """Check for errors on Update."""
@@ -61,9 +73,9 @@ class TestUpdate(unittest.TestCase):
         state = _XMLState(XML, namespaces=NAMESPACES)
         state.update(update(xpath="//svg:svg/svg:g", attrs={"@text": "new"}))
         text = state.xpath("//svg:svg/svg:g[@id='g2']/text()")
-        self.assertListEqual(text, ["new"])  # empty
+        self.assertSequenceEqual(text, ["new"])  # empty
         text = state.xpath("//svg:svg/svg:g[@id='g1']/text()")
-        self.assertListEqual(text, ["new"])  # empty
+        self.assertSequenceEqual(text, ["new"])  # empty
 
     def test_update_tail(self):
         """Test updating tail attribute."""
@@ -71,15 +83,36 @@ class TestUpdate(unittest.TestCase):
         state.update(update(xpath="//svg:svg/svg:g", attrs={"@tail": "new"}))
         text = state.xpath("//svg:svg/text()")
         # NOTE: this is setting the tail for all g, including the g1 which initially is without a tail!
-        self.assertListEqual(text, ["new", "new", "new"])  # empty
+        self.assertSequenceEqual(text, ["new", "new", "new"])  # empty
 
     def test_update_head(self):
         """Test updating head attribute. TODO this is not yet implemented!"""
         pass  # TODO test is needed here to check `@head` can be updated!
 
 
-class TestReplace(unittest.TestCase):  # TODO implement Replace query.
-    """Test cases for `Replace`. TODO replace is not implemented yet, write tests when it is!"""
+class TestReplace(unittest.TestCase):
+    """Test cases for `Replace`."""
+
+    def test_replace_element(self):
+        """Simple test for replacing an element."""
+        ELEMENT = """<svg:rect xmlns:svg="http://www.w3.org/2000/svg" id="rect2"/>"""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        state.replace(replace(xpath="//svg:svg/svg:g[@id='g1']", element=ELEMENT))
+        self.assertFalse(state.xpath("//svg:svg/svg:g[@id='g1']"))
+        elements = state.xpath("//svg:svg/svg:rect")
+        self.assertEqual(len(elements), 1)
+        self.assertEqual(elements[0].get("id"), "rect2")
+
+    def test_replace_error(self):
+        """Test common replacement errors."""
+        ELEMENT = """<svg:rect xmlns:svg="http://www.w3.org/2000/svg"/>"""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        with self.assertRaises(XPathElementsNotFound):
+            state.replace(replace(xpath="//svg:svg/svg:rect", element=ELEMENT))
+        with self.assertRaises(XMLQueryError):
+            state.replace(replace(xpath="//svg:svg/svg:circle", element=ELEMENT))
+        with self.assertRaises(XMLQueryError):
+            state.replace(replace(xpath="//svg:svg/@width", element=ELEMENT))
 
 
 class TestInsert(unittest.TestCase):
@@ -115,6 +148,55 @@ class TestInsert(unittest.TestCase):
         self.assertEqual(elements[0], ELEMENT)
 
 
+class TestInsertMany(unittest.TestCase):
+    """Test cases for `InsertMany`."""
+
+    ELEMENT = """<svg:circle xmlns:svg="http://www.w3.org/2000/svg" r="{r}"/>"""
+
+    def test_insert_many(self):
+        """Test inserting a list of elements and a concatenated string of elements."""
+        elements = [self.ELEMENT.format(r=r) for r in range(3)]
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        state.insert_many(insert_many(xpath="//*[@id='g1']", elements=elements))
+        radii = [e.get("r") for e in state.xpath("//*[@id='g1']/svg:circle")]
+        self.assertListEqual(radii, [0, 1, 2])
+        state.insert_many(
+            insert_many(xpath="//*[@id='g1']", elements=" ".join(elements), index=1)
+        )
+        radii = [e.get("r") for e in state.xpath("//*[@id='g1']/svg:circle")]
+        self.assertListEqual(radii, [0, 0, 1, 2, 1, 2])
+        self.assertIsNone(state.xpath("//*[@id='g1']/svg:circle")[0].tail)
+
+    def test_insert_many_fan_out(self):
+        """Test inserting elements into multiple parents."""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        query = insert_many(xpath="//svg:g", elements=self.ELEMENT.format(r=1))
+        with self.assertRaises(XMLQueryError):
+            state.insert_many(query)
+        state.insert_many(query.model_copy(update=dict(fan_out=True)))
+        self.assertEqual(len(state.xpath("//svg:g/svg:circle")), 3)
+        self.assertEqual(len(state.xpath("//svg:g[1]/svg:circle")), 1)
+
+    def test_insert_many_invalid(self):
+        """Test that invalid elements and parents raise an error and leave the state unchanged."""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        with self.assertRaises(XPathElementsNotFound):
+            state.insert_many(insert_many(xpath="//*[@id='x']", elements="<g/>"))
+        with self.assertRaises(XMLQueryError):
+            state.insert_many(insert_many(xpath="//svg:svg/@width", elements="<g/>"))
+        with self.assertRaises(XMLQueryError):
+            state.insert_many(insert_many(xpath="//svg:svg", elements="<g/>text"))
+        self.assertEqual(len(state.xpath("//g")), 0)
+
+    def test_insert_many_execute(self):
+        """Test executing an `InsertMany` query."""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        query = InsertMany.new("//*[@id='g1']", [self.ELEMENT.format(r=1)] * 2)
+        self.assertTrue(query.is_write_tree)
+        query.__execute__(state)
+        self.assertEqual(len(state.xpath("//*[@id='g1']/svg:circle")), 2)
+
+
 class TestDelete(unittest.TestCase):
     """Test cases for `Delete`."""
 
@@ -136,7 +218,7 @@ class TestDelete(unittest.TestCase):
         """Test deleting text."""
         state = _XMLState(XML, namespaces=NAMESPACES)
         text = state.xpath("//svg:svg/svg:g[@id='g2']/text()")
-        self.assertListEqual(text, [" "])
+        self.assertSequenceEqual(text, [" "])
         state.delete(delete(xpath="//svg:svg/svg:g[@id='g2']/text()"))
         text = state.xpath("//svg:svg/svg:g[@id='g2']/text()")
         self.assertFalse(text)  # empty
@@ -229,5 +311,51 @@ class TestSelect(unittest.TestCase):
         )
 
 
+class TestConstruct(unittest.TestCase):
+    """Test construction of queries without validation (used by library code)."""
+
+    QUERIES = [
+        (Select, dict(xpath="/*", attrs=["id"])),
+        (Select, dict(xpath="/*", attrs=None, format="dict", depth=1)),
+        (SelectStream, dict(xpath="/*/node()", attrs=None, chunk_size=8)),
+        (SelectChanges, dict(since=1)),
+        (SelectChanges, dict()),
+        (Update, dict(xpath="/*", attrs={"x": 1, "y": Expr("{y} + 1")})),
+        (Insert, dict(xpath="/*", element="<g/>", index=0)),
+        (Delete, dict(xpath="/*")),
+        (Replace, dict(xpath="/*", element="<g/>")),
+    ]
+
+    def test_construct(self):
+        """Test that constructed queries are the same as validated queries."""
+        for cls, fields in TestConstruct.QUERIES:
+            with self.subTest(cls=cls.__name__, fields=fields):
+                query = _construct(cls, **fields)
+                expected = cls(**fields)
+                self.assertIs(type(query), cls)
+                self.assertEqual(query.model_fields_set, expected.model_fields_set)
+                # each query is a new action
+                self.assertNotEqual(query.id, _construct(cls, **fields).id)
+                self.assertEqual(
+                    query.model_dump(exclude={"id", "timestamp"}),
+                    expected.model_dump(exclude={"id", "timestamp"}),
+                )
+
+    def test_construct_copy(self):
+        """Test that the fields of a constructed query are not shared with the given dict."""
+        fields = dict(xpath="/*", attrs={"x": 1}, id=1, timestamp=0.0)
+        query = _constructor(Update)(fields)
+        fields["xpath"] = "//g"
+        self.assertEqual(query.xpath, "/*")
+        self.assertEqual(query, Update(xpath="/*", attrs={"x": 1}, id=1, timestamp=0.0))
+
+    def test_execute(self):
+        """Test executing constructed queries."""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        state.update(_construct(Update, xpath="//*[@id='g1']", attrs={"x": 1}))
+        result = state.select(_construct(Select, xpath="//*[@id='g1']", attrs=["x"]))
+        self.assertListEqual(result, [{"x": 1}])
+
+
 if __name__ == "__main__":
     unittest.main()
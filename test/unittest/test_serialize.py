@@ -1,7 +1,21 @@
 """Unit test for serialisation of XML events."""
 
 import unittest
-from star_ray_xml import Update, Replace, Insert, Delete, Select, Expr
+from star_ray.event import ActiveObservation, ErrorActiveObservation
+from star_ray_xml import (
+    Update,
+    Replace,
+    Insert,
+    InsertMany,
+    Delete,
+    Select,
+    SelectStream,
+    SelectChanges,
+    Expr,
+    XMLCodec,
+    XMLUpdateQuery,
+)
+from star_ray_xml.codec import msgpack
 
 
 class TestEventSerialisation(unittest.TestCase):
@@ -47,5 +61,85 @@ class TestEventSerialisation(unittest.TestCase):
         self.assertEqual(u1, u2)
 
 
+@unittest.skipIf(msgpack is None, "requires msgpack")
+class TestXMLCodec(unittest.TestCase):
+    """Test binary serialisation of XML events with `XMLCodec`."""
+
+    EVENTS = [
+        Update(xpath="test", attrs={"a": 1, "b": Expr("{x1} + {x2}", x1=1)}),
+        Insert(xpath="test", element="<g/>", index=0),
+        InsertMany(xpath="test", elements=["<g/>", "<g/>"], index=1, fan_out=True),
+        Delete(xpath="test", attrs=["a"]),
+        Replace(xpath="test", element="<g/>"),
+        Select(xpath="test", attrs=["x", "y"], format="dict", depth=1),
+        SelectStream(xpath="test", attrs=None, chunk_size=8),
+        SelectChanges(since=3),
+    ]
+
+    def test_round_trip(self):
+        """Test that each query type is unchanged by encoding and decoding."""
+        for trusted in (False, True):
+            codec = XMLCodec(trusted=trusted)
+            for event in self.EVENTS:
+                with self.subTest(trusted=trusted, event=type(event).__name__):
+                    self.assertEqual(codec.decode(codec.encode(event)), event)
+
+    def test_round_trip_many(self):
+        """Test encoding and decoding a list of events."""
+        codec = XMLCodec()
+        self.assertListEqual(
+            codec.decode_many(codec.encode_many(self.EVENTS)), self.EVENTS
+        )
+
+    def test_observation(self):
+        """Test encoding and decoding of observations."""
+        codec = XMLCodec()
+        values = [{"id": "a", "x": 1.5, "data": b"\x00", "tags": {1, 2}}, None]
+        obs = ActiveObservation(action_id=1, values=values)
+        self.assertEqual(codec.decode(codec.encode(obs)), obs)
+        error = ErrorActiveObservation(
+            action_id=1,
+            exception_type="ValueError",
+            exception_args={"query": Select},
+            traceback_message="",
+        )
+        result = codec.decode(codec.encode(error))
+        self.assertEqual(result.exception_args, {"query": str(Select)})
+
+    def test_register(self):
+        """Test registering a custom query type."""
+
+        class MyQuery(XMLUpdateQuery):
+            value: int
+
+            def __execute__(self, state):
+                pass
+
+        codec = XMLCodec()
+        with self.assertRaises(TypeError):
+            codec.encode(MyQuery(value=1))
+        with self.assertRaises(ValueError):
+            codec.register(MyQuery, 1)
+        codec.register(MyQuery, 64)
+        with self.assertRaises(ValueError):
+            codec.register(MyQuery, 65)
+        query = MyQuery(value=1)
+        self.assertEqual(codec.decode(codec.encode(query)), query)
+
+    def test_invalid(self):
+        """Test that invalid data raises a ValueError."""
+        codec = XMLCodec()
+        data = codec.encode(self.EVENTS[0])
+        for invalid in (
+            data[:-2],
+            msgpack.packb([1000]),
+            msgpack.packb(1),
+            msgpack.packb([1, 1]),
+        ):
+            with self.subTest(invalid=invalid):
+                with self.assertRaises(ValueError):
+                    codec.decode(invalid)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,1037 @@
+"""Unit tests for `_XMLState` features that are not specific to a single query type."""
+
+import os
+import unittest
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from star_ray_xml import (
+    _XMLState,
+    Expr,
+    XMLQueryError,
+    XPathElementsNotFound,
+    XPathCostExceeded,
+    select,
+    update,
+    insert,
+    delete,
+    replace,
+    select_changes,
+    select_stream,
+    XMLSnapshot,
+)
+from star_ray_xml._expr import _compile_expr, np
+from star_ray_xml._planner import _DocumentStats
+from star_ray_xml._index import MAX_SORTED_INSERTS, _precedes
+from star_ray_xml.state import STREAM_READ_SIZE
+
+XML = """
+<svg:svg width="200" height="200" xmlns:svg="http://www.w3.org/2000/svg">
+    <svg:circle id="c1" cx="50" cy="50" r="30" fill="red" />
+    <svg:circle id="c2" cx="150" cy="50" r="30" fill="green" />
+    <svg:g id="g1"><svg:rect id="r1" x="1"/></svg:g>
+</svg:svg>
+"""
+XML = re.sub(r"[ \t]*\n[ \t]*", "", XML)
+
+NAMESPACES = {"svg": "http://www.w3.org/2000/svg"}
+
+# nested groups, `//svg:g` finds elements that are inside other results
+NESTED_XML = (
+    '<svg:svg xmlns:svg="http://www.w3.org/2000/svg">'
+    '<svg:g id="g1"><svg:g><svg:rect/></svg:g><svg:g><svg:g/></svg:g></svg:g>'
+    '<svg:g><svg:rect id="r1" x="1"/></svg:g><svg:circle id="c1"/>'
+    "</svg:svg>"
+)
+
+
+class TestXPathCache(unittest.TestCase):
+    """Test cases for the compiled xpath cache."""
+
+    def test_cache_hits(self):
+        """Repeated queries should reuse the compiled expression."""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        for _ in range(3):
+            state.select(select(xpath="//svg:circle", attrs=["cx"]))
+        info = state.get_xpath_cache_info()
+        self.assertEqual(info["misses"], 1)
+        self.assertEqual(info["hits"], 2)
+        self.assertEqual(info["size"], 1)
+
+    def test_cache_eviction(self):
+        """The least recently used expression should be evicted when full."""
+        state = _XMLState(XML, namespaces=NAMESPACES, xpath_cache_size=2)
+        state.xpath("//svg:circle")
+        state.xpath("//svg:g")
+        state.xpath("//svg:circle")  # hit, //svg:g is now least recently used
+        state.xpath("//svg:rect")  # evicts //svg:g
+        state.xpath("//svg:circle")  # hit
+        info = state.get_xpath_cache_info()
+        self.assertEqual(info["evictions"], 1)
+        self.assertEqual(info["hits"], 2)
+        self.assertEqual(info["size"], 2)
+
+    def test_cache_disabled(self):
+        """Results should be the same with the cache disabled."""
+        state = _XMLState(XML, namespaces=NAMESPACES, xpath_cache_size=0)
+        state.update(update(xpath="//svg:circle", attrs={"cx": 1}))
+        self.assertSequenceEqual(state.xpath("//svg:circle/@cx"), ["1", "1"])
+        self.assertEqual(state.get_xpath_cache_info()["size"], 0)
+
+
+class TestIdIndex(unittest.TestCase):
+    """Test cases for the `id` index."""
+
+    def test_lookup(self):
+        """Id lookups should match the result of evaluating the xpath."""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        for xpath in [
+            "//*[@id='c1']",
+            '//*[@id="r1"]',
+            "//svg:rect[@id='r1']",
+            "//svg:circle[@id='r1']",
+            "//*[@id='missing']",
+        ]:
+            expected = state._root._base.xpath(xpath, namespaces=NAMESPACES)
+            result = [element._base for element in state.xpath(xpath)]
+            self.assertListEqual(result, expected)
+        self.assertEqual(state.get_xpath_cache_info()["misses"], 0)
+
+    def test_index_update(self):
+        """The index should follow changes to the `id` attribute."""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        state.update(update(xpath="//*[@id='c1']", attrs={"id": "c3"}))
+        self.assertFalse(state.xpath("//*[@id='c1']"))
+        self.assertEqual(state.xpath("//*[@id='c3']")[0].get("cx"), 50)
+        state.delete(delete(xpath="//*[@id='c3']/@id"))
+        self.assertFalse(state.xpath("//*[@id='c3']"))
+
+    def test_index_insert_delete_replace(self):
+        """The index should follow elements being inserted, deleted and replaced."""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        element = """<svg:g xmlns:svg="http://www.w3.org/2000/svg" id="g2"><svg:rect id="r2"/></svg:g>"""
+        state.insert(insert(xpath="//*[@id='g1']", element=element))
+        self.assertEqual(len(state.xpath("//svg:rect[@id='r2']")), 1)
+        state.delete(delete(xpath="//*[@id='g2']"))
+        self.assertFalse(state.xpath("//*[@id='r2']"))
+        element = """<svg:g xmlns:svg="http://www.w3.org/2000/svg" id="g3"/>"""
+        state.replace(replace(xpath="//*[@id='g1']", element=element))
+        self.assertFalse(state.xpath("//*[@id='g1']"))
+        self.assertFalse(state.xpath("//*[@id='r1']"))
+        self.assertEqual(len(state.xpath("//*[@id='g3']")), 1)
+
+    def test_detached(self):
+        """Elements that are detached from the tree without a query should not be found."""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        for xpath in ["//*[@id='r1']", "//*[@id='g1']"]:
+            element = state._root._base.xpath(xpath, namespaces=NAMESPACES)[0]
+            element.getparent().remove(element)
+            self.assertFalse(state.xpath(xpath))
+            self.assertFalse(state.xpath(xpath))  # the stale entry was removed
+
+
+class TestSecondaryIndex(unittest.TestCase):
+    """Test cases for the secondary indexes (`indexes`)."""
+
+    XPATHS = [
+        "//svg:circle",
+        "//svg:rect",
+        "//svg:missing",
+        "//*[@fill]",
+        "//*[@fill='red']",
+        "//svg:circle[@fill = 'green']",
+        "//svg:rect[@fill]",
+        "//*[@fill='missing']",
+        "//svg:circle[@r='30']",
+    ]
+
+    def assertLookups(self, state: _XMLState):
+        """Assert that lookups give the same results as evaluating the xpaths."""
+        for xpath in TestSecondaryIndex.XPATHS:
+            expected = state._root._base.xpath(xpath, namespaces=NAMESPACES)
+            result = state.xpath(xpath).get_bases()
+            self.assertListEqual(result, expected, xpath)
+
+    def test_lookup(self):
+        """Lookups should match the result of evaluating the xpath."""
+        state = _XMLState(XML, namespaces=NAMESPACES, indexes=["tag", "@fill"])
+        self.assertLookups(state)
+        self.assertEqual(state.get_xpath_cache_info()["misses"], 0)
+        # the xpath is evaluated if the indexes cannot answer the query
+        state = _XMLState(XML, namespaces=NAMESPACES, indexes=["@fill"])
+        self.assertLookups(state)
+        self.assertEqual(state.get_xpath_cache_info()["misses"], 4)
+
+    def test_index_update(self):
+        """The indexes should follow changes to indexed attributes."""
+        state = _XMLState(XML, namespaces=NAMESPACES, indexes=["tag", "@fill"])
+        state.update(update(xpath="//*[@id='c2']", attrs={"fill": "red"}))
+        state.update(update(xpath="//*[@id='r1']", attrs={"fill": "red"}))
+        self.assertLookups(state)
+        self.assertEqual(len(state.xpath("//*[@fill='red']")), 3)
+        state.delete(delete(xpath="//*[@id='c1']/@fill"))
+        self.assertLookups(state)
+        self.assertEqual(len(state.xpath("//*[@fill='red']")), 2)
+
+    def test_index_execute_many(self):
+        """The indexes should follow updates to indexed attributes that are executed in a batch with an executor."""
+        state = _XMLState(XML, namespaces=NAMESPACES, indexes=["tag", "@fill"])
+        colours = ["red", "green", "blue"]
+        queries = [
+            update(xpath=f"//*[@id='{_id}']", attrs={"fill": colours[i % 3]})
+            for i in range(30)
+            for _id in ("c1", "c2", "r1")
+        ]
+        queries.append(select(xpath="//*[@fill='blue']", attrs=["id"]))
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = state.execute_many(queries, executor=executor)
+        self.assertLookups(state)
+        self.assertListEqual(results[-1], [{"id": i} for i in ("c1", "c2", "r1")])
+
+    def test_index_insert_delete_replace(self):
+        """The indexes should follow elements being inserted, deleted and replaced, in document order."""
+        state = _XMLState(XML, namespaces=NAMESPACES, indexes=["tag", "@fill"])
+        element = """<svg:g xmlns:svg="http://www.w3.org/2000/svg" fill="red"><svg:rect fill="red"/></svg:g>"""
+        state.insert(insert(xpath="//*[@id='g1']", element=element))
+        state.insert(insert(xpath="/svg:svg", element=element, index=0))
+        element = """<svg:circle xmlns:svg="http://www.w3.org/2000/svg" fill="red"/>"""
+        state.insert(insert(xpath="/svg:svg", element=element))
+        self.assertLookups(state)
+        self.assertEqual(len(state.xpath("//svg:rect[@fill='red']")), 2)
+        state.delete(delete(xpath="//*[@id='g1']"))
+        self.assertLookups(state)
+        element = """<svg:rect xmlns:svg="http://www.w3.org/2000/svg" fill="blue"/>"""
+        state.replace(replace(xpath="//*[@id='c1']", element=element))
+        self.assertLookups(state)
+        self.assertEqual(len(state.xpath("//*[@fill='blue']")), 1)
+        # many elements inserted out of order
+        element = """<svg:circle xmlns:svg="http://www.w3.org/2000/svg" fill="red"/>"""
+        for i in range(MAX_SORTED_INSERTS + 1):
+            state.insert(insert(xpath="/svg:svg", element=element, index=i % 3))
+        self.assertLookups(state)
+
+    def test_document_order(self):
+        """Elements inserted at any position (and depth) should be kept in document order."""
+        state = _XMLState(XML, namespaces=NAMESPACES, indexes=["tag", "@fill"])
+        group = """<svg:g xmlns:svg="http://www.w3.org/2000/svg" fill="red"><svg:rect fill="red"/><svg:rect fill="red"/></svg:g>"""
+        state.insert(insert(xpath="/svg:svg", element=group, index=100))
+        rect = """<svg:rect xmlns:svg="http://www.w3.org/2000/svg" fill="red"/>"""
+        for i in range(20):
+            xpath = ["/svg:svg", "/svg:svg/svg:g[last()]", "//*[@id='g1']"][i % 3]
+            state.insert(insert(xpath=xpath, element=rect, index=i * 7 % 5))
+            if i % 4 == 0:
+                self.assertLookups(state)
+        self.assertLookups(state)
+        expected = list(state._root._base.iter())
+        self.assertTrue(all(_precedes(a, b) for a, b in zip(expected, expected[1:])))
+        self.assertFalse(any(_precedes(b, a) for a, b in zip(expected, expected[1:])))
+        self.assertTrue(_precedes(expected[0], expected[-1]))
+        self.assertFalse(_precedes(expected[-1], expected[-1]))
+
+    def test_rollback(self):
+        """Rolling back a transaction should restore the indexes."""
+        state = _XMLState(XML, namespaces=NAMESPACES, indexes=["tag", "@fill"])
+        with self.assertRaises(ValueError):
+            with state.transaction():
+                state.update(update(xpath="//*[@id='c1']", attrs={"fill": "blue"}))
+                state.delete(delete(xpath="//*[@id='c2']"))
+                state.insert(
+                    insert(xpath="//*[@id='g1']", element="<rect fill='red'/>")
+                )
+                raise ValueError()
+        self.assertLookups(state)
+        self.assertEqual(len(state.xpath("//*[@fill='red']")), 1)
+        self.assertEqual(len(state.xpath("//svg:circle")), 2)
+
+    def test_invalid(self):
+        """Invalid index specifications should be rejected."""
+        for indexes in [["tags"], ["class"], ["@"]]:
+            with self.assertRaises(ValueError):
+                _XMLState(XML, namespaces=NAMESPACES, indexes=indexes)
+
+
+class TestExecuteMany(unittest.TestCase):
+    """Test cases for `execute_many`."""
+
+    def test_execute_many(self):
+        """Results should be the same as executing each query in turn."""
+        queries = [
+            select(xpath="//svg:circle", attrs=["cx"]),
+            update(xpath="//svg:circle", attrs={"cx": 0}),
+            select(xpath="//svg:circle", attrs=["cx"]),
+            select(xpath="//svg:rect", attrs=["x"]),
+        ]
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        results = state.execute_many(queries)
+        expected_state = _XMLState(XML, namespaces=NAMESPACES)
+        expected = [query.__execute__(expected_state) for query in queries]
+        self.assertListEqual(results, expected)
+        self.assertListEqual(results[2], [{"cx": 0}, {"cx": 0}])
+
+    def test_shared_xpath(self):
+        """Selects that share an xpath should only evaluate it once."""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        queries = [select(xpath="//svg:circle", attrs=[attr]) for attr in "xyr"]
+        state.execute_many(queries)
+        info = state.get_xpath_cache_info()
+        self.assertEqual(info["misses"] + info["hits"], 1)
+
+    def test_concurrent_reads(self):
+        """Results should be the same when reads are executed concurrently."""
+        queries = [
+            select(xpath="//svg:circle", attrs=["cx"]),
+            select(xpath="//svg:rect", attrs=["x"]),
+            update(xpath="//svg:circle", attrs={"cx": 0}),
+            select(xpath="//svg:circle", attrs=["cx"]),
+            select(xpath="//*[@id='c1']", attrs=["cx"]),
+            select(xpath="//svg:missing"),
+        ]
+        expected = _XMLState(XML, namespaces=NAMESPACES).execute_many(queries)
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = state.execute_many(queries, executor=executor)
+        self.assertListEqual(results[:-1], expected[:-1])
+        self.assertIsInstance(results[-1], XPathElementsNotFound)
+
+    def test_concurrent_updates(self):
+        """Updates should have the same effect, and record the same changes in order, when a batch is executed with an executor."""
+        queries = [
+            update(xpath="//svg:circle", attrs={"cx": 0}),
+            update(xpath="//*[@id='c1']", attrs={"cx": Expr("{cx} + 1")}),
+            update(xpath="//svg:rect", attrs={"x": Expr("{x} * 10")}),
+            update(xpath="//svg:circle", attrs={"cx": Expr("{cx} + 1"), "r": 1}),
+            # depends on `r` written above, must see the result of the update
+            update(xpath="//svg:circle[@r='1']", attrs={"cy": 0}),
+            update(xpath="//svg:missing", attrs={"x": 0}),
+            select(xpath="//*[@cx]", attrs=["cx", "cy", "r"]),
+            insert(xpath="//*[@id='g1']", element="<rect id='r2' x='1'/>"),
+            update(xpath="//*[@x]", attrs={"x": Expr("{x} + 1")}),
+            select(xpath="//*[@x]", attrs=["x"]),
+        ]
+        expected_state = _XMLState(XML, namespaces=NAMESPACES, change_log_size=100)
+        expected = expected_state.execute_many(queries)
+        state = _XMLState(XML, namespaces=NAMESPACES, change_log_size=100)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = state.execute_many(queries, executor=executor)
+        self.assertIsInstance(results[5], XPathElementsNotFound)
+        del results[5], expected[5]
+        self.assertListEqual(results, expected)
+        self.assertEqual(str(state), str(expected_state))
+        self.assertListEqual(state.get_changes(0), expected_state.get_changes(0))
+        self.assertListEqual(results[-1], [{"x": 2}, {"x": 11}])
+
+    def test_errors(self):
+        """Errors should be reported per query without stopping the batch."""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        results = state.execute_many(
+            [
+                select(xpath="//svg:missing"),
+                update(xpath="//svg:circle", attrs={"@tag": "rect"}),
+                select(xpath="//svg:rect", attrs=["x"]),
+            ]
+        )
+        self.assertIsInstance(results[0], XPathElementsNotFound)
+        self.assertIsInstance(results[1], XMLQueryError)
+        self.assertListEqual(results[2], [{"x": 1}])
+
+
+class TestChangeLog(unittest.TestCase):
+    """Test cases for the change log and `SelectChanges`."""
+
+    def test_apply_changes(self):
+        """Applying the changes to a copy of the state should bring it up to date."""
+        state = _XMLState(XML, namespaces=NAMESPACES, change_log_size=100)
+        copy = _XMLState(XML, namespaces=NAMESPACES)
+        state.update(update(xpath="//svg:circle", attrs={"cx": 0, "@text": "hi"}))
+        state.update(update(xpath="//*[@id='c1']", attrs={"id": "c3"}))
+        state.insert(insert(xpath="//*[@id='g1']", element="<rect id='r2' x='1'/>"))
+        state.insert(insert(xpath="//*[@id='r2']", element="text"))
+        state.delete(delete(xpath="//*[@id='c2']/@fill"))
+        state.delete(delete(xpath="//*[@id='r1']"))
+        element = """<svg:g xmlns:svg="http://www.w3.org/2000/svg" id="g2"/>"""
+        state.replace(replace(xpath="//*[@id='g1']", element=element))
+        changes = state.get_changes(0)
+        self.assertEqual(state.get_version(), len(changes))
+        self.assertListEqual([c.version for c in changes], list(range(1, 9)))
+        copy.apply_changes(changes)
+        self.assertEqual(str(copy), str(state))
+        self.assertEqual(len(copy.xpath("//*[@id='c3']")), 1)
+        self.assertListEqual(state.get_changes(state.get_version()), [])
+
+    def test_apply_nested_delete(self):
+        """Deleting nested elements should only record the outermost elements, so that the changes can be applied."""
+        state = _XMLState(NESTED_XML, namespaces=NAMESPACES, change_log_size=100)
+        copy = _XMLState(NESTED_XML, namespaces=NAMESPACES)
+        state.delete(delete(xpath="//svg:g | //svg:rect/@x"))
+        changes = state.get_changes(0)
+        self.assertListEqual(
+            [c.path for c in changes], ["//*[@id='g1']", "/svg:svg/svg:g"]
+        )
+        copy.apply_changes(changes)
+        self.assertEqual(str(copy), str(state))
+        self.assertEqual(len(state.xpath("//svg:g")), 0)
+
+    def test_select_changes(self):
+        """`SelectChanges` should return the document and then only the changes."""
+        state = _XMLState(XML, namespaces=NAMESPACES, change_log_size=2)
+        result = select_changes().__execute__(state)
+        self.assertEqual(result["version"], 0)
+        self.assertEqual(result["xml"], state.get_root().as_string())
+        for i in range(3):
+            state.update(update(xpath="//*[@id='r1']", attrs={"x": i}))
+        result = select_changes(since=1).__execute__(state)
+        self.assertEqual(result["version"], 3)
+        self.assertListEqual(
+            [change.data for change in result["changes"]], [{"x": "1"}, {"x": "2"}]
+        )
+        self.assertEqual(result["changes"][0].path, "//*[@id='r1']")
+        with self.assertRaises(XMLQueryError):
+            select_changes(since=0).__execute__(state)  # no longer available
+        with self.assertRaises(XMLQueryError):
+            select_changes(since=4).__execute__(state)
+        with self.assertRaises(XMLQueryError):
+            _XMLState(XML).select_changes(select_changes(since=0))
+
+
+class TestPersist(unittest.TestCase):
+    """Test cases for saving and loading a state (`save`, `load`)."""
+
+    def setUp(self):  # noqa: D102
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, "state.xml")
+
+    def tearDown(self):  # noqa: D102
+        self._dir.cleanup()
+
+    def write(self, state: _XMLState):
+        """Make some changes of each kind to the state."""
+        state.update(update(xpath="//svg:circle", attrs={"cx": Expr("{cx} + 1")}))
+        state.insert(insert(xpath="//*[@id='g1']", element="<rect id='r2' x='1'/>"))
+        state.delete(delete(xpath="//*[@id='c2']/@fill"))
+        state.delete(delete(xpath="//*[@id='r1']"))
+        element = """<svg:g xmlns:svg="http://www.w3.org/2000/svg" id="g2"/>"""
+        state.replace(replace(xpath="//*[@id='g1']", element=element))
+
+    def test_load(self):
+        """Loading should restore the snapshot and replay the logged changes."""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        state.update(update(xpath="//*[@id='c1']", attrs={"r": 1}))
+        state.save(self.path)
+        self.write(state)
+        state.close()
+        loaded = _XMLState.load(self.path, namespaces=NAMESPACES)
+        self.assertEqual(str(loaded), str(state))
+        self.assertEqual(loaded.get_version(), state.get_version())
+        # changes made after loading are appended to the same log
+        loaded.update(update(xpath="//*[@id='c1']", attrs={"r": 2}))
+        loaded.close()
+        reloaded = _XMLState.load(self.path, namespaces=NAMESPACES)
+        self.assertEqual(str(reloaded), str(loaded))
+        self.assertEqual(reloaded.get_version(), 7)
+        reloaded.close()
+
+    def test_save_again(self):
+        """Saving again should start a new log."""
+        state = _XMLState(XML, namespaces=NAMESPACES, change_log_size=10)
+        state.save(self.path)
+        self.write(state)
+        state.save(self.path)
+        self.assertEqual(os.path.getsize(self.path + ".log"), 0)
+        state.update(update(xpath="//*[@id='c1']", attrs={"r": 1}))
+        state.close()
+        loaded = _XMLState.load(self.path, namespaces=NAMESPACES, change_log_size=10)
+        self.assertEqual(str(loaded), str(state))
+        self.assertEqual(loaded.get_version(), 7)
+        self.assertListEqual(loaded.get_changes(7), [])
+        with self.assertRaises(XMLQueryError):
+            loaded.get_changes(6)  # changes before loading are not available
+        loaded.close()
+
+    def test_load_nested_delete(self):
+        """A log that contains a delete of nested elements should be loaded."""
+        state = _XMLState(NESTED_XML, namespaces=NAMESPACES)
+        state.save(self.path)
+        state.delete(delete(xpath="//svg:g"))
+        state.close()
+        loaded = _XMLState.load(self.path, namespaces=NAMESPACES)
+        self.assertEqual(str(loaded), str(state))
+        self.assertEqual(loaded.get_version(), state.get_version())
+        loaded.close()
+
+    def test_incomplete_log(self):
+        """An incomplete change at the end of the log should be ignored."""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        state.save(self.path)
+        state.update(update(xpath="//*[@id='c1']", attrs={"r": 1}))
+        state.close()
+        with open(self.path + ".log", "ab") as file:
+            file.write(b'[2, "update", "//*[@id=')
+        loaded = _XMLState.load(self.path, namespaces=NAMESPACES)
+        self.assertEqual(loaded.get_version(), 1)
+        loaded.update(update(xpath="//*[@id='c1']", attrs={"r": 2}))
+        loaded.close()
+        loaded = _XMLState.load(self.path, namespaces=NAMESPACES)
+        self.assertListEqual(loaded.select(select("//*[@id='c1']", ["r"])), [{"r": 2}])
+        loaded.close()
+
+    def test_invalid(self):
+        """Invalid files should raise a ValueError."""
+        with open(self.path, "w") as file:
+            file.write(XML)
+        with self.assertRaises(ValueError):
+            _XMLState.load(self.path)
+
+
+class TestTransaction(unittest.TestCase):
+    """Test cases for atomic modification of a state (`transaction`)."""
+
+    def write(self, state: _XMLState):
+        """Make some changes of each kind to the state."""
+        state.update(update(xpath="//svg:circle", attrs={"cx": Expr("{cx} + 1")}))
+        state.update(update(xpath="//*[@id='c1']", attrs={"id": "c3", "@text": "t"}))
+        state.insert(insert(xpath="//*[@id='g1']", element="<rect id='r2' x='1'/>"))
+        state.insert(insert(xpath="//*[@id='g1']", element="text", index=0))
+        state.delete(delete(xpath="//*[@id='c2']/@fill"))
+        state.delete(delete(xpath="//*[@id='r1']"))
+        element = """<svg:g xmlns:svg="http://www.w3.org/2000/svg" id="g2"/>"""
+        state.replace(replace(xpath="//*[@id='g1']", element=element))
+
+    def test_rollback(self):
+        """An exception should undo all changes made in the transaction."""
+        state = _XMLState(XML, namespaces=NAMESPACES, change_log_size=10)
+        state.update(update(xpath="//*[@id='c1']", attrs={"r": 1}))
+        expected = str(state)
+        with self.assertRaises(XPathElementsNotFound):
+            with state.transaction():
+                self.write(state)
+                state.delete(delete(xpath="//*[@id='missing']"))
+        self.assertEqual(str(state), expected)
+        # the id index and change log are also restored
+        self.assertEqual(len(state.xpath("//*[@id='c1']")), 1)
+        self.assertEqual(len(state.xpath("//*[@id='r1']")), 1)
+        self.assertEqual(len(state.xpath("//*[@id='c3']")), 0)
+        self.assertEqual(len(state.xpath("//*[@id='r2']")), 0)
+        self.assertEqual(len(state.xpath("//*[@id='g2']")), 0)
+        self.assertEqual(state.get_version(), 1)
+        self.assertEqual(len(state.get_changes(0)), 1)
+
+    def test_commit(self):
+        """Without an exception the changes should be kept and recorded."""
+        state = _XMLState(XML, namespaces=NAMESPACES, change_log_size=10)
+        expected = _XMLState(XML, namespaces=NAMESPACES)
+        self.write(expected)
+        with state.transaction():
+            self.write(state)
+            # changes are only recorded once the transaction is committed
+            self.assertEqual(state.get_version(), 0)
+        self.assertEqual(str(state), str(expected))
+        self.assertEqual(state.get_version(), 8)
+        self.assertEqual(len(state.xpath("//*[@id='g2']")), 1)
+
+    def test_nested(self):
+        """Rolling back a nested transaction should only undo its own changes."""
+        state = _XMLState(XML, namespaces=NAMESPACES, change_log_size=10)
+        with state.transaction():
+            state.update(update(xpath="//*[@id='c1']", attrs={"r": 1}))
+            expected = str(state)
+            with self.assertRaises(ValueError):
+                with state.transaction():
+                    self.write(state)
+                    raise ValueError()
+            self.assertEqual(str(state), expected)
+            with state.transaction():
+                state.update(update(xpath="//*[@id='c1']", attrs={"r": 2}))
+        self.assertEqual(state.xpath("//*[@id='c1']/@r"), ["2"])
+        self.assertEqual(state.get_version(), 2)
+        # the outer transaction undoes committed nested transactions
+        expected = str(state)
+        with self.assertRaises(ValueError):
+            with state.transaction():
+                with state.transaction():
+                    self.write(state)
+                raise ValueError()
+        self.assertEqual(str(state), expected)
+        self.assertEqual(state.get_version(), 2)
+
+    def test_snapshot(self):
+        """Rolling back should not modify a snapshot taken during the transaction."""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        with self.assertRaises(ValueError):
+            with state.transaction():
+                state.update(update(xpath="//*[@id='c1']", attrs={"r": 1}))
+                snapshot = state.snapshot()
+                raise ValueError()
+        query = select(xpath="//*[@id='c1']", attrs=["r"])
+        self.assertListEqual(snapshot.select(query), [{"r": 1}])
+        self.assertListEqual(state.select(query), [{"r": 30}])
+
+
+class TestQueryPlanner(unittest.TestCase):
+    """Test cases for the estimation of the cost of xpaths (`query_planner`, `xpath_budget`)."""
+
+    def assertStats(self, state: _XMLState):
+        """Assert that the statistics of the state are the same as if they were built from scratch."""
+        stats = _DocumentStats()
+        stats.build(state._root._base)
+        self.assertEqual(+state._stats._tags, +stats._tags)
+        self.assertEqual(+state._stats._tag_depths, +stats._tag_depths)
+        self.assertListEqual(state._stats._depths, stats._depths)
+        self.assertEqual(state._stats.total, stats.total)
+
+    def test_equivalent(self):
+        """Planned xpaths should have the same results as unplanned xpaths."""
+        state = _XMLState(XML, namespaces=NAMESPACES, query_planner=True)
+        expected = _XMLState(XML, namespaces=NAMESPACES)
+        xpaths = [
+            "//*[@id='g1']//svg:rect",
+            "//*[@id='g1']/svg:rect/@x",
+            "//*[@id='g1']/..",
+            "//*[@id='c1']/following-sibling::*",
+            "//*[@id='g1']/svg:rect | //svg:circle",
+            "//svg:svg//svg:rect",
+            "//*//*",
+            "//svg:g[@id]//svg:rect[@x > 0]/@x",
+            "//svg:g//svg:rect[1]",
+            "count(//svg:circle)",
+        ]
+        for xpath in xpaths:
+            query = select(xpath=xpath)
+            self.assertEqual(state.select(query), expected.select(query), xpath)
+        self.assertFalse(state.xpath("//*[@id='missing']/svg:rect"))
+
+    def test_rewrite(self):
+        """Nested descendant searches should be rewritten only if this is equivalent."""
+        state = _XMLState(XML, namespaces=NAMESPACES, query_planner=True)
+        planner = state._planner
+        self.assertEqual(planner._rewrite("//*//*"), "//*[ancestor::*]")
+        self.assertEqual(
+            planner._rewrite("//svg:g[@id='g1']//svg:rect[@x > 0]/@x"),
+            "//svg:rect[ancestor::svg:g[@id='g1']][@x > 0]/@x",
+        )
+        # positional predicates, relative paths and other axes
+        self.assertIsNone(planner._rewrite("//svg:g//svg:rect[1]"))
+        self.assertIsNone(planner._rewrite("//svg:g[last()]//svg:rect"))
+        self.assertIsNone(planner._rewrite("svg:g//svg:rect"))
+        self.assertIsNone(planner._rewrite("/svg:svg//svg:rect"))
+        self.assertIsNone(planner._rewrite("//svg:g//text()"))
+
+    def test_estimate(self):
+        """Estimates should reflect the cost of the xpath."""
+        state = _XMLState(XML, namespaces=NAMESPACES, query_planner=True)
+        cheap = state.estimate_xpath_cost("/svg:svg/svg:g")
+        search = state.estimate_xpath_cost("//svg:rect")
+        self.assertLess(cheap, search)
+        self.assertLess(search, state.estimate_xpath_cost("//*[contains(@id, 'c')]"))
+        self.assertLess(search, state.estimate_xpath_cost("//svg:rect | //svg:g"))
+        with self.assertRaises(ValueError):
+            _XMLState(XML, namespaces=NAMESPACES).estimate_xpath_cost("//*")
+
+    def test_budget(self):
+        """Xpaths whose estimated cost exceeds the budget should not be evaluated."""
+        state = _XMLState(XML, namespaces=NAMESPACES, xpath_budget=5)
+        with self.assertRaises(XPathCostExceeded) as context:
+            state.select(select(xpath="//*[contains(@id, 'c')]"))
+        self.assertIsInstance(context.exception, XMLQueryError)
+        with self.assertRaises(XPathCostExceeded):
+            state.update(update(xpath="//svg:circle[@cx > 0]", attrs={"r": 1}))
+        # cheap and anchored xpaths are evaluated
+        self.assertEqual(len(state.xpath("/svg:svg/svg:circle")), 2)
+        self.assertEqual(len(state.xpath("//*[@id='g1']/svg:rect")), 1)
+        self.assertEqual(len(state.xpath("//*[@id='c1']")), 1)
+
+    def test_stats(self):
+        """The statistics should be kept up to date by write queries."""
+        state = _XMLState(XML, namespaces=NAMESPACES, query_planner=True)
+        self.assertStats(state)
+        element = (
+            "<svg:g xmlns:svg='http://www.w3.org/2000/svg' id='g2'><svg:rect/></svg:g>"
+        )
+        state.insert(insert(xpath="//*[@id='g1']", element=element))
+        self.assertStats(state)
+        state.replace(replace(xpath="//*[@id='c1']", element=element))
+        self.assertStats(state)
+        state.delete(delete(xpath="//*[@id='g1']"))
+        self.assertStats(state)
+        expected = str(state)
+        with self.assertRaises(ValueError):
+            with state.transaction():
+                state.insert(insert(xpath="//*[@id='c2']", element=element))
+                state.delete(delete(xpath="//*[@id='g2']"))
+                raise ValueError()
+        self.assertEqual(str(state), expected)
+        self.assertStats(state)
+
+    def test_stats_nested_delete(self):
+        """The statistics should remain correct after nested elements are deleted, and should never become negative."""
+        state = _XMLState(NESTED_XML, namespaces=NAMESPACES, query_planner=True)
+        state.delete(delete(xpath="//svg:g"))
+        self.assertStats(state)
+        self.assertGreater(state.estimate_xpath_cost("//svg:rect"), 0)
+        stats = _DocumentStats()
+        stats.build(state._root._base)
+        stats.remove_subtree(state._root._base, 0)
+        stats.remove_subtree(state._root._base, 0)
+        self.assertEqual(stats.total, 0)
+        self.assertTrue(all(n >= 0 for n in stats._tags.values()))
+        self.assertTrue(all(n >= 0 for n in stats._tag_depths.values()))
+
+
+class TestSnapshot(unittest.TestCase):
+    """Test cases for `XMLSnapshot`."""
+
+    def test_snapshot(self):
+        """Snapshots should not observe modifications made after they were taken."""
+        state = _XMLState(XML, namespaces=NAMESPACES, change_log_size=10)
+        query = select(xpath="//svg:circle", attrs=["cx"])
+        snapshot1 = state.snapshot()
+        snapshot2 = state.snapshot()
+        self.assertIs(snapshot1._snapshot_root, snapshot2._snapshot_root)
+        state.update(update(xpath="//svg:circle", attrs={"cx": 0}))
+        self.assertFalse(snapshot1._snapshot_root.copied)
+        snapshot3 = state.snapshot()
+        state.delete(delete(xpath="//*[@id='c1']"))
+        self.assertListEqual(snapshot1.select(query), [{"cx": 50}, {"cx": 150}])
+        self.assertTrue(snapshot1._snapshot_root.copied)
+        self.assertListEqual(snapshot2.select(query), [{"cx": 50}, {"cx": 150}])
+        self.assertListEqual(snapshot3.select(query), [{"cx": 0}, {"cx": 0}])
+        self.assertListEqual(state.select(query), [{"cx": 0}])
+        self.assertEqual(snapshot1.version, 0)
+        self.assertEqual(snapshot3.version, 2)
+        self.assertIsInstance(snapshot3, XMLSnapshot)
+
+    def test_versions(self):
+        """Snapshots taken at different versions should each see the tree at their version."""
+        state = _XMLState(NESTED_XML, namespaces=NAMESPACES, change_log_size=100)
+        queries = [
+            update(xpath="//*[@id='r1']", attrs={"x": 2, "@text": "a", "@head": "b"}),
+            insert(xpath="//*[@id='g1']", element="<rect id='r2'/>", index=0),
+            update(xpath="//*[@id='r2']", attrs={"y": 1}),
+            delete(xpath="//svg:g"),
+            insert(xpath="/*", element="<g id='g2'><rect id='r3'/></g>"),
+            replace(xpath="//*[@id='g2']", element="<g id='g3'/>"),
+            delete(xpath="//*[@id='c1']/@id"),
+        ]
+        snapshots, expected = [state.snapshot()], [state.get_root().as_string()]
+        for i, query in enumerate(queries):
+            query.__execute__(state)
+            if i % 2:
+                snapshots.append(state.snapshot())
+                expected.append(state.get_root().as_string())
+        with self.assertRaises(ValueError), state.transaction():
+            state.update(update(xpath="//*[@id='g3']", attrs={"x": 1}))
+            raise ValueError()
+        snapshots.append(state.snapshot())
+        expected.append(state.get_root().as_string())
+        other = _XMLState(state.get_root().as_string(), NAMESPACES, change_log_size=10)
+        other.update(update(xpath="//*[@id='g3']", attrs={"x": 1, "@head": "x"}))
+        state.apply_changes(other.get_changes(0))
+        self.assertEqual(state.get_root().as_string(), other.get_root().as_string())
+        for snapshot, xml in zip(snapshots, expected):
+            self.assertEqual(snapshot.as_string(), xml)
+
+    def test_records(self):
+        """Only the modified elements should be recorded for a snapshot, the tree should not be copied unless the snapshot is read."""
+        state = _XMLState(NESTED_XML, namespaces=NAMESPACES)
+        snapshot = state.snapshot()
+        for _ in range(3):
+            state.update(update(xpath="//*[@id='r1']", attrs={"x": 2}))
+        state.delete(delete(xpath="//*[@id='c1']"))
+        self.assertEqual(len(state._snapshot_log._records), 2)
+        self.assertFalse(snapshot._snapshot_root.copied)
+        self.assertEqual(
+            snapshot.select(select(xpath="//*[@x]", attrs=["x"])), [{"x": 1}]
+        )
+        # the records are no longer needed once the tree is reconstructed
+        state.update(update(xpath="//*[@id='r1']", attrs={"x": 3}))
+        self.assertIsNone(state._snapshot_log)
+
+    def test_concurrent_reads(self):
+        """Snapshots should give consistent results when they are read while the state is modified by another thread."""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        query = select(xpath="//svg:circle", attrs=["cx"])
+        snapshots = [state.snapshot()]
+
+        def write():
+            for i in range(200):
+                state.update(update(xpath="//svg:circle", attrs={"cx": i}))
+                if i % 50 == 0:
+                    snapshots.append(state.snapshot())
+
+        def read():
+            return [snapshots[0].select(query) for _ in range(200)]
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            reads = executor.submit(read)
+            executor.submit(write).result()
+            results = reads.result()
+        self.assertTrue(all(r == [{"cx": 50}, {"cx": 150}] for r in results))
+        self.assertListEqual(snapshots[2].select(query), [{"cx": 50}, {"cx": 50}])
+
+    def test_read_only(self):
+        """Write queries should fail on a snapshot."""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        snapshot = state.snapshot()
+        results = snapshot.execute_many(
+            [
+                update(xpath="//svg:circle", attrs={"cx": 0}),
+                delete(xpath="//svg:circle"),
+                select(xpath="//svg:circle", attrs=["cx"]),
+            ]
+        )
+        self.assertIsInstance(results[0], XMLQueryError)
+        self.assertIsInstance(results[1], XMLQueryError)
+        self.assertListEqual(results[2], [{"cx": 50}, {"cx": 150}])
+        self.assertEqual(snapshot.as_string(), state.get_root().as_string())
+
+    def test_unused_snapshot(self):
+        """Modifications should not be recorded if the snapshots are no longer in use."""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        snapshot = state.snapshot()
+        self.assertIs(state._snapshot_log.root(), snapshot._snapshot_root)
+        del snapshot
+        state.update(update(xpath="//svg:circle", attrs={"cx": 0}))
+        self.assertIsNone(state._snapshot_log)
+
+    def test_release(self):
+        """Modifications should not be recorded once the snapshots have been released, released snapshots cannot be read."""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        query = select(xpath="//svg:circle", attrs=["cx"])
+        with state.snapshot() as snapshot1:
+            snapshot2 = state.snapshot()
+            self.assertListEqual(snapshot1.select(query), [{"cx": 50}, {"cx": 150}])
+        self.assertTrue(snapshot1.released)
+        state.update(update(xpath="//svg:circle", attrs={"cx": 0}))
+        self.assertTrue(state._snapshot_log.recording)
+        snapshot2.release()
+        snapshot2.release()
+        state.update(update(xpath="//svg:circle", attrs={"cx": 1}))
+        self.assertIsNone(state._snapshot_log)
+        with self.assertRaises(XMLQueryError):
+            snapshot1.select(query)
+        self.assertIsInstance(snapshot2.execute_many([query])[0], XMLQueryError)
+
+
+class TestExpr(unittest.TestCase):
+    """Test cases for the evaluation of `Expr` in updates."""
+
+    @staticmethod
+    def new_state(values: list[str]):
+        """Create a state containing a circle for each value of `cx`."""
+        circles = "".join(f'<svg:circle cx="{v}" cy="0"/>' for v in values)
+        xml = f'<svg:svg xmlns:svg="http://www.w3.org/2000/svg">{circles}</svg:svg>'
+        return _XMLState(xml, namespaces=NAMESPACES)
+
+    def test_compiled(self):
+        """The compiled expression should give the same result as the original expression."""
+        element = _XMLState(XML, namespaces=NAMESPACES).xpath("//*[@id='c1']")[0]
+        self.assertEqual(Expr("{cx} + {r} * 2").eval(element), 110)
+        self.assertEqual(Expr("[{cx}, '{fill}']").eval(element), [50, "red"])
+        with self.assertRaises(KeyError):
+            Expr("{missing} + 1").eval(element)
+
+    @unittest.skipIf(np is None, "requires numpy")
+    def test_vectorized(self):
+        """Updates of many elements should give the same result when vectorized."""
+        values = [str(i) for i in range(100)]
+        state = self.new_state(values)
+        expr = Expr("{cx} // 3 + {cy} * 2.5")
+        self.assertTrue(_compile_expr(expr.expr).is_vectorized)
+        state.update(update(xpath="//svg:circle", attrs={"cx": expr, "cy": 1}))
+        result = state.select(select(xpath="//svg:circle", attrs=["cx", "cy"]))
+        expected = [{"cx": i // 3 + 0.0, "cy": 1} for i in range(100)]
+        self.assertListEqual(result, expected)
+
+    @unittest.skipIf(np is None, "requires numpy")
+    def test_vectorized_order(self):
+        """Expressions should see the attributes set before them in the same update."""
+        state = self.new_state([str(i) for i in range(100)])
+        attrs = {"cx": Expr("{cx} + 1"), "cy": Expr("{cx} * 2")}
+        state.update(update(xpath="//svg:circle", attrs=attrs))
+        result = state.select(select(xpath="//svg:circle", attrs=["cx", "cy"]))
+        expected = [{"cx": i + 1, "cy": (i + 1) * 2} for i in range(100)]
+        self.assertListEqual(result, expected)
+
+    def test_not_vectorized(self):
+        """Updates that cannot be vectorized should be evaluated per element."""
+        values = [str(i) for i in range(50)] + ["0.5", str(2**40)]
+        state = self.new_state(values)
+        state.update(update(xpath="//svg:circle", attrs={"cx": Expr("{cx} * 2")}))
+        result = state.xpath("//svg:circle/@cx")
+        self.assertSequenceEqual(
+            result, [str(int(v) * 2) for v in values[:-2]] + ["1.0", str(2**41)]
+        )
+        state = self.new_state(["1"] * 50 + ["abc"])
+        with self.assertRaises(ValueError):
+            state.update(update(xpath="//svg:circle", attrs={"cx": Expr("{cx} + 1")}))
+        self.assertSequenceEqual(state.xpath("//svg:circle/@cx")[:50], ["2"] * 50)
+
+
+class TestLiteralCache(unittest.TestCase):
+    """Test cases for the cache of decoded attribute values."""
+
+    def test_decode(self):
+        """Decoded values should match `ast.literal_eval`, containers should not be shared."""
+        xml = """<svg:svg xmlns:svg="http://www.w3.org/2000/svg"><svg:g a="1" b="2.5" c="True" d="red" e="[1, 2]" f="007" g="None"/></svg:svg>"""
+        state = _XMLState(xml, namespaces=NAMESPACES)
+        query = select(xpath="//svg:g", attrs=list("abcdefg"))
+        info = _XMLState.get_literal_cache_info()
+        result = state.select(query)
+        expected = dict(a=1, b=2.5, c=True, d="red", e=[1, 2], f="007", g=None)
+        self.assertDictEqual(result[0], expected)
+        result[0]["e"].append(3)
+        self.assertDictEqual(state.select(query)[0], expected)
+        new_info = _XMLState.get_literal_cache_info()
+        # plain numbers and bools are not cached
+        self.assertGreaterEqual(new_info["hits"] - info["hits"], 4)
+        self.assertLessEqual(new_info["misses"] - info["misses"], 4)
+
+
+class TestElementList(unittest.TestCase):
+    """Test cases for the sequence of elements returned by `xpath`."""
+
+    def test_lazy(self):
+        """Elements should be wrapped on access and behave like a list of elements."""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        elements = state.xpath("//svg:circle")
+        self.assertEqual(len(elements), 2)
+        self.assertEqual(elements[0], elements[0])
+        self.assertNotEqual(elements[0], elements[1])
+        self.assertIn(elements[1], elements)
+        self.assertEqual(elements[-1].get("id"), "c2")
+        self.assertEqual(elements[1:], state.xpath("//*[@id='c2']"))
+        self.assertListEqual([e.get("id") for e in elements], ["c1", "c2"])
+        self.assertListEqual([e.get("id") for e in reversed(elements)], ["c2", "c1"])
+        self.assertEqual(state.xpath("//svg:circle/@r"), ["30", "30"])
+        self.assertFalse(state.xpath("//svg:missing"))
+
+
+class TestSelectStream(unittest.TestCase):
+    """Test cases for `SelectStream` (see `iter_select`)."""
+
+    def test_stream(self):
+        """Streamed results should be the same as the results of `select`."""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        for xpath, attrs in [
+            ("//*", None),
+            ("//*[@cx]", ["id", "cx"]),
+            ("//@id", None),
+        ]:
+            expected = state.select(select(xpath=xpath, attrs=attrs))
+            query = select_stream(xpath=xpath, attrs=attrs)
+            self.assertListEqual(list(query.__execute__(state)), expected)
+            query = select_stream(xpath=xpath, attrs=attrs, chunk_size=2)
+            chunks = list(query.__execute__(state))
+            self.assertTrue(all(len(chunk) <= 2 for chunk in chunks))
+            self.assertListEqual(sum(chunks, []), expected)
+
+    def test_errors(self):
+        """Errors should be raised when the query is executed where possible."""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        with self.assertRaises(XPathElementsNotFound):
+            state.iter_select(select(xpath="//svg:missing"))
+        with self.assertRaises(ValueError):
+            state.iter_select(select(xpath="//*"), chunk_size=0)
+        results = state.iter_select(select(xpath="//@id", attrs=["id"]))
+        with self.assertRaises(XMLQueryError):
+            next(results)
+
+    def test_consistent(self):
+        """Results should not observe modifications made while streaming."""
+        circles = "".join(
+            f'<svg:circle cx="{i}"/>' for i in range(STREAM_READ_SIZE * 2)
+        )
+        xml = f'<svg:svg xmlns:svg="http://www.w3.org/2000/svg">{circles}</svg:svg>'
+        state = _XMLState(xml, namespaces=NAMESPACES)
+        results = state.iter_select(select(xpath="//svg:circle", attrs=["cx"]))
+        first = next(results)
+        state.update(update(xpath="//svg:circle", attrs={"cx": -1}))
+        state.delete(delete(xpath="//svg:circle[1]"))
+        results = [first, *results]
+        self.assertListEqual(results, [{"cx": i} for i in range(STREAM_READ_SIZE * 2)])
+        self.assertEqual(len(state.xpath("//svg:circle[@cx='-1']")), len(results) - 1)
+
+    def test_release(self):
+        """The snapshot of a stream should be released once it is consumed, closed or garbage collected, while it is in use only the modified elements should be recorded."""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        query = select(xpath="//svg:circle", attrs=["cx"])
+        results = state.iter_select(query)
+        state.update(update(xpath="//svg:circle", attrs={"cx": 0}))
+        root = state._snapshot_log._roots[0]()
+        self.assertEqual(len(state._snapshot_log._records), 2)
+        self.assertFalse(root.copied)
+        self.assertListEqual(list(results), [{"cx": 50}, {"cx": 150}])
+        state.update(update(xpath="//svg:circle", attrs={"cx": 1}))
+        self.assertIsNone(state._snapshot_log)
+        results = state.iter_select(query)
+        next(results)
+        results.close()
+        state.update(update(xpath="//svg:circle", attrs={"cx": 2}))
+        self.assertIsNone(state._snapshot_log)
+        results = state.iter_select(query)
+        next(results)
+        del results
+        state.update(update(xpath="//svg:circle", attrs={"cx": 2}))
+        self.assertIsNone(state._snapshot_log)
+        with self.assertRaises(XPathElementsNotFound):
+            state.iter_select(select(xpath="//svg:missing"))
+        state.update(update(xpath="//svg:circle", attrs={"cx": 3}))
+        self.assertIsNone(state._snapshot_log)
+
+
+class TestSelectFormat(unittest.TestCase):
+    """Test cases for the format of selected elements."""
+
+    def test_format(self):
+        """Each format should give an equivalent representation of the element."""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        xpath = "//*[@id='g1']"
+        c14n = state.select(select(xpath=xpath))[0]
+        self.assertEqual(c14n, state.select(select(xpath=xpath, format="c14n"))[0])
+        xml = state.select(select(xpath=xpath, format="xml"))[0]
+        self.assertIsInstance(xml, str)
+        self.assertIn('<svg:rect id="r1" x="1"/>', xml)
+        data = state.select(select(xpath=xpath, format="bytes"))[0]
+        self.assertEqual(data, xml.encode("utf-8"))
+        state = _XMLState(XML, namespaces=NAMESPACES, select_format="xml")
+        self.assertEqual(state.select(select(xpath=xpath))[0], xml)
+        self.assertEqual(state.select(select(xpath=xpath, format="c14n"))[0], c14n)
+        self.assertEqual(state.snapshot().select(select(xpath=xpath))[0], xml)
+
+    def test_dict(self):
+        """The dict format should give the structure of the element up to `depth`."""
+        state = _XMLState(XML, namespaces=NAMESPACES)
+        result = state.select(select(xpath="//*[@id='g1']", format="dict"))
+        rect = dict(
+            tag="rect",
+            prefix="svg",
+            attributes={"id": "r1", "x": 1},
+            text=None,
+            tail=None,
+            children=[],
+        )
+        expected = dict(
+            tag="g",
+            prefix="svg",
+            attributes={"id": "g1"},
+            text=None,
+            tail=None,
+            children=[rect],
+        )
+        self.assertListEqual(result, [expected])
+        result = state.select(select(xpath="/*", format="dict", depth=1))[0]
+        self.assertEqual(result["attributes"], {"width": 200, "height": 200})
+        self.assertListEqual(
+            [c["attributes"]["id"] for c in result["children"]], ["c1", "c2", "g1"]
+        )
+        self.assertIsNone(result["children"][-1]["children"])
+
+    def test_unknown_format(self):
+        """Unknown formats should be rejected."""
+        with self.assertRaises(ValueError):
+            _XMLState(XML, namespaces=NAMESPACES, select_format="html")
+        with self.assertRaises(ValueError):
+            select(xpath="//*", format="html")
+
+
+if __name__ == "__main__":
+    unittest.main()